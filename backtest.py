@@ -0,0 +1,157 @@
+import os
+import sys
+import argparse
+from datetime import date as date_cls, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from database import get_connection, transaction
+from settlement import pull_results, resolve_prop_players, load_settled_bets
+from update_ledger import settle_day, INITIAL_BANKROLL
+from setup_database import create_ledger, table_exists
+
+# Replays bankrolls for many (model_table, sizing policy) pairs over a date range in one process. Results
+# are pulled and joined once and shared by every pair; the per-pair replays run in a process pool and
+# each ledger is rewritten in bulk.
+
+# Get the directory of the current script
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Sizing policy name -> update_ledger truncate_bets flag
+SIZING_POLICIES = {'scale': 0, 'truncate': 1}
+
+# Ledger naming used by the daily scripts: modelled_likelihoods_weight4 -> daily_ledger_scaled_weight4
+def ledger_name_for(model_table, policy='scale'):
+    name = model_table.replace('modelled_likelihoods', 'daily_ledger_scaled', 1)
+    return name if policy == 'scale' else f"{name}_{policy}"
+
+def replay_bankroll(dates, bets, policy, bankroll=INITIAL_BANKROLL):
+    rows = []
+    for date in dates:
+        num_bets, wager_sum, final_bankroll = settle_day(date, bets.get(date, []), bankroll, SIZING_POLICIES[policy], verbose=False)
+        rows.append((date, num_bets, wager_sum, bankroll, final_bankroll))
+        bankroll = final_bankroll
+    return rows
+
+def _replay_job(job):
+    ledger_name, dates, bets, policy, bankroll = job
+    return ledger_name, replay_bankroll(dates, bets, policy, bankroll)
+
+# The bankroll a ledger held going into start_date: the last row before it, else INITIAL_BANKROLL. A range
+# that stops short of rows already in the ledger is refused, since those rows would no longer follow on.
+def starting_bankroll(cursor, ledger_name, start_date, end_date):
+    if not table_exists(cursor, ledger_name):
+        return INITIAL_BANKROLL
+    cursor.execute(f"SELECT date FROM {ledger_name} WHERE date > ? ORDER BY date LIMIT 1", (end_date,))
+    later = cursor.fetchone()
+    if later:
+        raise ValueError(f"{ledger_name} has rows from {later[0]}, after the replay range; replay through the end of the ledger")
+    cursor.execute(f"SELECT final_dollar_value FROM {ledger_name} WHERE date < ? ORDER BY date DESC LIMIT 1", (start_date,))
+    row = cursor.fetchone()
+    return row[0] if row else INITIAL_BANKROLL
+
+# Replay every (model_table, policy) pair from start_date through end_date (default yesterday), carrying on
+# from each ledger's bankroll before start_date, and rewrite each ledger for that range. Like update_ledger,
+# a ledger stops at the first date whose results aren't all final. Returns {ledger_name: ledger rows}.
+def run_backtest(pairs, start_date='1900-01-01', end_date=None, workers=None, write=True):
+    end_date = end_date or (date_cls.today() - timedelta(days=1)).isoformat()
+    conn = get_connection()
+    cursor = conn.cursor()
+    bankrolls = {ledger_name_for(table, policy): starting_bankroll(cursor, ledger_name_for(table, policy), start_date, end_date)
+                 for table, policy in pairs}
+
+    tables = list(dict.fromkeys(model_table for model_table, _ in pairs))
+    table_dates = {}
+    for table in tables:
+        cursor.execute(f"SELECT DISTINCT date FROM {table} WHERE date BETWEEN ? AND ? ORDER BY date", (start_date, end_date))
+        table_dates[table] = [row[0] for row in cursor.fetchall()]
+
+    # Shared settlement data: every date's results are pulled once for all tables
+    pull_results(sorted({date for dates in table_dates.values() for date in dates}))
+    cursor.execute('SELECT date FROM results_pulled WHERE date BETWEEN ? AND ?', (start_date, end_date))
+    pulled = {row[0] for row in cursor.fetchall()}
+
+    jobs = []
+    for table in tables:
+        dates = []
+        for date in table_dates[table]:
+            if date not in pulled:
+                print(f"Results for {date} are not final yet, replaying {table} up to the day before.")
+                break
+            dates.append(date)
+        resolve_prop_players(table, dates)
+        bets = load_settled_bets(cursor, table, dates)
+        for model_table, policy in pairs:
+            if model_table == table:
+                ledger_name = ledger_name_for(table, policy)
+                jobs.append((ledger_name, dates, bets, policy, bankrolls[ledger_name]))
+
+    if len(jobs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            ledgers = dict(pool.map(_replay_job, jobs))
+    else:
+        ledgers = dict(map(_replay_job, jobs))
+
+    if write:
+        for ledger_name in ledgers:
+            create_ledger(ledger_name)
+        with transaction(conn):
+            for ledger_name, rows in ledgers.items():
+                cursor.execute(f"DELETE FROM {ledger_name} WHERE date BETWEEN ? AND ?", (start_date, end_date))
+                cursor.executemany(f'''
+                INSERT INTO {ledger_name} (date, number_of_bets_suggested, dollar_value_of_bets_suggested, initial_dollar_value, final_dollar_value)
+                VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+    for ledger_name, rows in ledgers.items():
+        final = rows[-1][4] if rows else bankrolls[ledger_name]
+        print(f"{ledger_name}: {len(rows)} days, final bankroll {final:.2f}")
+    return ledgers
+
+# Daily bankroll of each ledger, as in tested_models_plot.png
+def plot_bankrolls(ledgers, path='tested_models_plot.png'):
+    import matplotlib # type: ignore
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt # type: ignore
+    from datetime import datetime
+
+    fig, ax = plt.subplots(figsize=(12, 7))
+    for ledger_name, rows in ledgers.items():
+        if rows:
+            ax.plot([datetime.strptime(row[0], '%Y-%m-%d') for row in rows], [row[4] for row in rows], label=ledger_name)
+    ax.axhline(INITIAL_BANKROLL, color='grey', linestyle='--', linewidth=0.8)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Bankroll ($)')
+    ax.set_title('Daily bankroll by model')
+    ax.legend(fontsize='small')
+    fig.autofmt_xdate()
+    fig.savefig(os.path.join(script_dir, path), dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    print(f"Saved bankroll plot to {path}")
+
+def all_model_tables():
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'modelled_likelihoods%' ORDER BY name")
+    tables = [row[0] for row in cursor.fetchall()]
+    return tables
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay ledgers for several model tables and plot their bankrolls.')
+    parser.add_argument('--tables', nargs='*', help='model tables to replay (default: every modelled_likelihoods* table)')
+    parser.add_argument('--policies', nargs='*', default=['scale'], choices=sorted(SIZING_POLICIES))
+    parser.add_argument('--start', default='1900-01-01')
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--plot', default='tested_models_plot.png', help='output image ("" to skip)')
+    args = parser.parse_args(argv)
+
+    tables = args.tables or all_model_tables()
+    pairs = [(table, policy) for table in tables for policy in args.policies]
+    try:
+        ledgers = run_backtest(pairs, args.start, args.end, args.workers)
+    except ValueError as e:
+        print(e)
+        return
+    if args.plot:
+        plot_bankrolls(ledgers, args.plot)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
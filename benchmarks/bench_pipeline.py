@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+from datetime import date, timedelta
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from fixtures import FixtureStore, FixtureAdapter, RecordingAdapter, serve, synthetic_slate, NHL_WEB
+
+# Times the daily pipeline's stages against recorded or synthetic HTTP fixtures instead of the live NHL and
+# odds APIs (see fixtures.py). Each scenario runs in a fresh process on an empty temporary database:
+#   odds      ingest today's events and props (ingest_odds)
+#   factors   daily opposition factor update
+#   model     resolve today's slate, prefetch game logs and score the default sweep (player_api's modelling
+#             is private, so the sweep stands in for it)
+#   rerun     resolve the slate again a day after a first run, with the roster index and current-season game
+#             logs out of date: every request is a conditional one against the HTTP cache (http_cache.py)
+#   settle    settle the base ledger over the fixtures' past days
+#   replay    rebuild the base and every sweep-variant ledger under both sizing policies (run_backtest)
+# and reports the median wall time, HTTP calls per endpoint, response body bytes and the process's peak RSS. Every fixture call
+# waits --latency-ms to stand in for the network. The fetch engine's per-host rate limit is lifted unless
+# --throttle is given, so the numbers measure this code rather than the politeness delay.
+#
+#   python benchmarks/bench_pipeline.py [scenario ...] [--fixtures DIR] [--repeats N] [--save-baseline]
+#   python benchmarks/bench_pipeline.py --record DIR    (record a live slate; spends odds API credits)
+#
+# Results are compared with benchmarks/baselines/bench_pipeline.json when it exists; a scenario more than
+# REGRESSION_RATIO slower, or making more HTTP calls, than its baseline is flagged.
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'bench_pipeline.json')
+REGRESSION_RATIO = 1.2
+SWEEP_POLICIES = ('scale', 'truncate')
+
+def today():
+    return date.today().isoformat()
+
+# Past days' props and model rows built from the fixtures' boxscores: every rostered skater in each game
+# gets an Over and Under 2.5 line, and each model table a deterministic pseudo-random Kelly fraction
+def seed_history(store, tables, seed=0):
+    from setup_database import create_player_shots_odds, create_player_models
+    from best_lines import rebuild_best_lines
+    rng = random.Random(seed)
+    standings = store.json(f"{NHL_WEB}/standings/now") or {'standings': []}
+    team_names = {team['teamAbbrev']['default']: team['teamName']['default'] for team in standings['standings']}
+    player_names = {}
+    for key in store.keys(f"{NHL_WEB}/roster/"):
+        roster = store.json(key) or {}
+        for player in roster.get('forwards', []) + roster.get('defensemen', []):
+            player_names[player['id']] = f"{player['firstName']['default']} {player['lastName']['default']}"
+
+    props = []
+    for key in store.keys(f"{NHL_WEB}/score/"):
+        day = key.rsplit('/', 1)[-1]
+        for game in (store.json(key) or {}).get('games', []):
+            boxscore = store.json(f"{NHL_WEB}/gamecenter/{game['id']}/boxscore")
+            if not boxscore:
+                continue
+            home, away = team_names.get(boxscore['homeTeam']['abbrev']), team_names.get(boxscore['awayTeam']['abbrev'])
+            for side in ('homeTeam', 'awayTeam'):
+                for group in ('forwards', 'defense'):
+                    for player in boxscore['playerByGameStats'].get(side, {}).get(group, []):
+                        if player['playerId'] in player_names and home and away:
+                            props.append((str(game['id']), home, away, player_names[player['playerId']], day))
+
+    create_player_shots_odds()
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    cursor.executemany('''
+    INSERT INTO player_shots_odds (event_id, home_team, away_team, player_name, bookmaker, over_under, price, points, date, snapshot_ts)
+    VALUES (?, ?, ?, ?, 'DraftKings', ?, 1.9, 2.5, ?, ?)
+    ''', [(event_id, home, away, name, side, day, day) for event_id, home, away, name, day in props for side in ('Over', 'Under')])
+    rebuild_best_lines(cursor)
+    for table in tables:
+        create_player_models(table)
+        cursor.executemany(f'''
+        INSERT INTO {table} (player_name, date, over_under, points, implied_likelihood, normal_likelihood, poisson_likelihood,
+                             raw_data_likelihood, weighted_likelihood, poisson_kelly)
+        VALUES (?, ?, ?, 2.5, 0.5263, 0.5, 0.5, 0.5, 0.5, ?)
+        ''', [(name, day, side, rng.uniform(-0.2, 0.05)) for _, _, _, name, day in props for side in ('Over', 'Under')])
+    conn.commit()
+    return len(props)
+
+def sweep_tables():
+    from model_sweep import variant_table_name, DEFAULT_WEIGHTINGS, DEFAULT_OPPOSITION_ADJUSTS
+    return [variant_table_name(weights, adjust) for weights in DEFAULT_WEIGHTINGS for adjust in DEFAULT_OPPOSITION_ADJUSTS]
+
+def setup_model(store):
+    from odds_api_main import ingest_odds
+    from team_avg_SA import daily_factor_update
+    ingest_odds(print_to_console='n')
+    daily_factor_update()
+
+def run_odds():
+    from odds_api_main import ingest_odds
+    ingest_odds(print_to_console='n')
+
+def run_factors():
+    from team_avg_SA import daily_factor_update
+    daily_factor_update()
+
+def run_model():
+    from pipeline import run_slate
+    from model_sweep import sweep_weightings, DEFAULT_WEIGHTINGS, DEFAULT_OPPOSITION_ADJUSTS
+    run_slate({})
+    sweep_weightings(DEFAULT_WEIGHTINGS, opposition_adjusts=DEFAULT_OPPOSITION_ADJUSTS, start_date=today())
+
+# A first run, then everything that expires overnight is made a day old
+def setup_rerun(store):
+    import game_log_cache
+    import roster_index
+    import http_cache
+    from pipeline import run_slate
+    setup_model(store)
+    run_slate({})
+    conn = database.get_connection()
+    with database.transaction(conn):
+        conn.execute("UPDATE game_log_cache SET fetched_date = date(fetched_date, '-1 day') WHERE complete = 0")
+        conn.execute("UPDATE team_abbreviations SET built_date = date(built_date, '-1 day')")
+    cache = http_cache.get_cache_connection()
+    with database.transaction(cache):
+        cache.execute('UPDATE http_cache SET validated_ts = validated_ts - 86400')
+    game_log_cache._memory_cache.clear()
+    roster_index._index = None
+
+def run_rerun():
+    from pipeline import run_slate
+    run_slate({})
+
+def setup_settle(store):
+    from setup_database import create_ledger
+    seed_history(store, ['modelled_likelihoods'])
+    create_ledger('daily_ledger_scaled')
+
+def run_settle():
+    from update_ledger import update_ledger
+    update_ledger()
+
+def setup_replay(store):
+    seed_history(store, ['modelled_likelihoods'] + sweep_tables())
+
+def run_replay():
+    from backtest import run_backtest
+    run_backtest([(table, policy) for table in ['modelled_likelihoods'] + sweep_tables() for policy in SWEEP_POLICIES])
+
+# name -> (untimed setup(store) or None, timed run())
+SCENARIOS = {
+    'odds': (None, run_odds),
+    'factors': (None, run_factors),
+    'model': (setup_model, run_model),
+    'rerun': (setup_rerun, run_rerun),
+    'settle': (setup_settle, run_settle),
+    'replay': (setup_replay, run_replay),
+}
+
+# Run one scenario in this process and return its measurements
+def run_scenario(name, fixtures, latency, throttle=False):
+    import fetch_engine
+    if not throttle:
+        fetch_engine.HostRateLimiter.acquire = lambda self, host: None
+    setup, run = SCENARIOS[name]
+    store = FixtureStore(fixtures)
+    adapter = FixtureAdapter(store, latency)
+    with tempfile.TemporaryDirectory() as tmp, serve(adapter):
+        database.DATABASE_PATH = os.path.join(tmp, 'bench.db')
+        if setup:
+            setup(store)
+        adapter.reset_counts()
+        start = time.perf_counter()
+        run()
+        wall = time.perf_counter() - start
+        database.close_connection()
+    return {
+        'wall_s': round(wall, 4),
+        'http_calls': sum(adapter.calls.values()),
+        'http': dict(sorted(adapter.calls.items())),
+        'http_kb': round(adapter.bytes / 1024, 1),
+        'fixture_misses': len(adapter.misses),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+# Run a scenario in a child process (fresh imports, caches and peak RSS); its output is kept only on failure
+def run_child(name, fixtures, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--fixtures', fixtures, '--latency-ms', str(args.latency_ms)]
+    if args.throttle:
+        command.append('--throttle')
+    result = subprocess.run(command, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        print(result.stdout[-2000:], result.stderr[-4000:])
+        raise RuntimeError(f"Scenario {name} failed")
+    return json.loads(lines[-1])
+
+def measure(names, fixtures, args):
+    results = {}
+    for name in names:
+        runs = [run_child(name, fixtures, args) for _ in range(args.repeats)]
+        result = runs[len(runs) // 2]
+        result['wall_s'] = round(median(run['wall_s'] for run in runs), 4)
+        result['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+        results[name] = result
+        if result['fixture_misses']:
+            print(f"Warning: {name} asked for {result['fixture_misses']} urls the fixtures don't have")
+    return results
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+def report(results, baseline):
+    base = (baseline or {}).get('scenarios', {})
+    print(f"{'scenario':<10} {'wall (s)':>9} {'http':>6} {'http KB':>8} {'peak MB':>8} | {'base (s)':>9} {'base http':>9} {'change':>8}")
+    regressions = []
+    for name, result in results.items():
+        line = f"{name:<10} {result['wall_s']:>9.3f} {result['http_calls']:>6} {result['http_kb']:>8.0f} {result['peak_rss_mb']:>8.1f}"
+        if name in base:
+            ratio = result['wall_s'] / base[name]['wall_s'] if base[name]['wall_s'] else float('nan')
+            line += f" | {base[name]['wall_s']:>9.3f} {base[name]['http_calls']:>9} {ratio - 1:>+8.0%}"
+            if ratio > REGRESSION_RATIO or result['http_calls'] > base[name]['http_calls']:
+                line += '  REGRESSION'
+                regressions.append(name)
+        print(line)
+    for name, result in results.items():
+        print(f"{name} HTTP calls: " + ', '.join(f"{endpoint} x{n}" for endpoint, n in result['http'].items()))
+    return regressions
+
+# Record a live slate: today's odds, the team summary, standings, rosters and prop players' game logs, and
+# the last `days` days of scores and boxscores
+def record(path, days):
+    from odds_api_main import ingest_odds
+    from team_avg_SA import daily_factor_update
+    from pipeline import run_slate
+    from settlement import pull_results
+    adapter = RecordingAdapter()
+    with tempfile.TemporaryDirectory() as tmp, serve(adapter):
+        database.DATABASE_PATH = os.path.join(tmp, 'record.db')
+        ingest_odds(print_to_console='n')
+        daily_factor_update()
+        run_slate({})
+        pull_results([(date.today() - timedelta(days=n)).isoformat() for n in range(days, 0, -1)])
+        database.close_connection()
+    adapter.save(path)
+    print(f"Recorded {len(adapter.records)} responses to {path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the daily pipeline stages against HTTP fixtures.')
+    parser.add_argument('scenarios', nargs='*', choices=[[]] + list(SCENARIOS), default=[])
+    parser.add_argument('--fixtures', help='fixture directory (default: a synthetic slate generated with --seed)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--latency-ms', type=float, default=25)
+    parser.add_argument('--throttle', action='store_true', help="keep the fetch engine's per-host rate limit")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--record', metavar='DIR', help='record live fixtures into DIR instead of benchmarking')
+    parser.add_argument('--record-days', type=int, default=14)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.fixtures, args.latency_ms / 1000, args.throttle)))
+        return
+    if args.record:
+        record(args.record, args.record_days)
+        return
+
+    names = args.scenarios or list(SCENARIOS)
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = args.fixtures or synthetic_slate(os.path.join(tmp, 'fixtures'), seed=args.seed)
+        results = measure(names, fixtures, args)
+        source = FixtureStore(fixtures).meta['source']
+
+    baseline = load_baseline(args.baseline)
+    regressions = report(results, baseline)
+    if args.save_baseline:
+        saved = baseline if baseline and baseline['settings']['fixtures'] == source else {'scenarios': {}}
+        saved['scenarios'].update(results)
+        saved['settings'] = {'fixtures': source, 'latency_ms': args.latency_ms, 'throttle': args.throttle, 'repeats': args.repeats}
+        saved['machine'] = {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(saved, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"Slower or chattier than the baseline: {', '.join(regressions)}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
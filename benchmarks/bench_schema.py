@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from setup_database import migrate
+from settlement import dates_to_settle
+from best_lines import rebuild_best_lines
+
+# Times the daily modelling and settlement queries (which read props and teams from best_lines) on
+# synthetic databases holding 1..N seasons of props, first on rowid-only tables with the original
+# LEFT JOIN / NOT IN / DISTINCT query forms and then after the schema migrations with the NOT EXISTS
+# forms the code runs. The indexed times should stay flat as the seasons grow.
+#
+#   python benchmarks/bench_schema.py [max_seasons]
+
+GAMES_PER_DAY = 8
+PROP_PLAYERS_PER_TEAM = 12
+BOOKMAKERS = ['DraftKings', 'FanDuel', 'BetMGM', 'Caesars']
+DAYS_PER_SEASON = 190
+REPEATS = 3
+TEAM_LOOKUPS = 200
+
+MODEL_TABLE = 'modelled_likelihoods'
+LEDGER = 'daily_ledger_scaled'
+
+LEGACY_FETCH = f'''
+SELECT DISTINCT bl.player_name, bl.over_under, bl.home_team, bl.away_team, bl.date
+FROM best_lines bl
+LEFT JOIN {MODEL_TABLE} ml
+ON bl.player_name = ml.player_name AND bl.over_under = ml.over_under AND bl.date = ml.date AND bl.points = ml.points
+WHERE ml.player_name IS NULL
+AND bl.date > (SELECT COALESCE(MAX(date), '1900-01-01') FROM {LEDGER})
+'''
+
+# The modelling query in player_api.fetch_and_store_player_data
+FETCH = f'''
+SELECT DISTINCT bl.player_name, bl.over_under, bl.home_team, bl.away_team, bl.date
+FROM best_lines bl
+WHERE bl.date > (SELECT COALESCE(MAX(date), '1900-01-01') FROM {LEDGER})
+AND NOT EXISTS (SELECT 1 FROM {MODEL_TABLE} ml
+                WHERE ml.date = bl.date AND ml.player_name = bl.player_name
+                AND ml.over_under = bl.over_under AND ml.points = bl.points)
+'''
+
+LEGACY_TO_SETTLE = f"SELECT DISTINCT date FROM {MODEL_TABLE} WHERE date <= ? AND date NOT IN (SELECT DISTINCT date FROM {LEDGER})"
+
+# A prop's teams, as settlement.resolve_prop_players reads them from best_lines
+LEGACY_TEAMS = "SELECT DISTINCT home_team, away_team FROM best_lines WHERE date = ? AND player_name = ?"
+TEAMS = "SELECT home_team, away_team FROM best_lines WHERE date = ? AND player_name = ? LIMIT 1"
+
+# The tables with no indexes beyond the rowid, as setup_database.py originally created them (best_lines
+# gets its unique prop index from migration 3)
+def create_legacy_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE player_shots_odds (
+        id INTEGER PRIMARY KEY, event_id TEXT, home_team TEXT, away_team TEXT, player_name TEXT, bookmaker TEXT,
+        over_under TEXT, price REAL, points REAL, date TEXT, snapshot_ts TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE best_lines (
+        id INTEGER PRIMARY KEY, date TEXT, player_name TEXT, over_under TEXT, points REAL, best_price REAL, bookmaker TEXT,
+        n_books INTEGER, consensus_prob REAL, event_id TEXT, home_team TEXT, away_team TEXT, snapshot_ts TEXT
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TABLE {MODEL_TABLE} (
+        id INTEGER PRIMARY KEY, player_name TEXT, date TEXT, over_under TEXT, points REAL, implied_likelihood REAL,
+        normal_likelihood REAL, poisson_likelihood REAL, raw_data_likelihood REAL, weighted_likelihood REAL, poisson_kelly REAL
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TABLE {LEDGER} (
+        id INTEGER PRIMARY KEY, date TEXT, number_of_bets_suggested INTEGER, dollar_value_of_bets_suggested REAL,
+        initial_dollar_value REAL, final_dollar_value REAL
+    )
+    ''')
+
+# Fill seasons of history: every day has odds (and their best lines), model rows and a ledger row, except the last two days
+# (yesterday modelled but not settled, today only odds), as on a normal morning run
+def fill(conn, seasons, rng):
+    cursor = conn.cursor()
+    days = [date(2024, 10, 1) + timedelta(days=i) for i in range(seasons * DAYS_PER_SEASON + 2)]
+    teams = [f"Team {i}" for i in range(32)]
+    for n, day in enumerate(days):
+        day = day.isoformat()
+        odds, models = [], []
+        rng.shuffle(teams)
+        for game in range(GAMES_PER_DAY):
+            home_team, away_team = teams[2 * game], teams[2 * game + 1]
+            for team in (home_team, away_team):
+                for p in range(PROP_PLAYERS_PER_TEAM):
+                    player_name = f"{team} Player {p}"
+                    points = rng.choice([1.5, 2.5, 3.5])
+                    for over_under in ('Over', 'Under'):
+                        for bookmaker in BOOKMAKERS:
+                            odds.append((f"{day}-{game}", home_team, away_team, player_name, bookmaker, over_under,
+                                         round(rng.uniform(1.5, 2.5), 2), points, day, day))
+                        models.append((player_name, day, over_under, points, 0.5, 0.5, 0.5, 0.5, 0.5, 0.0))
+        cursor.executemany('''
+        INSERT INTO player_shots_odds (event_id, home_team, away_team, player_name, bookmaker, over_under, price, points, date, snapshot_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', odds)
+        if n < len(days) - 1:
+            cursor.executemany(f'''
+            INSERT INTO {MODEL_TABLE} (player_name, date, over_under, points, implied_likelihood, normal_likelihood,
+                                       poisson_likelihood, raw_data_likelihood, weighted_likelihood, poisson_kelly)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', models)
+        if n < len(days) - 2:
+            cursor.execute(f"INSERT INTO {LEDGER} (date, number_of_bets_suggested, dollar_value_of_bets_suggested, initial_dollar_value, final_dollar_value) VALUES (?, 0, 0, 100, 100)", (day,))
+    rebuild_best_lines(cursor)
+    conn.commit()
+    return [day.isoformat() for day in days]
+
+def best_time(fn):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def time_queries(cursor, days, lookups, legacy):
+    yesterday = days[-2]
+    if legacy:
+        fetch = lambda: cursor.execute(LEGACY_FETCH).fetchall()
+        to_settle = lambda: cursor.execute(LEGACY_TO_SETTLE, (yesterday,)).fetchall()
+        teams_sql = LEGACY_TEAMS
+    else:
+        fetch = lambda: cursor.execute(FETCH).fetchall()
+        to_settle = lambda: dates_to_settle(cursor, LEDGER, MODEL_TABLE, yesterday)
+        teams_sql = TEAMS
+    teams = lambda: [cursor.execute(teams_sql, lookup).fetchone() for lookup in lookups]
+    return best_time(fetch), best_time(to_settle), best_time(teams)
+
+def main(max_seasons=4):
+    rng = random.Random(0)
+    print(f"{'seasons':>7} {'odds rows':>10} | {'fetch (ms)':>17} | {'to settle (ms)':>17} | {f'{TEAM_LOOKUPS} team lookups':>17}")
+    print(f"{'':>7} {'':>10} | {'legacy':>8} {'indexed':>8} | {'legacy':>8} {'indexed':>8} | {'legacy':>8} {'indexed':>8}")
+    for seasons in range(1, max_seasons + 1):
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DATABASE_PATH = os.path.join(tmp, 'bench.db')
+            conn = database.get_connection()
+            cursor = conn.cursor()
+            create_legacy_tables(cursor)
+            days = fill(conn, seasons, rng)
+            cursor.execute("SELECT date, player_name FROM best_lines ORDER BY random() LIMIT ?", (TEAM_LOOKUPS,))
+            lookups = cursor.fetchall()
+            rows = cursor.execute("SELECT COUNT(*) FROM player_shots_odds").fetchone()[0]
+
+            legacy = time_queries(cursor, days, lookups, legacy=True)
+            migrate(conn)
+            cursor.execute("ANALYZE")
+            indexed = time_queries(cursor, days, lookups, legacy=False)
+            database.close_connection()
+        print(f"{seasons:>7} {rows:>10} | " + ' | '.join(f"{old:>8.1f} {new:>8.1f}" for old, new in zip(legacy, indexed)))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
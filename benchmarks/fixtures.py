@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import zlib
+import threading
+from datetime import date, datetime, timedelta, timezone
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+import requests # type: ignore
+from requests.adapters import BaseAdapter, HTTPAdapter # type: ignore
+from requests.structures import CaseInsensitiveDict # type: ignore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CURRENT_SEASON, PAST_SEASONS
+from metrics import endpoint
+
+# HTTP stand-ins for the benchmarks. A fixture set is a directory holding meta.json and fixtures.jsonl, one
+# recorded (or generated) response per line: {"key", "status", "headers", "body"}. Keys are host + path,
+# plus the query string without the API key when one was sent. FixtureAdapter is a requests transport
+# adapter that answers from such a set, optionally after a fixed latency; serve() routes every requests
+# call in the process (requests.get and any Session) through it. RecordingAdapter does the same in front
+# of the real network and saves what it sees. synthetic_slate() writes a generated set shaped like a full
+# slate: odds events and props, standings, rosters, game logs, the team summary and past days' scores
+# and boxscores.
+
+ODDS_HOST = 'api.the-odds-api.com'
+NHL_WEB = 'api-web.nhle.com/v1'
+TEAM_SUMMARY = 'api.nhle.com/stats/rest/en/team/summary'
+SECRET_PARAMS = {'api_key', 'apiKey'}
+
+def fixture_key(url):
+    parsed = urlparse(url)
+    query = sorted((name, value) for name, value in parse_qsl(parsed.query) if name not in SECRET_PARAMS)
+    key = parsed.netloc + parsed.path
+    return f"{key}?{urlencode(query)}" if query else key
+
+class FixtureStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as file:
+            self.meta = json.load(file)
+        self.responses = {}
+        with open(os.path.join(path, 'fixtures.jsonl')) as file:
+            for line in file:
+                record = json.loads(line)
+                self.responses[record['key']] = record
+        # Recorded odds events are moved forward by whole days so their games are still upcoming
+        recorded = datetime.fromisoformat(self.meta['recorded_at']).date()
+        self.day_shift = (date.today() - recorded).days
+
+    # The stored record for a url: an exact key match, else the same path with any query
+    def lookup(self, url):
+        key = fixture_key(url)
+        return self.responses.get(key) or self.responses.get(key.split('?', 1)[0])
+
+    def json(self, key):
+        record = self.responses.get(key)
+        return record['body'] if record and record['status'] == 200 else None
+
+    def keys(self, prefix):
+        return sorted(key for key in self.responses if key.startswith(prefix))
+
+    def body_bytes(self, record):
+        body = record['body']
+        if self.day_shift and isinstance(body, list) and record['key'].startswith(ODDS_HOST):
+            body = [dict(event, commence_time=shift_time(event['commence_time'], self.day_shift)) if 'commence_time' in event else event
+                    for event in body]
+        return body.encode() if isinstance(body, str) else json.dumps(body).encode()
+
+def shift_time(timestamp, days):
+    moved = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ') + timedelta(days=days)
+    return moved.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+# requests transport adapter answering from a FixtureStore. Unknown urls get a 404, and a conditional request
+# matching the record's ETag or Last-Modified a 304. Calls are counted per endpoint (ids folded as in the
+# run metrics), along with the body bytes sent.
+class FixtureAdapter(BaseAdapter):
+    def __init__(self, store, latency=0.0):
+        super().__init__()
+        self.store = store
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.misses = []
+        self.bytes = 0
+
+    def reset_counts(self):
+        with self.lock:
+            self.calls, self.misses, self.bytes = {}, [], 0
+
+    def send(self, request, **kwargs):
+        record = self.store.lookup(request.url)
+        with self.lock:
+            name = endpoint(request.url)
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if record is None:
+                self.misses.append(request.url)
+        if self.latency:
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = record['status'] if record else 404
+        response.headers = CaseInsensitiveDict(record['headers'] if record else {})
+        response._content = self.store.body_bytes(record) if record else b'{"message": "no fixture"}'
+        if record and not_modified(request.headers, response.headers):
+            response.status_code, response._content = 304, b''
+        with self.lock:
+            self.bytes += len(response._content)
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=self.latency)
+        return response
+
+    def close(self):
+        pass
+
+def not_modified(request_headers, headers):
+    etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+    return bool(etag and request_headers.get('If-None-Match') == etag
+                or last_modified and request_headers.get('If-Modified-Since') == last_modified)
+
+# Real transport that keeps a copy of every response
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.records = {}
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        headers = {name: value for name, value in response.headers.items() if name.lower().startswith('x-requests') or name.lower() in ('etag', 'last-modified')}
+        with self.lock:
+            self.records[fixture_key(request.url)] = {'key': fixture_key(request.url), 'status': response.status_code, 'headers': headers, 'body': body}
+        return response
+
+    def save(self, path, source='recorded'):
+        write_fixtures(path, self.records.values(), source)
+
+def write_fixtures(path, records, source):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'meta.json'), 'w') as file:
+        json.dump({'source': source, 'recorded_at': datetime.now().isoformat(timespec='seconds')}, file)
+    with open(os.path.join(path, 'fixtures.jsonl'), 'w') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+# Route every requests call in this process through adapter
+@contextmanager
+def serve(adapter):
+    original = requests.Session.get_adapter
+    requests.Session.get_adapter = lambda self, url: adapter
+    try:
+        yield adapter
+    finally:
+        requests.Session.get_adapter = original
+
+TEAMS = [
+    ('Anaheim Ducks', 'ANA'), ('Boston Bruins', 'BOS'), ('Buffalo Sabres', 'BUF'), ('Calgary Flames', 'CGY'),
+    ('Carolina Hurricanes', 'CAR'), ('Chicago Blackhawks', 'CHI'), ('Colorado Avalanche', 'COL'), ('Columbus Blue Jackets', 'CBJ'),
+    ('Dallas Stars', 'DAL'), ('Detroit Red Wings', 'DET'), ('Edmonton Oilers', 'EDM'), ('Florida Panthers', 'FLA'),
+    ('Los Angeles Kings', 'LAK'), ('Minnesota Wild', 'MIN'), ('Montreal Canadiens', 'MTL'), ('Nashville Predators', 'NSH'),
+    ('New Jersey Devils', 'NJD'), ('New York Islanders', 'NYI'), ('New York Rangers', 'NYR'), ('Ottawa Senators', 'OTT'),
+    ('Philadelphia Flyers', 'PHI'), ('Pittsburgh Penguins', 'PIT'), ('San Jose Sharks', 'SJS'), ('Seattle Kraken', 'SEA'),
+    ('St. Louis Blues', 'STL'), ('Tampa Bay Lightning', 'TBL'), ('Toronto Maple Leafs', 'TOR'), ('Utah Hockey Club', 'UTA'),
+    ('Vancouver Canucks', 'VAN'), ('Vegas Golden Knights', 'VGK'), ('Washington Capitals', 'WSH'), ('Winnipeg Jets', 'WPG'),
+]
+FIRST_NAMES = ['Adam', 'Ben', 'Carl', 'Dylan', 'Erik', 'Filip', 'Gabe', 'Henri', 'Isak', 'Jack', 'Kyle', 'Liam', 'Mats', 'Noah',
+               'Owen', 'Pavel', 'Quinn', 'Ryan', 'Sam', 'Tyler', 'Umar', 'Victor', 'Will', 'Yanni', 'Zach']
+LAST_NAMES = ['Anders', 'Bergman', 'Carlsson', 'Dumont', 'Ekholm', 'Fischer', 'Gagnon', 'Hanson', 'Ivanov', 'Jensen', 'Kowalski',
+              'Lindqvist', 'Morin', 'Novak', 'Olsen', 'Petrov', 'Quigley', 'Roy', 'Sorensen', 'Tremblay', 'Ulrich', 'Vachon',
+              'Walsh', 'Xavier', 'Young', 'Zetterberg']
+BOOKMAKERS = ['DraftKings', 'FanDuel', 'BetMGM', 'Caesars', 'BetRivers', 'PointsBet']
+
+# The NHL APIs send validators; the odds API doesn't
+def synthetic_etag(key, body):
+    if key.startswith(ODDS_HOST):
+        return {}
+    return {'ETag': f'"{zlib.crc32(json.dumps(body, sort_keys=True).encode()):08x}"'}
+
+# Generate a full synthetic slate into path: today's games with props from every bookmaker, the standings
+# and rosters, game logs for every prop player, the team summary, and scores plus boxscores for each of
+# the past_days before today
+def synthetic_slate(path, seed=0, games=8, prop_players_per_team=10, bookmakers=len(BOOKMAKERS), past_days=14):
+    rng = random.Random(seed)
+    today = date.today()
+    records = []
+    add = lambda key, body, headers=None: records.append({'key': key, 'status': 200, 'headers': headers or synthetic_etag(key, body), 'body': body})
+
+    # Rosters: 12 forwards, 6 defensemen and 2 goalies per team, each with a shot rate
+    names = [f"{first} {last}" for last in LAST_NAMES for first in FIRST_NAMES]
+    rng.shuffle(names)
+    rosters, rates, next_id = {}, {}, 8470000
+    for team_name, abbrev in TEAMS:
+        roster = {'forwards': [], 'defensemen': [], 'goalies': []}
+        for group, size in (('forwards', 12), ('defensemen', 6), ('goalies', 2)):
+            for _ in range(size):
+                first, last = names.pop().split(' ')
+                roster[group].append({'id': next_id, 'firstName': {'default': first}, 'lastName': {'default': last}})
+                rates[next_id] = 0.0 if group == 'goalies' else rng.uniform(0.8, 3.8) * (1.0 if group == 'forwards' else 0.6)
+                next_id += 1
+        rosters[abbrev] = roster
+        add(f"{NHL_WEB}/roster/{abbrev}/current", roster)
+    add(f"{NHL_WEB}/standings/now", {'standings': [{'teamName': {'default': name}, 'teamAbbrev': {'default': abbrev}} for name, abbrev in TEAMS]})
+    add(TEAM_SUMMARY, {'data': [{'teamFullName': name, 'teamId': i + 1, 'shotsAgainstPerGame': round(rng.uniform(26, 33), 2)}
+                                for i, (name, _) in enumerate(TEAMS)]})
+    skaters = lambda abbrev: rosters[abbrev]['forwards'] + rosters[abbrev]['defensemen']
+    poisson = lambda rate: sum(1 for _ in range(40) if rng.random() < rate / 40)
+
+    # Today's events and props; commence times a few hours from now so the quota scheduler keeps them
+    start = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(hours=3)
+    matchups = rng.sample(TEAMS, 2 * games)
+    events = []
+    for g in range(games):
+        (home, home_abbrev), (away, away_abbrev) = matchups[2 * g], matchups[2 * g + 1]
+        event = {'id': f"{rng.getrandbits(128):032x}", 'sport_key': 'icehockey_nhl', 'home_team': home, 'away_team': away,
+                 'commence_time': (start + timedelta(minutes=30 * g)).strftime('%Y-%m-%dT%H:%M:%SZ')}
+        events.append(event)
+        players = sorted(skaters(home_abbrev), key=lambda p: -rates[p['id']])[:prop_players_per_team] + \
+                  sorted(skaters(away_abbrev), key=lambda p: -rates[p['id']])[:prop_players_per_team]
+        books = []
+        for title in BOOKMAKERS[:bookmakers]:
+            outcomes = []
+            for player in players:
+                rate = rates[player['id']]
+                point = max(0.5, round(rate) - 0.5)
+                over = sum(rate ** k * math.exp(-rate) / math.factorial(k) for k in range(int(point) + 1, 20))
+                for side, probability in (('Over', over), ('Under', 1 - over)):
+                    price = round(max(1.05, 1 / min(0.97, max(0.03, probability)) * rng.uniform(0.90, 0.97)), 2)
+                    outcomes.append({'name': side, 'description': f"{player['firstName']['default']} {player['lastName']['default']}",
+                                     'price': price, 'point': point})
+            books.append({'key': title.lower(), 'title': title, 'markets': [{'key': 'player_shots_on_goal', 'outcomes': outcomes}]})
+        add(f"{ODDS_HOST}/v4/sports/icehockey_nhl/events/{event['id']}/odds", {'id': event['id'], 'bookmakers': books},
+            {'x-requests-used': '120', 'x-requests-remaining': '19880', 'x-requests-last': '1'})
+        # Game logs for the prop players: this season up to yesterday and both past seasons
+        for player in players:
+            rate = rates[player['id']]
+            for season in [CURRENT_SEASON] + PAST_SEASONS:
+                first_day = today - timedelta(days=120) if season == CURRENT_SEASON else date(int(season[:4]), 10, 5)
+                game_days = [first_day + timedelta(days=2 * i) for i in range(60 if season == CURRENT_SEASON else 82)]
+                log = [{'gameDate': day.isoformat(), 'shots': poisson(rate), 'teamAbbrev': home_abbrev if player in skaters(home_abbrev) else away_abbrev,
+                        'opponentAbbrev': rng.choice(TEAMS)[1]} for day in game_days if day < today]
+                add(f"{NHL_WEB}/player/{player['id']}/game-log/{season}/2", {'gameLog': log[::-1]})
+    add(f"{ODDS_HOST}/v4/sports/icehockey_nhl/events", events,
+        {'x-requests-used': '120', 'x-requests-remaining': '19880', 'x-requests-last': '0'})
+
+    # Past days: every team's skaters in games with final boxscores
+    game_id = 2024020001
+    for days_back in range(past_days, 0, -1):
+        day = (today - timedelta(days=days_back)).isoformat()
+        day_games = []
+        for g, teams in enumerate(_pairs(rng.sample(TEAMS, 2 * games))):
+            stats = {}
+            for side, (_, abbrev) in zip(('homeTeam', 'awayTeam'), teams):
+                stats[side] = {group: [{'playerId': p['id'], 'name': {'default': f"{p['firstName']['default'][0]}. {p['lastName']['default']}"},
+                                        'sog': poisson(rates[p['id']])} for p in rosters[abbrev][roster_group]]
+                               for group, roster_group in (('forwards', 'forwards'), ('defense', 'defensemen'))}
+            day_games.append({'id': game_id, 'gameType': 2, 'gameState': 'OFF'})
+            add(f"{NHL_WEB}/gamecenter/{game_id}/boxscore", {'id': game_id, 'gameState': 'OFF', 'homeTeam': {'abbrev': teams[0][1]},
+                                                              'awayTeam': {'abbrev': teams[1][1]}, 'playerByGameStats': stats})
+            game_id += 1
+        add(f"{NHL_WEB}/score/{day}", {'games': day_games})
+
+    write_fixtures(path, records, f"synthetic seed={seed} games={games} prop_players_per_team={prop_players_per_team} past_days={past_days}")
+    return path
+
+def _pairs(items):
+    return [(items[i], items[i + 1]) for i in range(0, len(items) - 1, 2)]
+
+if __name__ == "__main__":
+    # Write a synthetic fixture set: python benchmarks/fixtures.py OUT_DIR [seed]
+    out = synthetic_slate(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    print(f"Wrote synthetic fixtures to {out}")
@@ -0,0 +1,107 @@
+from database import get_connection, transaction
+
+# One row per prop (date, player_name, over_under, points) summarising every bookmaker's latest quote in
+# player_shots_odds: the best price and the book offering it, how many books quote it and the no-vig
+# consensus probability. ingest_odds and replay.backfill_odds refresh the props they touch right after
+# writing them, so modelling and settlement read this compact table instead of regrouping every
+# bookmaker row on every run.
+
+def create_best_lines_table(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS best_lines (
+        id INTEGER PRIMARY KEY,
+        date TEXT,
+        player_name TEXT,
+        over_under TEXT,
+        points REAL,
+        best_price REAL,
+        bookmaker TEXT,
+        n_books INTEGER,
+        consensus_prob REAL,
+        event_id TEXT,
+        home_team TEXT,
+        away_team TEXT,
+        snapshot_ts TEXT
+    )
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_best_lines_prop ON best_lines (date, player_name, over_under, points)")
+
+# best_lines rows for one (date, player_name) from its player_shots_odds rows, given as
+# (event_id, home_team, away_team, bookmaker, over_under, price, points, snapshot_ts). Only each book's
+# latest snapshot counts, and a book whose latest row has a NULL price has pulled the line. The consensus is the mean over books quoting both sides of a line of
+# (1/over) / (1/over + 1/under), i.e. each book's probability with its margin removed; it is None when
+# no book quotes both sides.
+def summarise_player(date, player_name, odds_rows):
+    latest = {}
+    for row in odds_rows:
+        event_id, _, _, bookmaker, over_under, _, points, snapshot_ts = row
+        key = (event_id, bookmaker, over_under, points)
+        if key not in latest or snapshot_ts > latest[key][7]:
+            latest[key] = row
+
+    quotes = {}
+    for row in latest.values():
+        if row[5] is not None:
+            quotes.setdefault((row[4], row[6]), []).append(row)
+
+    lines = []
+    for (over_under, points), rows in quotes.items():
+        best = max(rows, key=lambda row: row[5])
+        opposite = 'Under' if over_under == 'Over' else 'Over'
+        other_side = {(row[0], row[3]): row[5] for row in quotes.get((opposite, points), [])}
+        no_vig = [(1 / row[5]) / (1 / row[5] + 1 / other_side[(row[0], row[3])])
+                  for row in rows if (row[0], row[3]) in other_side]
+        consensus_prob = sum(no_vig) / len(no_vig) if no_vig else None
+        lines.append((date, player_name, over_under, points, best[5], best[3], len({row[3] for row in rows}),
+                      consensus_prob, best[0], best[1], best[2], best[7]))
+    return lines
+
+def write_lines(cursor, lines):
+    cursor.executemany('''
+    INSERT OR REPLACE INTO best_lines (date, player_name, over_under, points, best_price, bookmaker, n_books,
+                                       consensus_prob, event_id, home_team, away_team, snapshot_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', lines)
+
+# Recompute the lines of the given (date, player_name) pairs, e.g. the players in a batch of freshly
+# inserted player_shots_odds rows; lines every book has pulled are removed. Call inside the transaction that
+# wrote those rows.
+def refresh_best_lines(cursor, players):
+    lines = []
+    for date, player_name in set(players):
+        cursor.execute("DELETE FROM best_lines WHERE date = ? AND player_name = ?", (date, player_name))
+        cursor.execute('''
+        SELECT event_id, home_team, away_team, bookmaker, over_under, price, points, snapshot_ts
+        FROM player_shots_odds WHERE date = ? AND player_name = ?
+        ''', (date, player_name))
+        lines.extend(summarise_player(date, player_name, cursor.fetchall()))
+    write_lines(cursor, lines)
+    return len(lines)
+
+# Rebuild best_lines from scratch (or from start_date on) by streaming player_shots_odds in prop-index order
+def rebuild_best_lines(cursor, start_date='1900-01-01'):
+    cursor.execute("DELETE FROM best_lines WHERE date >= ?", (start_date,))
+    read = cursor.connection.cursor()
+    read.execute('''
+    SELECT date, player_name, event_id, home_team, away_team, bookmaker, over_under, price, points, snapshot_ts
+    FROM player_shots_odds WHERE date >= ?
+    ORDER BY date, player_name
+    ''', (start_date,))
+    lines, current, odds_rows = [], None, []
+    for row in read:
+        if row[:2] != current:
+            if current:
+                lines.extend(summarise_player(*current, odds_rows))
+            current, odds_rows = row[:2], []
+        odds_rows.append(row[2:])
+    if current:
+        lines.extend(summarise_player(*current, odds_rows))
+    write_lines(cursor, lines)
+    return len(lines)
+
+if __name__ == "__main__":
+    conn = get_connection()
+    cursor = conn.cursor()
+    create_best_lines_table(cursor)
+    with transaction(conn):
+        print(f"Rebuilt {rebuild_best_lines(cursor)} best lines.")
@@ -0,0 +1,94 @@
+import sys
+import argparse
+
+# Single entry point for the daily jobs: nhl-shots odds|model|settle|ledger|export|daily. Each subcommand
+# imports only the modules it needs when it runs, so e.g. printing a ledger never loads the modelling,
+# plotting or HTTP stacks.
+
+def cmd_odds(args):
+    from odds_api_main import ingest_odds
+    ingest_odds(refresh=args.refresh, runs_per_day=args.runs_per_day, archive_dir=args.archive)
+
+def cmd_model(args):
+    if not args.sweep_only:
+        from player_api import fetch_and_store_player_data
+        fetch_and_store_player_data()
+    if args.sweep or args.sweep_only:
+        from model_sweep import sweep_weightings, DEFAULT_WEIGHTINGS, DEFAULT_OPPOSITION_ADJUSTS
+        sweep_weightings(DEFAULT_WEIGHTINGS, opposition_adjusts=DEFAULT_OPPOSITION_ADJUSTS, start_date=args.start)
+
+def cmd_settle(args):
+    if args.ledger:
+        from update_ledger import update_ledger
+        update_ledger(args.ledger, args.model_table, truncate_bets=1 if args.truncate else 0)
+    else:
+        from pipeline import run_settle
+        run_settle({})
+
+def cmd_ledger(args):
+    from update_ledger import print_ledger
+    for ledger in args.ledgers:
+        print_ledger(ledger, args.start, args.end)
+
+def cmd_export(args):
+    from export import export_table, preview
+    if args.preview:
+        preview(args.table, args.preview, args.start, args.end)
+    else:
+        export_table(args.table, args.out, args.format, args.start, args.end)
+
+def cmd_daily(args):
+    import metrics
+    from pipeline import run_daily
+    with metrics.run(profile=args.profile):
+        run_daily(force=args.force)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='nhl-shots', description='NHL player shots props: odds, models and ledgers.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    odds = commands.add_parser('odds', help="fetch and store today's player shots props")
+    odds.add_argument('--refresh', action='store_true', help='store an intraday snapshot even if today is already stored')
+    odds.add_argument('--runs-per-day', type=int, default=1, help='daily + intraday runs sharing the API quota')
+    odds.add_argument('--archive', help='also save the raw responses under this directory (for replay.py)')
+    odds.set_defaults(func=cmd_odds)
+
+    model = commands.add_parser('model', help='model unmodelled props')
+    model.add_argument('--sweep', action='store_true', help='also score the model_sweep variants')
+    model.add_argument('--sweep-only', action='store_true', help='only score the model_sweep variants')
+    model.add_argument('--start', default='1900-01-01', help='earliest prop date for the sweep')
+    model.set_defaults(func=cmd_model)
+
+    settle = commands.add_parser('settle', help='settle finished days into the ledgers (default: base and sweep ledgers)')
+    settle.add_argument('--ledger', help='settle only this ledger')
+    settle.add_argument('--model-table', default='modelled_likelihoods', help='model table for --ledger')
+    settle.add_argument('--truncate', action='store_true', help='truncate instead of scaling bets for --ledger')
+    settle.set_defaults(func=cmd_settle)
+
+    ledger = commands.add_parser('ledger', help='print ledgers')
+    ledger.add_argument('ledgers', nargs='*', default=['daily_ledger_scaled'])
+    ledger.add_argument('--start', help='first date to print (YYYY-MM-DD)')
+    ledger.add_argument('--end', help='last date to print (YYYY-MM-DD)')
+    ledger.set_defaults(func=cmd_ledger)
+
+    export = commands.add_parser('export', help='stream a table to CSV, JSON lines or Parquet, or preview it')
+    export.add_argument('table')
+    export.add_argument('--out', help='output path (default <table>.<format>)')
+    export.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help='default: from --out, else csv')
+    export.add_argument('--start', help='first date to include (YYYY-MM-DD)')
+    export.add_argument('--end', help='last date to include (YYYY-MM-DD)')
+    export.add_argument('--preview', type=int, metavar='N', help='print the first and last N rows instead of writing a file')
+    export.set_defaults(func=cmd_export)
+
+    daily = commands.add_parser('daily', help='run the whole daily pipeline')
+    daily.add_argument('--force', action='store_true', help='rerun stages whose inputs are unchanged')
+    daily.add_argument('--profile', action='store_true', help='also write a cProfile dump next to the run metrics in logs/')
+    daily.set_defaults(func=cmd_daily)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -4,4 +4,6 @@ REGIONS = 'us'
 MARKETS = 'h2h,spreads'
 ODDS_FORMAT = 'decimal'
 DATE_FORMAT = 'iso'
-DATABASE = 'nhl_player_shots.db'
\ No newline at end of file
+DATABASE = 'nhl_player_shots.db'
+CURRENT_SEASON = '20242025'
+PAST_SEASONS = ['20232024', '20222023']
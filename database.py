@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import time
+import threading
+from contextlib import contextmanager
+from config import DATABASE
+import metrics
+
+# One place to open nhl_player_shots.db. Every module shares a per-process (and per-thread) connection
+# to the same absolute path, in WAL mode so the model variants and ledger updates can read while another
+# process writes, and with a statement cache so repeated queries reuse their prepared statements.
+
+# Get the directory of the current script
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+DATABASE_PATH = DATABASE if os.path.isabs(DATABASE) else os.path.join(script_dir, DATABASE)
+
+# How long a writer waits on another process's lock before "database is locked" is raised
+BUSY_TIMEOUT_MS = 30000
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+# Cursors that time each execute / executemany into the run metrics while a metrics run is active
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if not metrics.enabled:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.record_sql(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not metrics.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.record_sql(sql, time.perf_counter() - start)
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connect(path=None):
+    conn = sqlite3.connect(path or DATABASE_PATH, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE_SIZE,
+                           factory=TimedConnection)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-32000")
+    return conn
+
+# The shared connection for this process and thread; reopened after a fork or if the path changes
+def get_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != DATABASE_PATH:
+        conn = connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = DATABASE_PATH
+    return conn
+
+def close_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+# Run a block of writes as one transaction, taking the write lock up front (BEGIN IMMEDIATE) so two
+# processes never both read under a shared lock and then deadlock upgrading it. Commits on success and
+# rolls back on error; nested use joins the outer transaction.
+@contextmanager
+def transaction(conn=None):
+    conn = conn or get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
@@ -0,0 +1,150 @@
+import csv
+import json
+from database import get_connection
+
+# Streaming reads of whole tables for previews, ledgers and exports. Rows are pulled from the cursor in
+# batches of BATCH_SIZE and written or printed as they arrive, so memory stays flat however many seasons
+# a table holds; head and tail come straight from ORDER BY ... LIMIT. Parquet output needs pyarrow.
+
+BATCH_SIZE = 1000
+PARQUET_ROW_GROUP = 64 * BATCH_SIZE
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+# Parquet column types from the declared SQLite column types
+PARQUET_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string'}
+
+def table_columns(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    columns = [(row[1], row[2].upper()) for row in cursor.fetchall()]
+    if not columns:
+        raise ValueError(f"No such table: {table_name}")
+    return columns
+
+# WHERE clause and parameters for an inclusive date range; either end may be None
+def date_filter(columns, start_date=None, end_date=None):
+    if start_date is None and end_date is None:
+        return '', []
+    if 'date' not in [name for name, _ in columns]:
+        raise ValueError("A date range needs a table with a date column")
+    clauses, params = [], []
+    if start_date is not None:
+        clauses.append('date >= ?')
+        params.append(start_date)
+    if end_date is not None:
+        clauses.append('date <= ?')
+        params.append(end_date)
+    return ' WHERE ' + ' AND '.join(clauses), params
+
+def iter_batches(cursor, batch_size=BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+# Column names and a generator of row batches for a table in rowid order
+def select_rows(table_name, start_date=None, end_date=None, conn=None, batch_size=BATCH_SIZE):
+    cursor = (conn or get_connection()).cursor()
+    columns = table_columns(cursor, table_name)
+    where, params = date_filter(columns, start_date, end_date)
+    cursor.execute(f"SELECT * FROM {table_name}{where} ORDER BY rowid", params)
+    return [description[0] for description in cursor.description], iter_batches(cursor, batch_size)
+
+def count_rows(table_name, start_date=None, end_date=None, conn=None):
+    cursor = (conn or get_connection()).cursor()
+    where, params = date_filter(table_columns(cursor, table_name), start_date, end_date)
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}{where}", params)
+    return cursor.fetchone()[0]
+
+# First n rows (or the last n with tail=True), in table order
+def head(table_name, n=3, start_date=None, end_date=None, conn=None, tail=False):
+    cursor = (conn or get_connection()).cursor()
+    where, params = date_filter(table_columns(cursor, table_name), start_date, end_date)
+    cursor.execute(f"SELECT * FROM {table_name}{where} ORDER BY rowid {'DESC' if tail else 'ASC'} LIMIT ?", params + [n])
+    rows = cursor.fetchall()
+    return [description[0] for description in cursor.description], rows[::-1] if tail else rows
+
+def tail(table_name, n=3, start_date=None, end_date=None, conn=None):
+    return head(table_name, n, start_date, end_date, conn, tail=True)
+
+def format_row(row, decimals=2):
+    return [f"{x:.{decimals}f}" if isinstance(x, float) else x for x in row]
+
+# Print the first and last n rows of a table, or the whole table if it has no more than 2n rows
+def preview(table_name, n=3, start_date=None, end_date=None, conn=None):
+    total = count_rows(table_name, start_date, end_date, conn)
+    if total > 2 * n:
+        headers, rows = head(table_name, n, start_date, end_date, conn)
+        print(f"First {n} rows of {table_name}:")
+        print(headers)
+        for row in rows:
+            print(format_row(row))
+        headers, rows = tail(table_name, n, start_date, end_date, conn)
+        print(f"Last {n} rows of {table_name}:")
+        print(headers)
+        for row in rows:
+            print(format_row(row))
+    else:
+        headers, batches = select_rows(table_name, start_date, end_date, conn)
+        print(f"Entire {table_name} table:")
+        print(headers)
+        for rows in batches:
+            for row in rows:
+                print(format_row(row))
+    return total
+
+def print_rows(table_name, start_date=None, end_date=None, conn=None):
+    _, batches = select_rows(table_name, start_date, end_date, conn)
+    for rows in batches:
+        for row in rows:
+            print(format_row(row))
+
+def write_csv(headers, batches, path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(headers)
+        for rows in batches:
+            writer.writerows(rows)
+
+def write_jsonl(headers, batches, path):
+    with open(path, 'w') as file:
+        for rows in batches:
+            file.writelines(json.dumps(dict(zip(headers, row))) + '\n' for row in rows)
+
+def write_parquet(headers, batches, path, column_types):
+    try:
+        import pyarrow as pa # type: ignore
+        import pyarrow.parquet as pq # type: ignore
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([(name, getattr(pa, PARQUET_TYPES.get(column_types.get(name), 'string'))()) for name in headers])
+    # Batches are grouped into row groups of about PARQUET_ROW_GROUP rows; one tiny row group per batch
+    # would bloat the file footer
+    with pq.ParquetWriter(path, schema) as writer:
+        pending, pending_rows = [], 0
+        for rows in batches:
+            pending.append(pa.record_batch([list(column) for column in zip(*rows)], schema=schema))
+            pending_rows += len(rows)
+            if pending_rows >= PARQUET_ROW_GROUP:
+                writer.write_table(pa.Table.from_batches(pending, schema=schema))
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema))
+
+# Write a table (optionally only start_date..end_date) to path; the format comes from fmt or the path's
+# extension. Returns the path written.
+def export_table(table_name, path=None, fmt=None, start_date=None, end_date=None, conn=None):
+    fmt = fmt or (path.rsplit('.', 1)[-1] if path and '.' in path else 'csv')
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt}; expected one of {', '.join(FORMATS)}")
+    path = path or f"{table_name}.{fmt}"
+    conn = conn or get_connection()
+    headers, batches = select_rows(table_name, start_date, end_date, conn)
+    if fmt == 'csv':
+        write_csv(headers, batches, path)
+    elif fmt == 'jsonl':
+        write_jsonl(headers, batches, path)
+    else:
+        write_parquet(headers, batches, path, dict(table_columns(conn.cursor(), table_name)))
+    print(f"Wrote {table_name} to {path}")
+    return path
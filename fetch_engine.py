@@ -0,0 +1,110 @@
+import time
+import threading
+import requests # type: ignore
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from game_log_cache import stale_game_log_keys, store_game_logs
+import http_cache
+from http_client import RETRYABLE_STATUS
+import metrics
+
+BASE_URL = "https://api-web.nhle.com/v1"
+
+# Token bucket per host, shared by all worker threads
+class HostRateLimiter:
+    def __init__(self, rate_per_second=8, burst=4):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, host):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens, last = self.buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self.buckets[host] = (tokens - 1, now)
+                    return
+                self.buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+# Total number of retries allowed across one batch, so a failing endpoint can't stall the run
+class RetryBudget:
+    def __init__(self, total=30):
+        self.remaining = total
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+class FetchEngine:
+    def __init__(self, base_url=BASE_URL, max_workers=8, rate_per_second=8, burst=4, retry_budget=30,
+                 max_attempts=4, timeout=10, backoff=0.5):
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.limiter = HostRateLimiter(rate_per_second, burst)
+        self.budget = RetryBudget(retry_budget)
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff = backoff
+
+    # GET a url and return its JSON, or None once retries (or the shared budget) run out. Each attempt is a
+    # single pooled request (http_client); the retries are made here so they wait on the rate limit and
+    # draw on the batch's budget.
+    def get_json(self, url):
+        host = urlparse(url).netloc
+        for attempt in range(self.max_attempts):
+            self.limiter.acquire(host)
+            try:
+                response = http_cache.get(url, timeout=self.timeout, attempts=1)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                response = None
+                error = str(e)
+            if response is not None:
+                if response.status_code == 200:
+                    try:
+                        return response.json()
+                    except requests.exceptions.JSONDecodeError:
+                        print(f"Error decoding JSON from {url}")
+                        return None
+                if response.status_code not in RETRYABLE_STATUS:
+                    print(f"Request to {url} failed with status code {response.status_code}")
+                    return None
+                error = f"status code {response.status_code}"
+            if attempt + 1 == self.max_attempts or not self.budget.take():
+                print(f"Request to {url} failed ({error}), giving up")
+                return None
+            metrics.count('retry.get_json')
+            time.sleep(self.backoff * 2 ** attempt)
+        return None
+
+    # Fetch many urls concurrently, returning {url: json or None}
+    def fetch_many(self, urls):
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(zip(urls, pool.map(self.get_json, urls)))
+
+    # Download every stale (player_id, season) game log in one batch and store them in the cache
+    def prefetch_game_logs(self, pairs, game_type=2, through_date=None):
+        keys = stale_game_log_keys(pairs, game_type, through_date)
+        urls = {key: f"{self.base_url}/player/{key[0]}/game-log/{key[1]}/{key[2]}" for key in keys}
+        results = self.fetch_many(urls.values())
+        logs = {key: results[url] for key, url in urls.items() if results[url] is not None}
+        store_game_logs(logs)
+        print(f"Prefetched {len(logs)} of {len(keys)} stale game logs ({len(set(pairs)) - len(keys)} already cached).")
+        return logs
+
+    # Fetch current rosters for a set of team abbreviations, returning {abbrev: roster json}
+    def fetch_rosters(self, team_abbrevs):
+        urls = {abbrev: f"{self.base_url}/roster/{abbrev}/current" for abbrev in set(team_abbrevs) if abbrev}
+        results = self.fetch_many(urls.values())
+        return {abbrev: results[url] for abbrev, url in urls.items() if results[url] is not None}
@@ -0,0 +1,222 @@
+import json
+import requests # type: ignore
+from datetime import date
+from database import get_connection
+import http_cache
+import metrics
+
+BASE_URL = "https://api-web.nhle.com/v1"
+
+# Parsed game logs already seen by this process, keyed by (player_id, season, game_type), with their fetch dates
+_memory_cache = {}
+
+# Logs stored by this process, by key; tells a shot history built from player_game_shots that it's out of date
+_versions = {}
+
+def create_game_log_cache_table(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS game_log_cache (
+        player_id INTEGER,
+        season TEXT,
+        game_type INTEGER,
+        payload TEXT,
+        last_game_date TEXT,
+        fetched_date TEXT,
+        complete INTEGER,
+        PRIMARY KEY (player_id, season, game_type)
+    )
+    ''')
+    create_player_game_shots_table(cursor)
+    conn.commit()
+
+# One row per game of every cached log, clustered by player and date, so a player's shot history is one
+# range read instead of a parse of each season's JSON. Created (and filled from the logs already cached)
+# the first time it's needed, and kept in step by store_game_log.
+def create_player_game_shots_table(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'player_game_shots'")
+    if cursor.fetchone():
+        return
+    cursor.execute('''
+    CREATE TABLE player_game_shots (
+        player_id INTEGER,
+        game_type INTEGER,
+        game_date TEXT,
+        season TEXT,
+        shots INTEGER,
+        team TEXT,
+        opponent TEXT,
+        PRIMARY KEY (player_id, game_type, game_date)
+    ) WITHOUT ROWID
+    ''')
+    read = cursor.connection.cursor()
+    read.execute('SELECT player_id, season, game_type, payload FROM game_log_cache')
+    for player_id, season, game_type, payload in read:
+        store_game_shots(cursor, player_id, season, game_type, json.loads(payload))
+
+# (game_date, season, shots, team, opponent) for every game in a log payload
+def game_rows(season, data):
+    return [(game['gameDate'], season, game['shots'], game.get('teamAbbrev'), game.get('opponentAbbrev'))
+            for game in (data or {}).get('gameLog', [])]
+
+def store_game_shots(cursor, player_id, season, game_type, data):
+    cursor.execute('DELETE FROM player_game_shots WHERE player_id = ? AND season = ? AND game_type = ?', (player_id, season, game_type))
+    cursor.executemany('''
+    INSERT OR REPLACE INTO player_game_shots (player_id, game_type, game_date, season, shots, team, opponent)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(player_id, game_type, *row) for row in game_rows(season, data)])
+
+# Every stored game of a player's logs for the given seasons, as game_rows tuples
+def load_game_shots(player_id, seasons, game_type=2):
+    seasons = [str(season) for season in seasons]
+    cursor = get_connection().cursor()
+    cursor.execute(f'''
+    SELECT game_date, season, shots, team, opponent FROM player_game_shots
+    WHERE player_id = ? AND game_type = ? AND season IN ({', '.join('?' for _ in seasons)})
+    ''', [int(player_id), int(game_type)] + seasons)
+    return cursor.fetchall()
+
+# NHL season ('20242025') a date falls in; seasons start in the autumn, so July onwards is the next one
+def season_for_date(date):
+    year = int(date[:4])
+    return f"{year}{year + 1}" if int(date[5:7]) >= 7 else f"{year - 1}{year}"
+
+# Whether a season's games were all played by on_date (an ISO date), i.e. a later season had begun
+def season_finished(season, on_date):
+    return season_for_date(on_date) > str(season)
+
+# A cached log is still good if its season was already finished when fetched, or if every game the caller
+# needs (through_date) was played before the day of the fetch. Without a through_date only today's fetch counts.
+def is_fresh(season, fetched_date, through_date=None):
+    if season_finished(season, fetched_date):
+        return True
+    if through_date is None:
+        return fetched_date >= date.today().isoformat()
+    return through_date < fetched_date
+
+def download_game_log(player_id, season, game_type=2):
+    season_url = f"{BASE_URL}/player/{player_id}/game-log/{season}/{game_type}"
+    try:
+        response = http_cache.get(season_url)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        print(f"Request to {season_url} failed ({e})")
+        return None
+    if response.status_code == 200:
+        try:
+            return response.json()
+        except requests.exceptions.JSONDecodeError:
+            print(f"Error decoding JSON from {season_url}")
+            return None
+    else:
+        print(f"Request to {season_url} failed with status code {response.status_code}")
+        return None
+
+def read_cached_game_log(cursor, player_id, season, game_type=2):
+    cursor.execute('''
+    SELECT payload, fetched_date, complete FROM game_log_cache
+    WHERE player_id = ? AND season = ? AND game_type = ?
+    ''', (player_id, season, game_type))
+    return cursor.fetchone()
+
+def store_game_log(cursor, player_id, season, game_type, data):
+    game_dates = [game['gameDate'] for game in data.get('gameLog', [])]
+    last_game_date = max(game_dates) if game_dates else None
+    complete = 1 if season_finished(season, date.today().isoformat()) else 0
+    cursor.execute('''
+    INSERT OR REPLACE INTO game_log_cache (player_id, season, game_type, payload, last_game_date, fetched_date, complete)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (player_id, season, game_type, json.dumps(data), last_game_date, date.today().isoformat(), complete))
+    store_game_shots(cursor, player_id, season, game_type, data)
+    key = (int(player_id), str(season), int(game_type))
+    _versions[key] = _versions.get(key, 0) + 1
+
+# Return the (player_id, season, game_type) keys from pairs that would need a download
+def stale_game_log_keys(pairs, game_type=2, through_date=None):
+    keys = []
+    conn = get_connection()
+    cursor = conn.cursor()
+    create_game_log_cache_table(conn)
+    for player_id, season in set(pairs):
+        key = (int(player_id), str(season), int(game_type))
+        if key in _memory_cache and is_fresh(key[1], _memory_cache[key][1], through_date):
+            metrics.cache('game_log_prefetch', True)
+            continue
+        row = read_cached_game_log(cursor, *key)
+        if row and is_fresh(key[1], row[1], through_date):
+            metrics.cache('game_log_prefetch', True)
+            continue
+        metrics.cache('game_log_prefetch', False)
+        keys.append(key)
+    return keys
+
+# Write a batch of downloaded logs ({key: data}) in one transaction
+def store_game_logs(logs):
+    conn = get_connection()
+    cursor = conn.cursor()
+    create_game_log_cache_table(conn)
+    today = date.today().isoformat()
+    for key, data in logs.items():
+        store_game_log(cursor, *key, data)
+        _memory_cache[key] = (data, today)
+    conn.commit()
+
+# Return the game-log JSON for a player/season, from memory, then the db, then the NHL API
+def get_game_log(player_id, season, game_type=2, through_date=None):
+    key = (int(player_id), str(season), int(game_type))
+    if key in _memory_cache:
+        data, fetched_date = _memory_cache[key]
+        if is_fresh(key[1], fetched_date, through_date):
+            metrics.cache('game_log', True)
+            return data
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    create_game_log_cache_table(conn)
+
+    row = read_cached_game_log(cursor, *key)
+    if row and is_fresh(key[1], row[1], through_date):
+        data = json.loads(row[0])
+        _memory_cache[key] = (data, row[1])
+        metrics.cache('game_log', True)
+        return data
+
+    metrics.cache('game_log', False)
+    data = download_game_log(*key)
+    if data is None:
+        # Fall back to a stale copy rather than nothing if the API is unavailable
+        return json.loads(row[0]) if row else None
+
+    store_game_log(cursor, *key, data)
+    conn.commit()
+    _memory_cache[key] = (data, date.today().isoformat())
+    return data
+
+# Make sure a player's logs for seasons are as fresh as get_game_log would keep them, downloading only the
+# stale ones (their games land in player_game_shots); nothing is parsed for logs that are already fresh.
+# Returns {season: (fetched_date, version)}, which changes whenever a season's stored games do.
+def refresh_game_logs(player_id, seasons, game_type=2, through_date=None):
+    conn = get_connection()
+    cursor = conn.cursor()
+    create_game_log_cache_table(conn)
+    versions = {}
+    for season in seasons:
+        key = (int(player_id), str(season), int(game_type))
+        if key in _memory_cache:
+            fetched_date = _memory_cache[key][1]
+        else:
+            cursor.execute('SELECT fetched_date FROM game_log_cache WHERE player_id = ? AND season = ? AND game_type = ?', key)
+            row = cursor.fetchone()
+            fetched_date = row[0] if row else None
+        if fetched_date is not None and is_fresh(key[1], fetched_date, through_date):
+            metrics.cache('game_log', True)
+        else:
+            metrics.cache('game_log', False)
+            data = download_game_log(*key)
+            # Keep a stale copy rather than nothing if the API is unavailable
+            if data is not None:
+                store_game_log(cursor, *key, data)
+                conn.commit()
+                fetched_date = date.today().isoformat()
+                _memory_cache[key] = (data, fetched_date)
+        versions[key[1]] = (fetched_date, _versions.get(key, 0))
+    return versions
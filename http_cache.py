@@ -0,0 +1,194 @@
+import os
+import time
+import zlib
+import threading
+from datetime import timedelta
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import requests # type: ignore
+from requests.structures import CaseInsensitiveDict # type: ignore
+import database
+import http_client
+import metrics
+
+# Conditional GETs for the NHL APIs. Each response that carries a validator (ETag / Last-Modified) is kept,
+# zlib-compressed, in a small SQLite store next to the main database (its own file, so the worker threads
+# writing to it never wait on a transaction held on nhl_player_shots.db). Later requests for the same url
+# send If-None-Match / If-Modified-Since and a 304 is answered from the stored body, so an unchanged
+# roster, game log or team summary costs a round trip but no download.
+#
+# Urls matching a STALE_WHILE_REVALIDATE rule are answered straight from the store while the entry is
+# younger than the rule's window, and revalidated in the background so the next call sees any change.
+# Only the standings and rosters use it: they change a few times a season and are read on every run.
+#
+# get(url) returns a requests.Response as if the server had sent a 200 with the body; its X-Cache header
+# says how it was served (miss, revalidated, stale).
+
+# Hosts whose responses are cached; odds requests (which cost quota and carry the API key) pass straight through
+CACHED_HOSTS = {'api-web.nhle.com', 'api.nhle.com'}
+
+# (path fragment, seconds a stored body may be served before revalidating)
+STALE_WHILE_REVALIDATE = [
+    ('/standings/now', 6 * 3600),
+    ('/roster/', 6 * 3600),
+]
+
+# Background revalidation threads; the executor's threads are joined at interpreter exit
+REVALIDATE_WORKERS = 2
+
+_local = threading.local()
+_lock = threading.Lock()
+_revalidating = set()
+_executor = None
+
+# The store lives beside whichever database is in use, so a temporary database gets a temporary cache
+def cache_path():
+    return f"{os.path.splitext(database.DATABASE_PATH)[0]}_http_cache.db"
+
+def create_http_cache_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS http_cache (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        body BLOB,
+        fetched_ts REAL,
+        validated_ts REAL
+    )
+    ''')
+    conn.commit()
+
+# Per-thread connection to the cache store, reopened after a fork or if the database path changes
+def get_cache_connection():
+    conn = getattr(_local, 'conn', None)
+    path = cache_path()
+    if conn is None or _local.pid != os.getpid() or _local.path != path:
+        conn = database.connect(path)
+        create_http_cache_table(conn)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = path
+    return conn
+
+def is_cached(url):
+    return urlparse(url).netloc in CACHED_HOSTS
+
+def stale_window(url):
+    path = urlparse(url).path
+    for fragment, seconds in STALE_WHILE_REVALIDATE:
+        if fragment in path:
+            return seconds
+    return 0
+
+# Stored (etag, last_modified, body, validated_ts) for a url, or None
+def load_entry(url):
+    cursor = get_cache_connection().cursor()
+    cursor.execute('SELECT etag, last_modified, body, validated_ts FROM http_cache WHERE url = ?', (url,))
+    row = cursor.fetchone()
+    return (row[0], row[1], zlib.decompress(row[2]), row[3]) if row else None
+
+def store_entry(url, response):
+    etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    if not (etag or last_modified or stale_window(url)):
+        return
+    now = time.time()
+    conn = get_cache_connection()
+    with database.transaction(conn):
+        conn.execute('''
+        INSERT OR REPLACE INTO http_cache (url, etag, last_modified, body, fetched_ts, validated_ts)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (url, etag, last_modified, zlib.compress(response.content), now, now))
+
+def touch_entry(url):
+    conn = get_cache_connection()
+    with database.transaction(conn):
+        conn.execute('UPDATE http_cache SET validated_ts = ? WHERE url = ?', (time.time(), url))
+
+def conditional_headers(entry):
+    headers = {}
+    if entry and entry[0]:
+        headers['If-None-Match'] = entry[0]
+    if entry and entry[1]:
+        headers['If-Modified-Since'] = entry[1]
+    return headers
+
+# A 200 response carrying a stored body; response (a 304) is reused when there is one
+def cached_response(url, entry, how, response=None):
+    if response is None:
+        response = requests.Response()
+        response.url = url
+        response.elapsed = timedelta(0)
+        response.headers = CaseInsensitiveDict()
+    response.status_code = 200
+    response._content = entry[2]
+    response.encoding = 'utf-8'
+    response.headers['X-Cache'] = how
+    return response
+
+# One conditional request; stores a new body, or answers a 304 from the stored one
+def revalidate(url, entry, timeout=http_client.DEFAULT_TIMEOUT, attempts=http_client.ATTEMPTS):
+    response = http_client.get(url, headers=conditional_headers(entry), timeout=timeout, attempts=attempts)
+    if response.status_code == 304 and entry:
+        touch_entry(url)
+        return cached_response(url, entry, 'revalidated', response)
+    if response.status_code == 200:
+        store_entry(url, response)
+        response.headers['X-Cache'] = 'miss'
+    return response
+
+def _background_revalidate(url, entry, timeout):
+    try:
+        revalidate(url, entry, timeout, attempts=1)
+    except requests.exceptions.RequestException as e:
+        print(f"Background revalidation of {url} failed: {e}")
+    finally:
+        with _lock:
+            _revalidating.discard(url)
+
+def schedule_revalidation(url, entry, timeout=http_client.DEFAULT_TIMEOUT):
+    global _executor
+    with _lock:
+        if url in _revalidating:
+            return
+        _revalidating.add(url)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix='http-cache')
+    _executor.submit(_background_revalidate, url, entry, timeout)
+
+# GET a url through the cache (and http_client's pooled sessions and retries). Connection errors and
+# timeouts that outlast the retries are raised as from http_client.get.
+def get(url, timeout=http_client.DEFAULT_TIMEOUT, attempts=http_client.ATTEMPTS):
+    if not is_cached(url):
+        return http_client.get(url, timeout=timeout, attempts=attempts)
+    entry = load_entry(url)
+    window = stale_window(url)
+    if entry and window and time.time() - entry[3] < window:
+        schedule_revalidation(url, entry, timeout)
+        response = cached_response(url, entry, 'stale')
+    else:
+        response = revalidate(url, entry, timeout, attempts)
+    if response.status_code == 200:
+        reused = response.headers['X-Cache'] != 'miss'
+        metrics.cache('http', reused)
+        if reused:
+            metrics.count('http_cache.bytes_reused', len(response.content))
+    return response
+
+# Drop entries not validated in the last max_age_days (players who retired, old boxscores)
+def prune(max_age_days=90):
+    conn = get_cache_connection()
+    with database.transaction(conn):
+        cursor = conn.execute('DELETE FROM http_cache WHERE validated_ts < ?', (time.time() - max_age_days * 86400,))
+    print(f"Pruned {cursor.rowcount} cached responses older than {max_age_days} days")
+    conn.execute('VACUUM')
+
+if __name__ == "__main__":
+    # Summarise the store, or prune it: python http_cache.py [prune [days]]
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'prune':
+        prune(int(sys.argv[2]) if len(sys.argv) > 2 else 90)
+    cursor = get_cache_connection().cursor()
+    cursor.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0), MIN(validated_ts) FROM http_cache')
+    entries, size, oldest = cursor.fetchone()
+    print(f"{cache_path()}: {entries} cached responses, {size / 1e6:.1f} MB compressed"
+          + (f", oldest validated {(time.time() - oldest) / 86400:.1f} days ago" if oldest else ''))
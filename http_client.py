@@ -0,0 +1,79 @@
+import os
+import time
+import threading
+from urllib.parse import urlparse
+import requests # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+import metrics
+
+# Every NHL and odds API request goes through get(). Each host gets one pooled requests.Session, shared by
+# all threads in the process, so a slate's hundreds of calls reuse a few keep-alive connections instead of
+# paying a TCP+TLS handshake each. Requests carry a (connect, read) timeout, and only connection errors,
+# timeouts and RETRYABLE_STATUS responses are retried, a bounded number of times with capped exponential
+# backoff (or the server's Retry-After). Any other status comes straight back for the caller to handle.
+
+# Status codes worth another attempt
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+ATTEMPTS = 3
+BACKOFF = 0.5
+MAX_BACKOFF = 8
+
+# Keep-alive connections kept per host; FetchEngine runs up to 8 workers against one host
+POOL_SIZE = 16
+
+_lock = threading.Lock()
+_sessions = {}
+_pid = None
+
+# The shared session for a url's host; sessions aren't carried across a fork
+def session_for(url):
+    global _pid
+    host = urlparse(url).netloc
+    with _lock:
+        if _pid != os.getpid():
+            _sessions.clear()
+            _pid = os.getpid()
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+    return session
+
+def close_sessions():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+def retry_delay(attempt, response=None, backoff=BACKOFF):
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        return min(int(retry_after), MAX_BACKOFF)
+    return min(backoff * 2 ** attempt, MAX_BACKOFF)
+
+# GET a url on its host's pooled session. Returns the response (possibly a retryable status once attempts
+# run out); raises the last ConnectionError / Timeout if every attempt failed to get one.
+def get(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, attempts=ATTEMPTS, backoff=BACKOFF):
+    session = session_for(url)
+    for attempt in range(attempts):
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            metrics.record_http(url, None, time.perf_counter() - start)
+            if attempt + 1 == attempts:
+                raise
+            response = None
+        else:
+            metrics.record_http(url, response)
+            if response.status_code not in RETRYABLE_STATUS or attempt + 1 == attempts:
+                return response
+        metrics.count(f"retry.{metrics.endpoint(url)}")
+        time.sleep(retry_delay(attempt, response, backoff))
@@ -0,0 +1,208 @@
+import numpy as np
+from functools import lru_cache
+from scipy.stats import norm, poisson # type: ignore
+
+# Vectorized likelihood engine: every (player, over/under, line) row for a day, or a whole season of rows
+# for a backtest, is scored in one pass instead of one calculate_likelihoods call per row.
+#
+# Shot histories are passed as padded histograms: row i, column k holds how many (weighted) games
+# that player had k shots in. A weighted_shots list (games repeated by their period weight) and its
+# histogram describe the same distribution, so the histogram form covers both the raw and weighted models.
+
+# CDF kernel. Lines are half-integers and shot counts small integers, so the Poisson CDF is only ever
+# needed at integer k for a continuous mean, and the normal CDF at one z per row. Both are tabulated once
+# on a uniform grid (per process, kept by an LRU of tables) and read back by linear interpolation, so a
+# sweep over many weightings and opposition factors never calls scipy per row. Rows off the grid (a mean
+# above POISSON_MAX_MEAN, k above POISSON_MAX_K, NaN) fall back to the exact scipy value.
+#
+# Error bound: linear interpolation with step h is off by at most h^2/8 * max|f''|.
+#   Poisson: d2/dmean2 P(X <= k) = pmf(k-1) - pmf(k), so |f''| <= 1 and the error is <= h^2/8.
+#   Normal: |phi'(z)| = |z| phi(z) <= phi(1) = 1/sqrt(2 pi e), so the error is <= phi(1) h^2/8; beyond
+#   |z| = 8 the CDF is within 1e-15 of 0 or 1 and is clamped.
+# Both bounds are attained (Poisson near mean 0, normal near |z| = 1), so the documented tolerances
+# POISSON_MAX_ERROR (1.9e-6) and NORMAL_MAX_ERROR (4.6e-7) are KERNEL_ERROR_MARGIN times the bound at
+# h = 1/512: the tables are built at half the step the tolerances need, and rounding in scipy or the
+# table can't push the kernel past them. verify_kernel() checks it against scipy.
+POISSON_STEP = 1 / 512
+POISSON_MAX_MEAN = 20.0
+POISSON_MAX_K = 32
+NORMAL_STEP = 1 / 512
+NORMAL_Z_MAX = 8.0
+NORMAL_MAX_SLOPE = np.exp(-0.5) / np.sqrt(2 * np.pi)
+POISSON_ERROR_BOUND = POISSON_STEP ** 2 / 8
+NORMAL_ERROR_BOUND = NORMAL_MAX_SLOPE * NORMAL_STEP ** 2 / 8
+KERNEL_ERROR_MARGIN = 4
+POISSON_MAX_ERROR = KERNEL_ERROR_MARGIN * POISSON_ERROR_BOUND
+NORMAL_MAX_ERROR = KERNEL_ERROR_MARGIN * NORMAL_ERROR_BOUND
+
+# (POISSON_MAX_K + 1) x grid table of P(X <= k) at means 0, step, 2 step, ..., max_mean
+@lru_cache(maxsize=4)
+def poisson_cdf_table(step=POISSON_STEP, max_mean=POISSON_MAX_MEAN, max_k=POISSON_MAX_K):
+    means = np.arange(int(round(max_mean / step)) + 1) * step
+    return poisson.cdf(np.arange(max_k + 1)[:, None], means[None, :])
+
+@lru_cache(maxsize=4)
+def normal_cdf_table(step=NORMAL_STEP, z_max=NORMAL_Z_MAX):
+    return norm.cdf(np.arange(-int(round(z_max / step)), int(round(z_max / step)) + 1) * step)
+
+# Grid index and interpolation weight of each x on a grid starting at 0 with the given step and size
+def grid_position(x, step, size):
+    position = x / step
+    index = np.clip(np.floor(position), 0, size - 2).astype(np.int64)
+    return index, position - index
+
+# P(X <= k) for X ~ Poisson(mean), elementwise; k below 0 gives 0
+def poisson_cdf(k, mean):
+    k, mean = np.broadcast_arrays(np.asarray(k, dtype=np.int64), np.asarray(mean, dtype=float))
+    table = poisson_cdf_table()
+    result = np.zeros(k.shape)
+    on_grid = (k >= 0) & (k <= POISSON_MAX_K) & (mean >= 0) & (mean <= POISSON_MAX_MEAN)
+    index, weight = grid_position(mean[on_grid], POISSON_STEP, table.shape[1])
+    rows = k[on_grid]
+    result[on_grid] = table[rows, index] * (1 - weight) + table[rows, index + 1] * weight
+    off_grid = ~on_grid & (k >= 0)
+    if off_grid.any():
+        result[off_grid] = poisson.cdf(k[off_grid], mean[off_grid])
+    return result
+
+def normal_cdf(z):
+    z = np.asarray(z, dtype=float)
+    table = normal_cdf_table()
+    index, weight = grid_position(np.nan_to_num(np.clip(z, -NORMAL_Z_MAX, NORMAL_Z_MAX)) + NORMAL_Z_MAX, NORMAL_STEP, len(table))
+    result = table[index] * (1 - weight) + table[index + 1] * weight
+    return np.where(np.isnan(z), np.nan, result)
+
+# Poisson probabilities of going strictly over / under each line: P(X > line), P(X < line)
+def poisson_over_under(thresholds, mean):
+    thresholds = np.asarray(thresholds, dtype=float)
+    return 1 - poisson_cdf(np.floor(thresholds), mean), poisson_cdf(np.ceil(thresholds) - 1, mean)
+
+# Normal probabilities of finishing over / under each z-scored line
+def normal_over_under(z):
+    cdf = normal_cdf(z)
+    return 1 - cdf, cdf
+
+# Compare the kernel with scipy on random means, thresholds and z values plus the usual 0.5..5.5 lines;
+# returns the largest (poisson, normal) differences, raising if either exceeds its documented tolerance
+def verify_kernel(samples=200000, seed=0):
+    rng = np.random.default_rng(seed)
+    k = np.concatenate([rng.integers(0, POISSON_MAX_K + 1, samples), np.repeat(np.arange(6), samples // 6)])
+    mean = np.concatenate([rng.uniform(0, POISSON_MAX_MEAN, samples), rng.uniform(0, 8, samples // 6 * 6)])
+    poisson_error = np.max(np.abs(poisson_cdf(k, mean) - poisson.cdf(k, mean)))
+    z = np.concatenate([rng.uniform(-NORMAL_Z_MAX - 1, NORMAL_Z_MAX + 1, samples), rng.normal(0, 1, samples)])
+    normal_error = np.max(np.abs(normal_cdf(z) - norm.cdf(z)))
+    print(f"Poisson CDF kernel: max error {poisson_error:.2e} (tolerance {POISSON_MAX_ERROR:.2e}); "
+          f"normal CDF kernel: max error {normal_error:.2e} (tolerance {NORMAL_MAX_ERROR:.2e})")
+    if poisson_error > POISSON_MAX_ERROR or normal_error > NORMAL_MAX_ERROR:
+        raise AssertionError("CDF kernel exceeds its documented error tolerance")
+    return poisson_error, normal_error
+
+# Turn a ragged list of per-row shot lists into a padded (rows x max_shots+1) count histogram
+def shots_to_histograms(shot_lists, width=None):
+    lengths = np.array([len(shots) for shots in shot_lists])
+    flat = np.concatenate([np.asarray(shots, dtype=np.int64) for shots in shot_lists]) if lengths.sum() else np.zeros(0, dtype=np.int64)
+    if width is None:
+        width = int(flat.max()) + 1 if flat.size else 1
+    rows = np.repeat(np.arange(len(shot_lists)), lengths)
+    counts = np.bincount(rows * width + np.minimum(flat, width - 1), minlength=len(shot_lists) * width)
+    return counts.reshape(len(shot_lists), width).astype(float)
+
+# Widen two histograms to a common number of shot columns
+def pad_histograms(a, b):
+    width = max(a.shape[1], b.shape[1])
+    return np.pad(a, ((0, 0), (0, width - a.shape[1]))), np.pad(b, ((0, 0), (0, width - b.shape[1])))
+
+# Weighted mean and standard deviation of each histogram row
+def histogram_moments(hist):
+    values = np.arange(hist.shape[1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = hist.sum(axis=1)
+        mean = hist @ values / total
+        variance = hist @ values ** 2 / total - mean ** 2
+    return mean, np.sqrt(np.maximum(variance, 0))
+
+# Fraction of each row's games strictly over / under its threshold
+def empirical_probability(hist, thresholds, is_over):
+    values = np.arange(hist.shape[1])
+    over_mask = values[None, :] > thresholds[:, None]
+    under_mask = values[None, :] < thresholds[:, None]
+    mask = np.where(is_over[:, None], over_mask, under_mask)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (hist * mask).sum(axis=1) / hist.sum(axis=1)
+
+# Score a batch of rows. All arguments are arrays with one entry (or histogram row) per prop:
+#   raw_hist / weighted_hist: padded shot histograms (see shots_to_histograms)
+#   thresholds: the line (e.g. 2.5), is_over: True for Over rows, opposition_factor: multiplier on the mean
+#   implied_likelihood: 1 / best decimal price, used for the Poisson Kelly fraction
+# Returns normal, poisson, raw-data and weighted likelihoods plus the Poisson Kelly fraction, one entry per row.
+# The normal and Poisson probabilities come from the CDF kernel (within POISSON_MAX_ERROR / NORMAL_MAX_ERROR
+# of scipy), or straight from scipy with exact=True.
+def calculate_likelihoods_batch(raw_hist, weighted_hist, thresholds, is_over, opposition_factor=None, implied_likelihood=None, exact=False):
+    raw_hist, weighted_hist = pad_histograms(np.asarray(raw_hist, dtype=float), np.asarray(weighted_hist, dtype=float))
+    thresholds = np.asarray(thresholds, dtype=float)
+    is_over = np.asarray(is_over, dtype=bool)
+    opposition_factor = np.ones(len(thresholds)) if opposition_factor is None else np.asarray(opposition_factor, dtype=float)
+
+    mean, std = histogram_moments(weighted_hist)
+    mean = mean * opposition_factor
+    std = std * opposition_factor
+
+    # Normal model; a zero-variance history degenerates to a step at the mean, and a history with no
+    # (weighted) games has no mean, so every model gives NaN for it
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(std > 0, (thresholds - mean) / np.where(std > 0, std, 1), np.where(thresholds >= mean, np.inf, -np.inf))
+    z = np.where(np.isnan(mean), np.nan, z)
+    if exact:
+        normal_over, normal_under = norm.sf(z), norm.cdf(z)
+    else:
+        normal_over, normal_under = normal_over_under(z)
+    normal_likelihood = np.where(is_over, normal_over, normal_under)
+
+    # Poisson model: over = P(X > line), under = P(X < line)
+    if exact:
+        over, under = poisson.sf(np.floor(thresholds), mean), poisson.cdf(np.ceil(thresholds) - 1, mean)
+    else:
+        over, under = poisson_over_under(thresholds, mean)
+    poisson_likelihood = np.where(is_over, over, under)
+
+    raw_data_likelihood = empirical_probability(raw_hist, thresholds, is_over)
+    weighted_likelihood = empirical_probability(weighted_hist, thresholds, is_over)
+
+    poisson_kelly = None
+    if implied_likelihood is not None:
+        price = 1 / np.asarray(implied_likelihood, dtype=float)
+        poisson_kelly = kelly_criterion_batch(poisson_likelihood, price)
+    return normal_likelihood, poisson_likelihood, raw_data_likelihood, weighted_likelihood, poisson_kelly
+
+def kelly_criterion_batch(probability, odds):
+    return probability - (1 - probability) / (odds - 1)
+
+# Convenience wrapper taking the same per-row inputs as player_api.calculate_likelihoods:
+# rows of (shots, weighted_shots, over_under, shots_threshold, opposition_factor[, implied_likelihood])
+def score_rows(rows, exact=False):
+    rows = list(rows)
+    raw_hist = shots_to_histograms([row[0] for row in rows])
+    weighted_hist = shots_to_histograms([row[1] for row in rows])
+    thresholds = [row[3] for row in rows]
+    is_over = [row[2] == 'Over' for row in rows]
+    opposition_factor = [row[4] if len(row) > 4 else 1 for row in rows]
+    implied_likelihood = [row[5] for row in rows] if rows and len(rows[0]) > 5 else None
+    return calculate_likelihoods_batch(raw_hist, weighted_hist, thresholds, is_over, opposition_factor, implied_likelihood, exact)
+
+# Check the batch engine against a scalar implementation (player_api.calculate_likelihoods by default)
+# row for row; returns the largest absolute difference seen in each of the four likelihood columns, inf
+# where only one side is NaN
+def compare_with_scalar(rows, scalar=None, atol=1e-9):
+    if scalar is None:
+        from player_api import calculate_likelihoods as scalar
+    rows = list(rows)
+    batch = np.column_stack(score_rows(rows, exact=True)[:4])
+    expected = np.array([scalar(*row[:5]) for row in rows], dtype=float)
+    mismatch = np.isnan(batch) != np.isnan(expected)
+    differences = np.nanmax(np.where(mismatch, np.inf, np.abs(batch - expected)), axis=0)
+    if not np.all(differences <= atol):
+        print(f"Batch likelihoods differ from scalar results by up to {differences}")
+    return differences
+
+if __name__ == "__main__":
+    verify_kernel()
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Run instrumentation. While a run is active (metrics.run(), used by main.main and `nhl-shots daily`)
+# stages, HTTP endpoints and SQL statements are timed, and HTTP calls, cache hits and misses and retries
+# are counted. At the end the totals are written to the run_metrics table and to
+# logs/run_metrics_<run_id>.json and a short summary is printed; with profile=True a cProfile dump of the
+# whole run goes next to the JSON. Outside a run every hook returns straight away.
+
+# Get the directory of the current script
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+LOG_DIR = os.path.join(script_dir, 'logs')
+
+# How many of the slowest timers / SQL statements the printed summary lists
+SUMMARY_ROWS = 10
+
+_lock = threading.Lock()
+_timers = {}     # name -> [count, total_seconds, max_seconds]
+_counters = {}   # name -> count
+_profilers = []  # cProfile profilers of work run in other threads (see profiled)
+enabled = False
+profiling = False
+run_id = None
+
+def reset():
+    global enabled, profiling, run_id
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _profilers.clear()
+    enabled = profiling = False
+    run_id = None
+
+def record_time(name, seconds):
+    if not enabled:
+        return
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            _timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+def count(name, n=1):
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+@contextmanager
+def timer(name):
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+def cache(name, hit):
+    count(f"cache.{name}.{'hit' if hit else 'miss'}")
+
+# cProfile only sees the thread it was enabled in, so work handed to worker threads (the pipeline
+# stages) runs under its own profiler, merged into the run's dump at the end
+def profiled(function, *args):
+    if not profiling:
+        return function(*args)
+    import cProfile
+    profiler = cProfile.Profile()
+    with _lock:
+        _profilers.append(profiler)
+    return profiler.runcall(function, *args)
+
+# Ids, dates, seasons, team codes and event hashes in a url path become {} so calls group by endpoint
+def endpoint(url):
+    parsed = urlparse(url)
+    segments = ['{}' if re.fullmatch(r'\d[\d-]*|[0-9a-f]{16,}|[A-Z]{3}', segment) else segment
+                for segment in parsed.path.split('/')]
+    return parsed.netloc + '/'.join(segments)
+
+# One HTTP call: response is the requests response, or None if the request raised
+def record_http(url, response, seconds=None):
+    if not enabled:
+        return
+    name = endpoint(url)
+    if seconds is None and response is not None:
+        seconds = response.elapsed.total_seconds()
+    record_time(f"http.{name}", seconds or 0.0)
+    count(f"http_status.{response.status_code if response is not None else 'error'}.{name}")
+
+# Statements are grouped by their text with whitespace collapsed and cut to 120 characters
+def sql_key(sql):
+    return ' '.join(sql.split())[:120]
+
+def record_sql(sql, seconds):
+    record_time(f"sql.{sql_key(sql)}", seconds)
+
+def snapshot():
+    with _lock:
+        return {name: list(timer) for name, timer in _timers.items()}, dict(_counters)
+
+# Hit rate of every cache counted with cache(name, hit)
+def cache_rates(counters):
+    rates = {}
+    for name in {key.split('.')[1] for key in counters if key.startswith('cache.')}:
+        hits, misses = counters.get(f"cache.{name}.hit", 0), counters.get(f"cache.{name}.miss", 0)
+        rates[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else None}
+    return rates
+
+def summary():
+    timers, counters = snapshot()
+    by_prefix = lambda prefix: {name[len(prefix):]: {'count': t[0], 'seconds': round(t[1], 4), 'max_seconds': round(t[2], 4)}
+                                for name, t in sorted(timers.items(), key=lambda item: -item[1][1]) if name.startswith(prefix)}
+    http = by_prefix('http.')
+    for name, n in counters.items():
+        if name.startswith('http_status.'):
+            status, endpoint_name = name[len('http_status.'):].split('.', 1)
+            http.setdefault(endpoint_name, {}).setdefault('status', {})[status] = n
+    return {
+        'run_id': run_id,
+        'stages': by_prefix('stage.'),
+        'timers': {name: value for name, value in by_prefix('').items() if not name.startswith(('stage.', 'http.', 'sql.'))},
+        'http': http,
+        'caches': cache_rates(counters),
+        'retries': {name[len('retry.'):]: n for name, n in counters.items() if name.startswith('retry.')},
+        'sql': by_prefix('sql.'),
+        'counters': {name: n for name, n in counters.items() if not name.startswith(('cache.', 'retry.', 'http_status.'))},
+    }
+
+def create_run_metrics_table(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS run_metrics (
+        id INTEGER PRIMARY KEY,
+        run_id TEXT,
+        metric TEXT,
+        kind TEXT,
+        count INTEGER,
+        total_seconds REAL,
+        max_seconds REAL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_run_metrics_metric ON run_metrics (metric, run_id)")
+    conn.commit()
+
+def write_metrics(conn):
+    from database import transaction
+    timers, counters = snapshot()
+    create_run_metrics_table(conn)
+    rows = [(run_id, name, 'timer', t[0], t[1], t[2]) for name, t in timers.items()]
+    rows += [(run_id, name, 'counter', n, None, None) for name, n in counters.items()]
+    with transaction(conn):
+        conn.cursor().executemany('''
+        INSERT INTO run_metrics (run_id, metric, kind, count, total_seconds, max_seconds)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+def print_summary(data):
+    print(f"Run {data['run_id']} metrics:")
+    for title, section in [('stage', data['stages']), ('endpoint', data['http']), ('timer', data['timers'])]:
+        rows = [(name, value) for name, value in section.items() if 'count' in value][:SUMMARY_ROWS]
+        if rows:
+            print(f"  {title:<60} {'calls':>7} {'seconds':>9}")
+            for name, value in rows:
+                print(f"  {name[:60]:<60} {value['count']:>7} {value['seconds']:>9.2f}")
+    for name, rate in sorted(data['caches'].items()):
+        if rate['hit_rate'] is not None:
+            print(f"  cache {name}: {rate['hits']} hits, {rate['misses']} misses ({rate['hit_rate']:.0%})")
+    for name, n in sorted(data['retries'].items()):
+        print(f"  retries {name}: {n}")
+    sql = list(data['sql'].items())[:SUMMARY_ROWS]
+    if sql:
+        print(f"  slowest SQL ({sum(value['count'] for value in data['sql'].values())} statements, "
+              f"{sum(value['seconds'] for value in data['sql'].values()):.2f}s):")
+        for name, value in sql:
+            print(f"  {value['seconds']:>9.3f}s {value['count']:>7}x  {name[:80]}")
+
+# Collect metrics for the enclosed block, then store, dump and print them
+@contextmanager
+def run(profile=False, conn=None, log_dir=None):
+    global enabled, profiling, run_id
+    reset()
+    enabled = True
+    profiling = profile
+    run_id = datetime.now().strftime('%Y-%m-%dT%H%M%S')
+    log_dir = log_dir or LOG_DIR
+    os.makedirs(log_dir, exist_ok=True)
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield run_id
+    finally:
+        if profiler:
+            profiler.disable()
+        record_time('run.total', time.perf_counter() - start)
+        enabled = profiling = False
+        data = summary()
+        with open(os.path.join(log_dir, f"run_metrics_{run_id}.json"), 'w') as file:
+            json.dump(data, file, indent=2)
+        if conn is None:
+            from database import get_connection
+            conn = get_connection()
+        write_metrics(conn)
+        print_summary(data)
+        if profiler:
+            import pstats
+            stats = pstats.Stats(profiler)
+            for thread_profiler in _profilers:
+                stats.add(thread_profiler)
+            profile_path = os.path.join(log_dir, f"profile_{run_id}.prof")
+            stats.dump_stats(profile_path)
+            print(f"Wrote cProfile dump to {profile_path}; top functions by cumulative time:")
+            stats.sort_stats('cumulative').print_stats(15)
+
+if __name__ == "__main__":
+    # Compare the totals of the last few runs: python metrics.py [metric prefix] [runs]
+    import sys
+    from database import get_connection
+    prefix = sys.argv[1] if len(sys.argv) > 1 else 'stage.'
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    cursor = get_connection().cursor()
+    create_run_metrics_table(get_connection())
+    cursor.execute("SELECT DISTINCT run_id FROM run_metrics ORDER BY run_id DESC LIMIT ?", (runs,))
+    run_ids = [row[0] for row in cursor.fetchall()][::-1]
+    cursor.execute(f'''
+    SELECT metric, run_id, COALESCE(total_seconds, count) FROM run_metrics
+    WHERE metric LIKE ? AND run_id IN ({', '.join('?' for _ in run_ids)})
+    ''', [f"{prefix}%"] + run_ids)
+    table = {}
+    for metric, run, value in cursor.fetchall():
+        table.setdefault(metric, {})[run] = value
+    print(f"{'metric':<50}" + ''.join(f"{run[5:15]:>12}" for run in run_ids))
+    for metric in sorted(table):
+        print(f"{metric[:50]:<50}" + ''.join(f"{table[metric].get(run, float('nan')):>12.2f}" for run in run_ids))
@@ -0,0 +1,161 @@
+import numpy as np
+from datetime import datetime, timedelta
+from database import get_connection, transaction
+from shot_store import get_shot_history, SEASONS, MAX_SHOTS
+from fetch_engine import FetchEngine
+from roster_index import resolve_player
+from team_avg_SA import get_opposition_factors
+from likelihoods import calculate_likelihoods_batch
+from setup_database import create_player_models
+import metrics
+
+# Sweep mode: load every player's shot history once and score a whole grid of recency weightings
+# (x_10, x_2024, x_2023, x_2022) and opposition adjustments as matrix operations, instead of one
+# weight_test.py / opposition_test.py pass over the NHL API per variant.
+
+# The variants run every day by the pipeline (and by python model_sweep.py)
+DEFAULT_WEIGHTINGS = [(5, 3, 2, 1), (4, 4, 2, 1), (3, 3, 3, 1), (6, 3, 1, 0)]
+DEFAULT_OPPOSITION_ADJUSTS = (0, 0.1, 0.5)
+
+def variant_table_name(weights, opposition_adjust=0, prefix='modelled_likelihoods'):
+    name = f"{prefix}_w{'_'.join(str(w).replace('.', 'p') for w in weights)}"
+    if opposition_adjust:
+        name += f"_opp{str(opposition_adjust).replace('.', 'p')}"
+    return name
+
+# Best price (from best_lines) for every prop not yet modelled in at least one of the variant tables. The
+# anti-joins use each model table's (date, player_name, over_under, points) index, and only the dates
+# with unmodelled props are read back to see which tables already have which rows.
+def load_props(cursor, tables, start_date):
+    unmodelled = ' OR '.join(f'''NOT EXISTS (SELECT 1 FROM {table} ml WHERE ml.date = bl.date AND ml.player_name = bl.player_name
+                                AND ml.over_under = bl.over_under AND ml.points = bl.points)''' for table in tables)
+    cursor.execute(f'''
+    SELECT date, player_name, over_under, points, home_team, away_team, best_price
+    FROM best_lines bl
+    WHERE date >= ? AND ({unmodelled})
+    ''', (start_date,))
+    props = cursor.fetchall()
+    dates = sorted({prop[0] for prop in props})
+    modelled = {}
+    for table in tables:
+        modelled[table] = set()
+        for i in range(0, len(dates), 500):
+            chunk = dates[i:i + 500]
+            cursor.execute(f"SELECT date, player_name, over_under, points FROM {table} WHERE date IN ({', '.join('?' for _ in chunk)})", chunk)
+            modelled[table].update(cursor.fetchall())
+    return props, modelled
+
+# (date, player_name, home_team, away_team) of a best_lines prop row, the key players are resolved by
+def prop_key(prop):
+    return prop[0], prop[1], prop[4], prop[5]
+
+# Resolve every prop's player (through today's roster index unless resolved is given) and load their shot
+# histories over seasons, fetching all missing game logs in one batch. Returns
+# ({prop_key: (player_id, player_team, opposing_team) or None}, {player_id: history}).
+def load_histories(props, engine=None, seasons=SEASONS, resolved=None):
+    if resolved is None:
+        by_matchup, resolved = {}, {}
+        for prop in props:
+            date, player_name, home_team, away_team = prop_key(prop)
+            if (player_name, home_team, away_team) not in by_matchup:
+                by_matchup[(player_name, home_team, away_team)] = resolve_player(home_team, away_team, player_name)
+            resolved[prop_key(prop)] = by_matchup[(player_name, home_team, away_team)]
+    player_ids = {info[0] for info in resolved.values() if info}
+    latest_date = max(prop[0] for prop in props)
+    through_date = (datetime.strptime(latest_date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    (engine or FetchEngine()).prefetch_game_logs([(player_id, season) for player_id in player_ids for season in seasons], through_date=through_date)
+    histories = {player_id: get_shot_history(player_id, through_date, seasons) for player_id in player_ids}
+    return resolved, histories
+
+# The props that can be scored, with their per-period shot histograms as of the prop date (only games
+# before it) and their (date, opposing_team) slate entries. seasons_for maps a prop date to the seasons
+# its weights apply to; by default every prop uses the configured seasons.
+def build_rows(props, resolved, histories, seasons_for=None):
+    rows, hists, slate = [], [], []
+    for prop in props:
+        date, player_name, over_under, points, home_team, away_team, price = prop
+        info = resolved[prop_key(prop)]
+        if not info:
+            continue
+        player_id, _, opposing_team = info
+        # Periods in the order of the weight vectors: last 10 games, this season, then the previous seasons
+        hist = histories[player_id].period_histograms(date, seasons_for(date) if seasons_for else SEASONS)
+        if hist[1:].sum() == 0:
+            continue
+        rows.append(prop)
+        hists.append(hist)
+        slate.append((date, opposing_team))
+    return rows, np.array(hists), slate
+
+# Score rows under every (weights, opposition_adjust) variant. base_factors are the opposition factors
+# at full adjustment; smaller adjustments scale their distance from 1. Returns one list of model-table
+# rows (player_name, date, over_under, points, implied_likelihood, normal, poisson, raw, weighted, kelly)
+# per variant.
+def score_variants(rows, hists, base_factors, variants):
+    thresholds = np.array([row[3] for row in rows], dtype=float)
+    is_over = np.array([row[2] == 'Over' for row in rows])
+    implied_likelihood = np.array([1 / row[6] for row in rows])
+
+    # (variants x periods) weights against (rows x periods x shots) histograms -> (variants x rows x shots)
+    weight_matrix = np.array([weights for weights, _ in variants], dtype=float)
+    weighted_hists = np.einsum('vp,rpk->vrk', weight_matrix, hists)
+    raw_hist = hists[:, 1:, :].sum(axis=1)
+    adjusts = np.array([adjust for _, adjust in variants], dtype=float)
+    factors = 1 + (np.asarray(base_factors, dtype=float)[None, :] - 1) * adjusts[:, None]
+
+    n_variants, n_rows = len(variants), len(rows)
+    normal, poisson_l, raw_l, weighted_l, kelly = calculate_likelihoods_batch(
+        np.tile(raw_hist, (n_variants, 1)),
+        weighted_hists.reshape(n_variants * n_rows, MAX_SHOTS),
+        np.tile(thresholds, n_variants),
+        np.tile(is_over, n_variants),
+        factors.reshape(-1),
+        np.tile(implied_likelihood, n_variants),
+    )
+    scored = []
+    for v in range(n_variants):
+        scored.append([(row[1], row[0], row[2], row[3], implied_likelihood[r],
+                        *(float(values[v * n_rows + r]) for values in (normal, poisson_l, raw_l, weighted_l, kelly)))
+                       for r, row in enumerate(rows)])
+    return scored
+
+def insert_model_rows(cursor, table, batch):
+    cursor.executemany(f'''
+    INSERT INTO {table} (player_name, date, over_under, points, implied_likelihood, normal_likelihood,
+                         poisson_likelihood, raw_data_likelihood, weighted_likelihood, poisson_kelly)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', batch)
+
+# Score every (weights, opposition_adjust) combination for all unmodelled props and write each
+# variant to its own modelled_likelihoods_* table in a single transaction. Returns the table names.
+def sweep_weightings(weightings, opposition_adjusts=(0,), start_date='1900-01-01', engine=None):
+    variants = [(tuple(weights), adjust) for weights in weightings for adjust in opposition_adjusts]
+    tables = [variant_table_name(weights, adjust) for weights, adjust in variants]
+    for table in tables:
+        create_player_models(table)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    props, modelled = load_props(cursor, tables, start_date)
+    print(f"Found {len(props)} props to model across {len(variants)} variants.")
+    if not props:
+        return tables
+
+    with metrics.timer('sweep.load_histories'):
+        resolved, histories = load_histories(props, engine)
+        rows, hists, slate = build_rows(props, resolved, histories)
+    if not rows:
+        return tables
+    with metrics.timer('sweep.score'):
+        base_factors = get_opposition_factors(slate, 1) if any(opposition_adjusts) else np.ones(len(rows))
+        scored = score_variants(rows, hists, base_factors, variants)
+
+    with transaction(conn):
+        for table, table_rows in zip(tables, scored):
+            batch = [row for row in table_rows if (row[1], row[0], row[2], row[3]) not in modelled[table]]
+            insert_model_rows(cursor, table, batch)
+            print(f"Wrote {len(batch)} rows to {table}.")
+    return tables
+
+if __name__ == "__main__":
+    sweep_weightings(DEFAULT_WEIGHTINGS, opposition_adjusts=DEFAULT_OPPOSITION_ADJUSTS)
@@ -1,127 +1,195 @@
 import os
-import requests # type: ignore
-import sqlite3
-from datetime import datetime, timedelta
-from config import API_KEY, SPORT, REGIONS, MARKETS, ODDS_FORMAT, DATE_FORMAT, DATABASE
-
-# Set this variable to 'y' if you want to print to console
-print_to_console = 'y'
-
-# Calculate today's date in ISO format
-today = datetime.now().date().isoformat()
-
-# Get the directory of the current script
-script_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Connect to the database
-conn = sqlite3.connect(os.path.join(script_dir, DATABASE))
-cursor = conn.cursor()
-
-# Check if there are already any odds in the database for today
-cursor.execute('SELECT COUNT(*) FROM player_shots_odds WHERE date = ?', (today,))
-odds_count = cursor.fetchone()[0]
-
-if odds_count > 0:
-    print('Odds for today are already in the database.')
-else:
-    # Step 1: Get a list of upcoming NHL events
-    events_response = requests.get(
-        f'https://api.the-odds-api.com/v4/sports/{SPORT}/events',
+import sys
+import json
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from config import API_KEY, SPORT, REGIONS, MARKETS, ODDS_FORMAT, DATE_FORMAT
+from database import get_connection, transaction
+from setup_database import create_player_shots_odds
+from odds_quota import QuotaScheduler, record_usage, event_prop_counts
+from best_lines import refresh_best_lines
+import http_client
+
+ODDS_API_URL = 'https://api.the-odds-api.com/v4'
+
+# Print an error payload from the-odds-api, returning True if the response was one
+def report_api_error(data, print_to_console='y'):
+    if isinstance(data, dict) and 'error_code' in data:
+        if print_to_console == 'y':
+            print(f"Error: {data['message']}")
+            print(f"Error Code: {data['error_code']}")
+            print(f"Details: {data['details_url']}")
+        return True
+    return False
+
+# Step 1: Get a list of upcoming NHL events; None if the request failed
+def get_events(print_to_console='y'):
+    events_response = http_client.get(
+        f'{ODDS_API_URL}/sports/{SPORT}/events',
         params={
             'api_key': API_KEY,
             'regions': REGIONS,
             'dateFormat': DATE_FORMAT,
         }
     )
-
     try:
         events_data = events_response.json()
     except ValueError:
         print('Error: Response is not in JSON format')
-        events_data = []
-
-    # Check for error messages in the response
-    if isinstance(events_data, dict) and 'error_code' in events_data:
-        if print_to_console == 'y':
-            print(f"Error: {events_data['message']}")
-            print(f"Error Code: {events_data['error_code']}")
-            print(f"Details: {events_data['details_url']}")
-        events_data = []
-
-    # Step 2: Extract the event ID for the next game
-    if events_data:
-        date = datetime.now().date().isoformat()
-
-        for event in events_data:
-            event_id = event['id']
-            home_team = event['home_team']
-            away_team = event['away_team']
-            print(f"Processing {away_team} at {home_team}, ID: {event_id}")
-
-            # Step 3: Use the event ID to query the odds for the player shots on goal props
-            event_odds_response = requests.get(
-                f'https://api.the-odds-api.com/v4/sports/{SPORT}/events/{event_id}/odds',
-                params={
-                    'api_key': API_KEY,
-                    'regions': REGIONS,
-                    'markets': 'player_shots_on_goal',
-                    'oddsFormat': ODDS_FORMAT,
-                    'dateFormat': DATE_FORMAT,
-                }
-            )
-
-            try:
-                event_odds_data = event_odds_response.json()
-            except ValueError:
-                print('Error: Response is not in JSON format')
-                event_odds_data = []
-
-            # Check for error messages in the response
-            if isinstance(event_odds_data, dict) and 'error_code' in event_odds_data:
-                print(f"Error: {event_odds_data['message']}")
-                print(f"Error Code: {event_odds_data['error_code']}")
-                print(f"Details: {event_odds_data['details_url']}")
-                event_odds_data = []
-
-            # Collect player shots on goal props
-            player_props = {}
-            for bookmaker in event_odds_data.get('bookmakers', []):
-                for market in bookmaker.get('markets', []):
-                    if market['key'] == 'player_shots_on_goal':
-                        for outcome in market['outcomes']:
-                            player_name = outcome['description']
-                            if player_name not in player_props:
-                                player_props[player_name] = []
-                            player_props[player_name].append({
-                                'bookmaker': bookmaker['title'],
-                                'over_under': outcome['name'],
-                                'price': outcome['price'],
-                                'points': outcome['point'],
-                                'home_team': home_team,
-                                'away_team': away_team
-                            })
-
-            # Store player shots on goal props in the database
-            for player, props in player_props.items():
-                for prop in props:
-                    cursor.execute('''
-                    INSERT INTO player_shots_odds (event_id, home_team, away_team, player_name, bookmaker, over_under, price, points, date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (event_id, prop['home_team'], prop['away_team'], player, prop['bookmaker'], prop['over_under'], prop['price'], prop['points'], date))
-        
-        conn.commit()
-
-        # Print the player shots on goal props organized by player
-        if print_to_console == 'y':
-            for player, props in player_props.items():
-                print(f"Player: {player}")
-                for prop in props:
-                    print(f"  Bookmaker: {prop['bookmaker']}, Over/Under: {prop['over_under']}, Price: {prop['price']}, Points: {prop['points']}, Home Team: {prop['home_team']}, Away Team: {prop['away_team']}")
-    else:
+        return None, events_response.headers
+    if report_api_error(events_data, print_to_console):
+        return None, events_response.headers
+    return events_data, events_response.headers
+
+# Step 2: Use the event ID to query the odds for the player shots on goal props
+def get_event_odds(event_id, print_to_console='y'):
+    event_odds_response = http_client.get(
+        f'{ODDS_API_URL}/sports/{SPORT}/events/{event_id}/odds',
+        params={
+            'api_key': API_KEY,
+            'regions': REGIONS,
+            'markets': 'player_shots_on_goal',
+            'oddsFormat': ODDS_FORMAT,
+            'dateFormat': DATE_FORMAT,
+        }
+    )
+    try:
+        event_odds_data = event_odds_response.json()
+    except ValueError:
+        print('Error: Response is not in JSON format')
+        event_odds_data = {}
+    if report_api_error(event_odds_data, print_to_console):
+        event_odds_data = {}
+    return event_odds_data, event_odds_response.headers
+
+# Flatten one event's odds into player_shots_odds rows
+def prop_rows(event, event_odds_data, date, snapshot_ts):
+    rows = []
+    for bookmaker in event_odds_data.get('bookmakers', []):
+        for market in bookmaker.get('markets', []):
+            if market['key'] == 'player_shots_on_goal':
+                for outcome in market['outcomes']:
+                    rows.append((event['id'], event['home_team'], event['away_team'], outcome['description'], bookmaker['title'],
+                                 outcome['name'], outcome['price'], outcome['point'], date, snapshot_ts))
+    return rows
+
+# Save one snapshot's raw events and event odds as <archive_dir>/<date>/<snapshot_ts>.json, the layout
+# replay.ArchiveSource reads back
+def archive_snapshot(archive_dir, date, snapshot_ts, events_data, event_odds):
+    day_dir = os.path.join(archive_dir, date)
+    os.makedirs(day_dir, exist_ok=True)
+    with open(os.path.join(day_dir, f"{snapshot_ts.replace(':', '')}.json"), 'w') as file:
+        json.dump({'snapshot_ts': snapshot_ts, 'date': date, 'events': events_data, 'odds': event_odds}, file)
+
+# Latest price stored on date for every (event_id, bookmaker, player_name, over_under, points) of the given
+# events; None where the book has since pulled the line
+def latest_prices(cursor, event_ids, date):
+    if not event_ids:
+        return {}
+    cursor.execute(f'''
+    SELECT event_id, bookmaker, player_name, over_under, points, price
+    FROM player_shots_odds pso
+    WHERE date = ? AND event_id IN ({', '.join('?' for _ in event_ids)})
+    AND snapshot_ts = (SELECT MAX(snapshot_ts) FROM player_shots_odds l
+                       WHERE l.date = pso.date AND l.event_id = pso.event_id AND l.bookmaker = pso.bookmaker
+                       AND l.player_name = pso.player_name AND l.over_under = pso.over_under AND l.points = pso.points)
+    ''', [date] + list(event_ids))
+    return {row[:5]: row[5] for row in cursor.fetchall()}
+
+# Rows recording that a book has pulled a line: a NULL price for every (event_id, bookmaker, player_name,
+# over_under, points) with a live price in previous that an answered event's fresh odds no longer quote
+def pulled_rows(previous, rows, events, date, snapshot_ts):
+    quoted = {(row[0], row[4], row[3], row[5], row[7]) for row in rows}
+    pulled = []
+    for key, price in previous.items():
+        event_id, bookmaker, player_name, over_under, points = key
+        if price is not None and event_id in events and key not in quoted:
+            event = events[event_id]
+            pulled.append((event_id, event['home_team'], event['away_team'], player_name, bookmaker, over_under, None, points, date, snapshot_ts))
+    return pulled
+
+# Fetch every event's player shots props concurrently and store a snapshot of them. Only props whose price
+# is new or has moved since the last snapshot stored for today are written (so the first snapshot of a day
+# is always complete), along with a NULL-price row for every line a book has pulled since, in a single
+# short transaction; the function can be run repeatedly through the day to record line movement. With refresh=False (the daily
+# default) nothing is fetched if today's odds are already stored. Which events are fetched is decided by
+# the quota scheduler (runs_per_day is the number of daily plus intraday runs planned). With archive_dir
+# the raw responses are also saved for replay.py. Returns the number of rows written, or None if the events
+# request (or every event odds request) failed, so the caller can retry.
+def ingest_odds(refresh=False, snapshot_ts=None, max_workers=6, runs_per_day=1, print_to_console='y', archive_dir=None):
+    today = datetime.now().date().isoformat()
+    snapshot_ts = snapshot_ts or datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    create_player_shots_odds()
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    # Check if there are already any odds in the database for today
+    if not refresh:
+        cursor.execute('SELECT COUNT(*) FROM player_shots_odds WHERE date = ?', (today,))
+        if cursor.fetchone()[0] > 0:
+            print('Odds for today are already in the database.')
+            return 0
+
+    events_data, headers = get_events(print_to_console)
+    record_usage([('events', None, headers)])
+    if events_data is None:
+        print('Could not fetch the NHL events list.')
+        return None
+    if not events_data:
         print('No upcoming NHL events found.')
+        return 0
+
+    scheduler = QuotaScheduler(runs_per_day=runs_per_day)
+    events_data = scheduler.plan(events_data, event_prop_counts(cursor, [event['id'] for event in events_data]), refresh)
+    for event in events_data:
+        print(f"Processing {event['away_team']} at {event['home_team']}, ID: {event['id']}")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        responses = list(pool.map(lambda event: get_event_odds(event['id'], print_to_console), events_data))
+    record_usage([('event_odds', event['id'], event_headers) for event, (_, event_headers) in zip(events_data, responses)])
+
+    if archive_dir:
+        archive_snapshot(archive_dir, today, snapshot_ts, events_data, {event['id']: data for event, (data, _) in zip(events_data, responses)})
+
+    rows = []
+    for event, (event_odds_data, event_headers) in zip(events_data, responses):
+        rows.extend(prop_rows(event, event_odds_data, today, snapshot_ts))
+        headers = event_headers
+
+    # Drop props whose price hasn't moved since today's last snapshot, and record the lines books have pulled
+    # from events that answered (an event whose request failed says nothing about its books)
+    previous = latest_prices(cursor, [event['id'] for event in events_data], today)
+    answered = {event['id']: event for event, (event_odds_data, _) in zip(events_data, responses) if 'bookmakers' in event_odds_data}
+    if events_data and not answered:
+        print('Every event odds request failed, nothing stored.')
+        return None
+    pulled = pulled_rows(previous, rows, answered, today, snapshot_ts)
+    rows = [row for row in rows if previous.get((row[0], row[4], row[3], row[5], row[7])) != row[6]] + pulled
+
+    # Store player shots on goal props in the database and refresh the best lines of the players they touch
+    with transaction(conn):
+        cursor.executemany('''
+        INSERT OR IGNORE INTO player_shots_odds (event_id, home_team, away_team, player_name, bookmaker, over_under, price, points, date, snapshot_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        refresh_best_lines(cursor, [(row[8], row[3]) for row in rows])
+
+    # Print the player shots on goal props organized by player
+    if print_to_console == 'y':
+        for row in rows:
+            print(f"Player: {row[3]}, Bookmaker: {row[4]}, Over/Under: {row[5]}, Price: {row[6]}, Points: {row[7]}, Home Team: {row[1]}, Away Team: {row[2]}")
+    print(f"Stored {len(rows) - len(pulled)} new or moved props and {len(pulled)} pulled lines from {len(events_data)} events (snapshot {snapshot_ts}).")
 
     # Print used and remaining requests
-    print('Used requests:', event_odds_response.headers['x-requests-used'])
-    print('Remaining requests:', event_odds_response.headers['x-requests-remaining'])
-
-conn.close()
\ No newline at end of file
+    if 'x-requests-remaining' in headers:
+        print('Used requests:', headers.get('x-requests-used'))
+        print('Remaining requests:', headers.get('x-requests-remaining'))
+    return len(rows)
+
+if __name__ == "__main__":
+    # Pass --refresh for an intraday snapshot on a day whose odds are already stored,
+    # --runs-per-day N when N daily + intraday runs share the day's quota, and --archive DIR to keep raw responses
+    args = sys.argv[1:]
+    runs_per_day = int(args[args.index('--runs-per-day') + 1]) if '--runs-per-day' in args else 1
+    archive_dir = args[args.index('--archive') + 1] if '--archive' in args else None
+    ingest_odds(refresh='--refresh' in args, runs_per_day=runs_per_day, archive_dir=archive_dir)
@@ -0,0 +1,134 @@
+import calendar
+from datetime import datetime, timezone
+from database import get_connection, transaction
+
+# the-odds-api is used under a paid monthly quota. Every call's quota headers are recorded in
+# odds_api_usage, and QuotaScheduler spreads what's left evenly over the rest of the month, choosing
+# which events to (re)fetch when a run can't afford all of them.
+
+# Credits charged for one event-odds call (one market, one region) when no header says otherwise
+DEFAULT_EVENT_COST = 1
+
+def create_usage_table(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS odds_api_usage (
+        id INTEGER PRIMARY KEY,
+        ts TEXT,
+        endpoint TEXT,
+        event_id TEXT,
+        requests_used INTEGER,
+        requests_remaining INTEGER,
+        last_cost INTEGER
+    )
+    ''')
+    conn.commit()
+
+def header_int(headers, name):
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+# Record the quota headers of a batch of calls: [(endpoint, event_id, headers), ...]
+def record_usage(calls):
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    rows = [(now, endpoint, event_id, header_int(headers, 'x-requests-used'), header_int(headers, 'x-requests-remaining'),
+             header_int(headers, 'x-requests-last')) for endpoint, event_id, headers in calls if headers]
+    conn = get_connection()
+    create_usage_table(conn)
+    with transaction(conn):
+        conn.executemany('''
+        INSERT INTO odds_api_usage (ts, endpoint, event_id, requests_used, requests_remaining, last_cost)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+class QuotaScheduler:
+    def __init__(self, runs_per_day=1, reserve=0, now=None):
+        # runs_per_day: planned ingest runs per day (daily run plus intraday snapshots) sharing the daily budget
+        # reserve: credits to hold back for the end of the month
+        self.runs_per_day = runs_per_day
+        self.reserve = reserve
+        self.now = now or datetime.now(timezone.utc)
+        conn = get_connection()
+        create_usage_table(conn)
+        cursor = conn.cursor()
+        cursor.execute('SELECT requests_remaining FROM odds_api_usage WHERE requests_remaining IS NOT NULL ORDER BY id DESC LIMIT 1')
+        row = cursor.fetchone()
+        self.remaining = row[0] if row else None
+        today = self.now.strftime('%Y-%m-%d')
+        cursor.execute("SELECT COALESCE(SUM(last_cost), 0), COUNT(CASE WHEN endpoint = 'events' THEN 1 END) FROM odds_api_usage WHERE ts >= ?", (today,))
+        self.used_today, self.runs_today = cursor.fetchone()
+        cursor.execute("SELECT AVG(last_cost) FROM odds_api_usage WHERE endpoint = 'event_odds' AND last_cost IS NOT NULL")
+        self.event_cost = cursor.fetchone()[0] or DEFAULT_EVENT_COST
+
+    def days_left_in_month(self):
+        return calendar.monthrange(self.now.year, self.now.month)[1] - self.now.day + 1
+
+    # Credits this day may still spend: what was left at the start of today split over the days left
+    def daily_allowance(self):
+        if self.remaining is None:
+            return None
+        start_of_day = self.remaining + self.used_today - self.reserve
+        return max(0, start_of_day / self.days_left_in_month() - self.used_today)
+
+    # Credits this run may spend, leaving an equal share for the day's remaining planned runs. The scheduler
+    # is built after the run's events call is recorded, so runs_today already counts this run.
+    def run_allowance(self):
+        allowance = self.daily_allowance()
+        if allowance is None:
+            return None
+        runs_left = max(1, self.runs_per_day - self.runs_today + 1)
+        return allowance / runs_left
+
+    # Choose which events to fetch, skipping events that have already started. Every run spends at most its
+    # share of the daily budget. A first (daily) run fetches events in start-time order; a refresh fetches
+    # the events with the most props per hour left before the game (events not seen before count as an
+    # average event). The rest wait for a later run.
+    def plan(self, events, prop_counts=None, refresh=False):
+        prop_counts = prop_counts or {}
+        now = self.now.strftime('%Y-%m-%dT%H:%M:%SZ')
+        upcoming = sorted((event for event in events if event.get('commence_time', '9999') > now), key=lambda event: event.get('commence_time', ''))
+        if self.remaining is None:
+            return upcoming
+        affordable = int(self.run_allowance() // self.event_cost)
+        if refresh:
+            average = sum(prop_counts.values()) / len(prop_counts) if prop_counts else 1
+            def value(event):
+                start = datetime.strptime(event['commence_time'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+                hours = max(0, (start - self.now).total_seconds() / 3600)
+                return prop_counts.get(event['id'], average) / (hours + 1)
+            chosen = {event['id'] for event in sorted(upcoming, key=value, reverse=True)[:affordable]}
+        else:
+            chosen = {event['id'] for event in upcoming[:affordable]}
+        skipped = len(upcoming) - len(chosen)
+        if skipped:
+            print(f"Quota: fetching {len(chosen)} of {len(upcoming)} events, delaying {skipped} to stay within budget.")
+        return [event for event in upcoming if event['id'] in chosen]
+
+    def summary(self):
+        return {
+            'requests_remaining': self.remaining,
+            'used_today': self.used_today,
+            'days_left_in_month': self.days_left_in_month(),
+            'daily_allowance': self.daily_allowance(),
+            'run_allowance': self.run_allowance(),
+            'event_cost': self.event_cost,
+        }
+
+# Number of distinct props (bookmaker, player, side, line) stored so far for each event
+def event_prop_counts(cursor, event_ids):
+    if not event_ids:
+        return {}
+    cursor.execute(f'''
+    SELECT event_id, COUNT(*) FROM (
+        SELECT DISTINCT event_id, bookmaker, player_name, over_under, points FROM player_shots_odds
+        WHERE event_id IN ({', '.join('?' for _ in event_ids)})
+    )
+    GROUP BY event_id
+    ''', list(event_ids))
+    return dict(cursor.fetchall())
+
+if __name__ == "__main__":
+    for key, value in QuotaScheduler().summary().items():
+        print(f"{key}: {value}")
@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import hashlib
+from datetime import date as date_cls, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from database import get_connection
+import metrics
+
+# In-process daily pipeline. Each stage is a function run once in this process, so the interpreter, the
+# imports, the shared database connection and the in-memory roster index, game logs and shot histories
+# are paid for once and passed between stages. Stages whose dependencies are done run in parallel
+# threads, except that stages sharing a lock run one at a time: the roster index, game-log, shot-history
+# and opposition-factor caches aren't thread-safe, so every stage that uses them takes the 'caches' lock
+# ('factors' only resets the factor cache, before any stage reading it can start). Settling past dates
+# needs only the odds stage, so a failed model or sweep doesn't hold it up. A stage whose inputs (and
+# upstream stages) are unchanged since its last successful run is skipped; a failed one is rerun.
+# Per-stage timings are printed at the end and kept in pipeline_runs.
+
+# Get the directory of the current script
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+class Stage:
+    # run(results) gets the outputs of the stages run so far; inputs() returns anything that should
+    # trigger a rerun when it changes, or None to run every time; no two stages with the same lock run at once
+    def __init__(self, name, run, deps=(), inputs=None, lock=None):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = inputs
+        self.lock = lock
+
+def create_pipeline_runs_table(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pipeline_runs (
+        stage TEXT PRIMARY KEY,
+        fingerprint TEXT,
+        finished_at TEXT,
+        seconds REAL
+    )
+    ''')
+    conn.commit()
+
+# Fingerprint of a stage: its own inputs plus the fingerprints of the stages it depends on, so a change
+# anywhere upstream reruns everything downstream of it
+def stage_fingerprint(stage, fingerprints):
+    if stage.inputs is None:
+        return None
+    parts = [repr(stage.inputs())] + [fingerprints[dep] or '' for dep in stage.deps]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+def run_pipeline(stages, force=False, max_workers=4):
+    conn = get_connection()
+    create_pipeline_runs_table(conn)
+    cursor = conn.cursor()
+    cursor.execute('SELECT stage, fingerprint FROM pipeline_runs')
+    previous = dict(cursor.fetchall())
+
+    by_name = {stage.name: stage for stage in stages}
+    results, fingerprints, status, timings = {}, {}, {}, {}
+    pending = list(stages)
+    running = {}
+    start = time.perf_counter()
+
+    def execute(stage):
+        stage_start = time.perf_counter()
+        output = metrics.profiled(stage.run, results)
+        return output, time.perf_counter() - stage_start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            # Start (or skip) every stage whose dependencies are settled; a skip can unblock the next stage
+            progress = True
+            while progress:
+                progress = False
+                for stage in list(pending):
+                    dep_status = [status.get(dep) for dep in stage.deps]
+                    if any(s in ('failed', 'blocked') for s in dep_status):
+                        status[stage.name], timings[stage.name] = 'blocked', 0.0
+                        fingerprints[stage.name] = None
+                    elif all(s in ('ran', 'skipped') for s in dep_status):
+                        fingerprint = stage_fingerprint(stage, fingerprints)
+                        fingerprints[stage.name] = fingerprint
+                        if not force and fingerprint is not None and previous.get(stage.name) == fingerprint:
+                            status[stage.name], timings[stage.name] = 'skipped', 0.0
+                            results[stage.name] = None
+                        elif stage.lock and any(other.lock == stage.lock for other in running.values()):
+                            continue
+                        else:
+                            print(f"[pipeline] starting {stage.name}")
+                            status[stage.name] = 'running'
+                            running[pool.submit(execute, stage)] = stage
+                    else:
+                        continue
+                    pending.remove(stage)
+                    progress = True
+            if not running:
+                if pending:
+                    raise ValueError(f"Unknown or circular dependencies for stages: {[stage.name for stage in pending]}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage.name], timings[stage.name] = future.result()
+                except Exception as e:
+                    print(f"[pipeline] {stage.name} failed: {e!r}")
+                    status[stage.name], timings[stage.name] = 'failed', 0.0
+                    fingerprints[stage.name] = None
+                    continue
+                status[stage.name] = 'ran'
+                metrics.record_time(f"stage.{stage.name}", timings[stage.name])
+                cursor.execute('INSERT OR REPLACE INTO pipeline_runs (stage, fingerprint, finished_at, seconds) VALUES (?, ?, ?, ?)',
+                               (stage.name, fingerprints[stage.name], datetime.now().isoformat(timespec='seconds'), timings[stage.name]))
+                conn.commit()
+
+    print(f"{'stage':<12} {'status':<8} {'seconds':>8}")
+    for name in by_name:
+        print(f"{name:<12} {status[name]:<8} {timings[name]:>8.2f}")
+    print(f"{'total':<12} {'':<8} {time.perf_counter() - start:>8.2f}")
+    return results, status
+
+def today():
+    return date_cls.today().isoformat()
+
+def yesterday():
+    return (date_cls.today() - timedelta(days=1)).isoformat()
+
+# Size and newest row of today's stored odds; changes whenever a snapshot adds or moves a price
+def odds_state():
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT COUNT(*), MAX(id) FROM player_shots_odds WHERE date >= ?', (today(),))
+    return today(), cursor.fetchone()
+
+# Fails the stage when the odds API couldn't be read, so the next run retries instead of skipping today's odds
+def run_odds(results):
+    from odds_api_main import ingest_odds
+    written = ingest_odds()
+    if written is None:
+        raise RuntimeError("odds API request failed")
+    return written
+
+def run_factors(results):
+    from team_avg_SA import daily_factor_update
+    daily_factor_update()
+
+# Resolve today's slate once and load every player's logs and shot history into the in-process caches,
+# which the model and sweep stages then read instead of refetching
+def run_slate(results):
+    from config import CURRENT_SEASON, PAST_SEASONS
+    from fetch_engine import FetchEngine
+    from roster_index import resolve_player
+    from shot_store import get_shot_history
+
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT DISTINCT player_name, home_team, away_team FROM best_lines WHERE date = ?', (today(),))
+    props = cursor.fetchall()
+    player_ids = {}
+    for player_name, home_team, away_team in props:
+        player_info = resolve_player(home_team, away_team, player_name)
+        if player_info:
+            player_ids[player_name] = player_info[0]
+    FetchEngine().prefetch_game_logs([(player_id, season) for player_id in set(player_ids.values()) for season in [CURRENT_SEASON] + PAST_SEASONS],
+                                     through_date=yesterday())
+    for player_id in set(player_ids.values()):
+        get_shot_history(player_id, yesterday())
+    print(f"Loaded {len(player_ids)} of {len(props)} slate players.")
+    return player_ids
+
+def run_model(results):
+    from player_api import fetch_and_store_player_data
+    fetch_and_store_player_data()
+
+def run_sweep(results):
+    from model_sweep import sweep_weightings, DEFAULT_WEIGHTINGS, DEFAULT_OPPOSITION_ADJUSTS
+    return sweep_weightings(DEFAULT_WEIGHTINGS, opposition_adjusts=DEFAULT_OPPOSITION_ADJUSTS, start_date=today())
+
+# Write today's modelled_likelihoods rows to daily_odds/modelled_likelihoods_<date>.csv
+def run_export(results):
+    from export import export_table
+    path = os.path.join(script_dir, f"daily_odds/modelled_likelihoods_{today()}.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return export_table('modelled_likelihoods', path, start_date=today(), end_date=today())
+
+# Settle the base ledger and one ledger per sweep variant for every finished day
+def run_settle(results):
+    from update_ledger import update_ledger
+    from setup_database import create_ledger
+    from backtest import ledger_name_for
+    from model_sweep import variant_table_name, DEFAULT_WEIGHTINGS, DEFAULT_OPPOSITION_ADJUSTS
+
+    update_ledger()
+    tables = [variant_table_name(weights, adjust) for weights in DEFAULT_WEIGHTINGS for adjust in DEFAULT_OPPOSITION_ADJUSTS]
+    for table in tables:
+        create_ledger(ledger_name_for(table))
+        update_ledger(ledger_name_for(table), table)
+    return ['daily_ledger_scaled'] + [ledger_name_for(table) for table in tables]
+
+def daily_stages():
+    return [
+        Stage('odds', run_odds, inputs=today),
+        Stage('factors', run_factors, inputs=today),
+        Stage('slate', run_slate, deps=['odds'], inputs=odds_state, lock='caches'),
+        Stage('model', run_model, deps=['slate', 'factors'], inputs=today, lock='caches'),
+        Stage('sweep', run_sweep, deps=['slate', 'factors'], inputs=today, lock='caches'),
+        Stage('export', run_export, deps=['model'], inputs=today),
+        Stage('settle', run_settle, deps=['odds'], lock='caches'),
+    ]
+
+def run_daily(force=False):
+    return run_pipeline(daily_stages(), force=force)
+
+if __name__ == "__main__":
+    # Pass --force to rerun every stage even if its inputs are unchanged, --profile to add a cProfile dump
+    # to the run metrics
+    with metrics.run(profile='--profile' in sys.argv[1:]):
+        run_daily(force='--force' in sys.argv[1:])
@@ -1,126 +1,62 @@
-import os
+import re
 import requests # type: ignore
-import matplotlib.pyplot as plt # type: ignore
-from scipy.stats import norm, poisson # type: ignore
-import sqlite3
-from tenacity import retry, stop_after_attempt, wait_exponential
-from datetime import datetime
+from datetime import datetime, timedelta
 from team_avg_SA import get_opposition_factor
-from config import DATABASE
+from shot_store import get_shot_history, SEASONS
+from game_log_cache import get_game_log
+from fetch_engine import FetchEngine
+from roster_index import get_roster_index, resolve_player
+from config import CURRENT_SEASON, PAST_SEASONS
+from database import get_connection
+import http_cache
 
 # Define the base URL for the NHL API
 base_url = "https://api-web.nhle.com/v1"
 url2 = "https://statsapi.web.nhl.com/api/v1"
 team_shots_url = "https://api.nhle.com/stats/rest/en/team/summary?sort=shotsForPerGame&cayenneExp=seasonId=20242025%20and%20gameTypeId=2"
 
+# Season game-log urls, which get_player_stats serves from the game-log cache
+GAME_LOG_PATH = re.compile(r'/player/(\d+)/game-log/(\d+)/(\d+)$')
+
 
 def plot_shots_histogram(shots, title, ylabel):
+    # Plotting is only used interactively, so matplotlib is imported on first use
+    import matplotlib.pyplot as plt # type: ignore
     plt.hist(shots, bins=range(min(shots), max(shots) + 2), edgecolor='black', align='left')
     plt.title(title)
     plt.xlabel('Shots per Game')
     plt.ylabel(ylabel)
     plt.show()
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=15))
-def get_shots_per_game(player_id, season, cutoff_date):
-    # Define the endpoint for player game logs for the current season
-    season_url = f"{base_url}/player/{player_id}/game-log/{season}/2"
+# The player's shared date-indexed history, complete for every game before cutoff_date
+def get_player_history(player_id, cutoff_date):
+    through_date = (datetime.strptime(cutoff_date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    return get_shot_history(player_id, through_date)
 
-    response = requests.get(season_url)
-    if response.status_code == 200:
-        try:
-            data = response.json()
-            if data and 'gameLog' in data:
-                cutoff_datetime = datetime.strptime(cutoff_date, '%Y-%m-%d')
-                return [game['shots'] for game in data['gameLog'] if datetime.strptime(game['gameDate'], '%Y-%m-%d') < cutoff_datetime]
-            else:
-                print(f"No valid game log data available for player ID: {player_id} before date {cutoff_date} for season {season}.")
-                return []
-        except requests.exceptions.JSONDecodeError:
-            print(f"Error decoding JSON from {season_url}")
-            return []
+def get_shots_per_game(player_id, season, cutoff_date):
+    # Shots come from the player's date-indexed history; only games before the cutoff are needed. Seasons
+    # the histories don't cover are read from that season's cached game log.
+    season = str(season)
+    if season in SEASONS:
+        shots = get_player_history(player_id, cutoff_date).shots_before(cutoff_date, season).tolist()
     else:
-        print(f"Request to {season_url} failed with status code {response.status_code}")
-        return []
+        data = get_game_log(player_id, season) or {}
+        shots = [game['shots'] for game in sorted(data.get('gameLog', []), key=lambda game: game['gameDate']) if game['gameDate'] < cutoff_date]
+    if not shots:
+        print(f"No valid game log data available for player ID: {player_id} before date {cutoff_date} for season {season}.")
+    return shots
 
-# Find player ID for player through team roster
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=15))
+# Find player ID for player through the daily roster index (no network calls once built)
 def get_player_id(team1, team2, player):
-    team1_id = get_NHL_abbreviations(team1)
-    team2_id = get_NHL_abbreviations(team2)
-    
-    # Function to search for player in a given team
-    def search_player_in_team(team_id):
-        response = requests.get(f"{base_url}/roster/{team_id}/current")
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                for player_data in data.get('forwards', []):
-                    full_name = f"{player_data.get('firstName', {}).get('default', '')} {player_data.get('lastName', {}).get('default', '')}"
-                    if full_name.lower() == player.lower():
-                        return player_data.get('id')
-                for player_data in data.get('defensemen', []):
-                    full_name = f"{player_data.get('firstName', {}).get('default', '')} {player_data.get('lastName', {}).get('default', '')}"
-                    if full_name.lower() == player.lower():
-                        return player_data.get('id')
-                return None
-            except requests.exceptions.JSONDecodeError:
-                print(f"Error decoding JSON from {base_url}")
-                return None
-        else:
-            print(f"Request to {base_url} failed with status code {response.status_code}")
-            return None
-
-    # Try to find the player in team1
-    player_id = search_player_in_team(team1_id)
-    if player_id:
-        player_team = team1
-        opposing_team = team2
-        return player_id, player_team, opposing_team
-
-    # If not found, try to find the player in team2
-    player_id = search_player_in_team(team2_id)
-    if player_id:
-        player_team = team2
-        opposing_team = team1
-        return player_id, player_team, opposing_team
-    
-    # If player first name Nicholas, try Nick + last name instead (paul)
-    if player.split()[0].lower() == 'nicholas':
-        player = 'Nick ' + player.split()[1]
-        player_id = search_player_in_team(team1_id)
-        if player_id:
-            player_team = team1
-            opposing_team = team2
-            return player_id, player_team, opposing_team
-        player_id = search_player_in_team(team2_id)
-        if player_id:
-            player_team = team2
-            opposing_team = team1
-            return player_id, player_team, opposing_team
+    return resolve_player(team1, team2, player)
     
-    # If player first name Alex (and not found already), try Alexander + last name instead (wennberg)
-    if player.split()[0].lower() == 'alex':
-        player = 'Alexander ' + player.split()[1]
-        player_id = search_player_in_team(team1_id)
-        if player_id:
-            player_team = team1
-            opposing_team = team2
-            return player_id, player_team, opposing_team
-        player_id = search_player_in_team(team2_id)
-        if player_id:
-            player_team = team2
-            opposing_team = team1
-            return player_id, player_team, opposing_team
-
-
-    print(f"Player {player} not found in either team {team1} ({team1_id}) or team {team2} ({team2_id}) roster.")
-    return None  
-    
-# Function to get player statistics from the NHL API
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=15))
+# Function to get player statistics from the NHL API. Season game logs come from the shared game-log
+# cache, so they're the same payloads (and downloads) the shot histories are built from.
 def get_player_stats(url):
-    response = requests.get(url)
+    match = GAME_LOG_PATH.search(url)
+    if match:
+        return get_game_log(int(match[1]), match[2], int(match[3]))
+    response = http_cache.get(url)
     if response.status_code == 200:
         try:
             return response.json()
@@ -160,27 +96,14 @@ def get_last_10_games(data):
         return game_logs[:10]
     return []
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=15))
 def get_NHL_abbreviations(team_name):
-    if team_name == 'St Louis Blues':
-        team_name = 'St. Louis Blues'
-    response = requests.get(f"{base_url}/standings/now")
-    if response.status_code == 200:
-        try:
-            data = response.json()
-            for team in data['standings']:
-                if team['teamName']['default'] == team_name:
-                    return team['teamAbbrev']['default']
-            print(f"Team {team_name} not found in NHL teams.")
-            return None
-        except requests.exceptions.JSONDecodeError:
-            print(f"Error decoding JSON from {base_url}/standings/now")
-            return None
-    else:
-        print(f"Request to {base_url}/standings/now failed with status code {response.status_code}")
-        return None
+    team_abbrev = get_roster_index().team_abbrev(team_name)
+    if team_abbrev is None:
+        print(f"Team {team_name} not found in NHL teams.")
+    return team_abbrev
 
 def calculate_likelihoods(shots, weighted_shots, over_under, shots_threshold, opposition_factor=1):
+    from scipy.stats import norm, poisson # type: ignore
     # MODELLED LIKELIHOODS CALCULATED HERE FOR SPECIFIC WEIGHTINGS, WITH SEVERAL STATISTICAL MODELS
     # - (POISSON MOST VALID, OTHERS CALCULATED FOR REFERENCE)
     
@@ -189,26 +112,40 @@ def calculate_likelihoods(shots, weighted_shots, over_under, shots_threshold, op
 def kelly_criterion(probability, odds):
     return probability - (1 - probability) / (odds - 1)
 
+# Resolve every slate player from the roster index, then download all of their season logs
+# in one batch so the modelling loop below only reads from the game-log cache
+def prefetch_slate(players, engine=None):
+    engine = engine or FetchEngine(base_url)
+    player_ids = {}
+    for player_name, _, home_team, away_team, _ in players:
+        player_info = get_player_id(home_team, away_team, player_name)
+        if player_info:
+            player_ids[player_name] = player_info[0]
+    pairs = [(player_id, season) for player_id in player_ids.values() for season in [CURRENT_SEASON] + PAST_SEASONS]
+    latest_date = max(date for _, _, _, _, date in players)
+    through_date = (datetime.strptime(latest_date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    engine.prefetch_game_logs(pairs, through_date=through_date)
+    return player_ids
+
 def fetch_and_store_player_data(x_10 = 5, x_2024 = 3, x_2023 = 2, x_2022 = 1, opposition_adjust = 0, sig_diff_adjust = 0):
     # WEIGHTING INFORMATION REDACTED FROM HERE
 
-    # Get the directory of the current script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-
     # Connect to the SQLite database
-    conn = sqlite3.connect(os.path.join(script_dir, DATABASE))
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute(f"""
-    SELECT DISTINCT pso.player_name, pso.over_under, pso.home_team, pso.away_team, pso.date 
-    FROM player_shots_odds pso
-    LEFT JOIN {model_table} ml
-    ON pso.player_name = ml.player_name AND pso.over_under = ml.over_under AND pso.date = ml.date AND pso.points = ml.points
-    WHERE ml.player_name IS NULL 
-    AND pso.date > (SELECT COALESCE(MAX(date), '1900-01-01') FROM {ledger})
+    SELECT DISTINCT bl.player_name, bl.over_under, bl.home_team, bl.away_team, bl.date 
+    FROM best_lines bl
+    WHERE bl.date > (SELECT COALESCE(MAX(date), '1900-01-01') FROM {ledger})
+    AND NOT EXISTS (SELECT 1 FROM {model_table} ml
+                    WHERE ml.date = bl.date AND ml.player_name = bl.player_name
+                    AND ml.over_under = bl.over_under AND ml.points = bl.points)
     """)
     players = cursor.fetchall()
     print(f"Found {len(players)} players to model.")
+    if players:
+        prefetch_slate(players)
 
     for player_name, over_under, home_team, away_team, date in players:
         # STATISTICAL modelling done here from past SOG data & chosen model structure - details kept private
@@ -218,7 +155,6 @@ def fetch_and_store_player_data(x_10 = 5, x_2024 = 3, x_2023 = 2, x_2022 = 1, op
 
 
     conn.commit()
-    conn.close()
 
 if __name__ == "__main__":
     #print(get_shots_per_game(8478483, '20242025', '2024-10-13'))
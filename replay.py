@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import argparse
+import http_client
+import numpy as np
+from datetime import date as date_cls, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from config import API_KEY, SPORT, REGIONS, ODDS_FORMAT, DATE_FORMAT
+from database import get_connection, transaction
+from odds_api_main import ODDS_API_URL, prop_rows
+from setup_database import create_player_shots_odds, create_player_models
+from best_lines import refresh_best_lines
+from model_sweep import load_histories, build_rows, score_variants, insert_model_rows, variant_table_name, prop_key
+from settlement import resolve_props_by_date
+from shot_store import seasons_for_date
+from team_avg_SA import get_opposition_factors
+
+# Point-in-time replay. Historical prop snapshots are backfilled into player_shots_odds from archived
+# ingest_odds responses or from the-odds-api historical endpoints (or a local stand-in serving the same
+# paths), then every past date is re-scored into a fresh modelled_likelihoods_replay_* table using only
+# games played before that date and that date's opposition factors. Each date's weights apply to its own
+# season and the ones before it, not the configured seasons. Players are matched to the skaters in that
+# date's boxscores (pulled as for settlement), so players traded, sent down or retired since still count;
+# only players with no result that day fall back to the current roster index. Props that can't be
+# resolved or have no earlier games are counted and reported.
+
+# Snapshots saved by ingest_odds(archive_dir=...): <archive_dir>/<date>/<snapshot_ts>.json
+class ArchiveSource:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+
+    def dates(self, start_date, end_date):
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(name for name in os.listdir(self.archive_dir)
+                      if start_date <= name <= end_date and os.path.isdir(os.path.join(self.archive_dir, name)))
+
+    # (snapshot_ts, events, {event_id: event odds}) for every snapshot of a date, oldest first
+    def snapshots(self, date):
+        day_dir = os.path.join(self.archive_dir, date)
+        for name in sorted(os.listdir(day_dir)):
+            if name.endswith('.json'):
+                with open(os.path.join(day_dir, name)) as file:
+                    snapshot = json.load(file)
+                yield snapshot['snapshot_ts'], snapshot['events'], snapshot['odds']
+
+# the-odds-api historical events and event-odds endpoints, read once per date at snapshot_time (UTC).
+# Only events starting on that North American game day are kept.
+class ApiSource:
+    def __init__(self, base_url=ODDS_API_URL, api_key=API_KEY, snapshot_time='16:00:00Z', max_workers=6, timeout=15):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.snapshot_time = snapshot_time
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def dates(self, start_date, end_date):
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+    def get(self, path, params):
+        response = http_client.get(f"{self.base_url}{path}", params={'api_key': self.api_key, 'dateFormat': DATE_FORMAT, **params}, timeout=self.timeout)
+        if response.status_code != 200:
+            print(f"Request to {path} for {params.get('date')} failed (status code {response.status_code})")
+            return {}
+        return response.json()
+
+    def snapshots(self, date):
+        snapshot_ts = f"{date}T{self.snapshot_time}"
+        events_response = self.get(f"/historical/sports/{SPORT}/events", {'date': snapshot_ts})
+        day_start = f"{date}T10:00:00Z"
+        day_end = f"{(datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)).date().isoformat()}T10:00:00Z"
+        events = [event for event in events_response.get('data', []) if day_start <= event.get('commence_time', '') < day_end]
+        if not events:
+            return
+        params = {'date': snapshot_ts, 'regions': REGIONS, 'markets': 'player_shots_on_goal', 'oddsFormat': ODDS_FORMAT}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            responses = list(pool.map(lambda event: self.get(f"/historical/sports/{SPORT}/events/{event['id']}/odds", params), events))
+        yield events_response.get('timestamp', snapshot_ts), events, {event['id']: response.get('data', {}) for event, response in zip(events, responses)}
+
+# Store every snapshot of every date from start_date to end_date; one transaction per date, duplicates
+# of stored snapshots ignored. Returns the number of rows written.
+def backfill_odds(source, start_date, end_date):
+    create_player_shots_odds()
+    conn = get_connection()
+    cursor = conn.cursor()
+    written = 0
+    for date in source.dates(start_date, end_date):
+        rows = []
+        for snapshot_ts, events, odds in source.snapshots(date):
+            for event in events:
+                rows.extend(prop_rows(event, odds.get(event['id'], {}), date, snapshot_ts))
+        with transaction(conn):
+            cursor.executemany('''
+            INSERT OR IGNORE INTO player_shots_odds (event_id, home_team, away_team, player_name, bookmaker, over_under, price, points, date, snapshot_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            stored = max(cursor.rowcount, 0)
+            refresh_best_lines(cursor, [(row[8], row[3]) for row in rows])
+        written += stored
+        print(f"{date}: stored {stored} of {len(rows)} props.")
+    return written
+
+# Re-score every stored prop from start_date to end_date under one weighting into a fresh table. Loading
+# the histories is the expensive part (game logs are fetched in parallel by the FetchEngine); the scoring
+# is one vectorized pass over all rows. Returns the table name.
+def replay_scores(weights, opposition_adjust=0, start_date='1900-01-01', end_date=None, table=None, engine=None):
+    end_date = end_date or (date_cls.today() - timedelta(days=1)).isoformat()
+    variants = [(tuple(weights), opposition_adjust)]
+    table = table or variant_table_name(weights, opposition_adjust, prefix='modelled_likelihoods_replay')
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT date, player_name, over_under, points, home_team, away_team, best_price
+    FROM best_lines
+    WHERE date BETWEEN ? AND ?
+    ''', (start_date, end_date))
+    props = cursor.fetchall()
+    print(f"Replaying {len(props)} props from {start_date} to {end_date} into {table}.")
+    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    create_player_models(table)
+    if not props:
+        return table
+
+    seasons = sorted({season for date in {prop[0] for prop in props} for season in seasons_for_date(date)}, reverse=True)
+    resolved, histories = load_histories(props, engine, seasons, resolve_props_by_date(map(prop_key, props), engine))
+    rows, hists, slate = build_rows(props, resolved, histories, seasons_for_date)
+    unresolved = sum(1 for prop in props if not resolved[prop_key(prop)])
+    print(f"Dropped {unresolved} props whose player couldn't be identified and {len(props) - unresolved - len(rows)} with no earlier games.")
+    if not rows:
+        return table
+    base_factors = np.array(get_opposition_factors(slate, 1) if opposition_adjust else np.ones(len(rows)), dtype=float)
+    scored = score_variants(rows, hists, base_factors, variants)[0]
+
+    with transaction(conn):
+        insert_model_rows(cursor, table, scored)
+    print(f"Wrote {len(scored)} rows over {len({row[1] for row in scored})} dates to {table}.")
+    return table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backfill historical props and replay a model over past dates.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backfill = commands.add_parser('backfill', help='store historical prop snapshots')
+    source = backfill.add_mutually_exclusive_group(required=True)
+    source.add_argument('--archive', help='directory written by ingest_odds(archive_dir=...)')
+    source.add_argument('--api', nargs='?', const=ODDS_API_URL, help='historical odds API base URL (default: the-odds-api)')
+    backfill.add_argument('--start', required=True)
+    backfill.add_argument('--end', required=True)
+
+    score = commands.add_parser('score', help='re-score past dates into a fresh model table')
+    score.add_argument('--weights', nargs=4, type=float, default=[5, 3, 2, 1], metavar=('X_10', 'X_2024', 'X_2023', 'X_2022'))
+    score.add_argument('--opposition-adjust', type=float, default=0)
+    score.add_argument('--start', default='1900-01-01')
+    score.add_argument('--end', default=None)
+    score.add_argument('--workers', type=int, default=None, help='backtest worker processes')
+    score.add_argument('--table', default=None)
+    score.add_argument('--backtest', action='store_true', help='replay the ledger for the new table afterwards')
+    args = parser.parse_args(argv)
+
+    if args.command == 'backfill':
+        backfill_odds(ArchiveSource(args.archive) if args.archive else ApiSource(args.api), args.start, args.end)
+    else:
+        weights = [int(w) if w == int(w) else w for w in args.weights]
+        table = replay_scores(weights, args.opposition_adjust, args.start, args.end, args.table)
+        if args.backtest:
+            from backtest import run_backtest
+            run_backtest([(table, 'scale')], args.start, args.end, args.workers)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
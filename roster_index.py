@@ -0,0 +1,158 @@
+import re
+import unicodedata
+from datetime import date
+from fetch_engine import FetchEngine
+from database import get_connection
+
+BASE_URL = "https://api-web.nhle.com/v1"
+
+# Default first-name aliases tried when a sportsbook name isn't on a roster, e.g. Nicholas Paul -> Nick Paul,
+# Alex Wennberg -> Alexander Wennberg. More (first names or full names) can be added to the player_aliases table.
+DEFAULT_ALIASES = {
+    'nicholas': 'nick',
+    'alex': 'alexander',
+}
+
+# Lower-case, strip accents and punctuation so "J.T. Miller", "JT Miller" and "Tim Stützle"/"Tim Stutzle" all match
+def normalize_name(name):
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    name = re.sub(r"[.'`]", '', name.lower())
+    name = re.sub(r'[^a-z0-9]+', ' ', name)
+    return name.strip()
+
+def create_roster_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS team_abbreviations (
+        team_name TEXT PRIMARY KEY,
+        team_abbrev TEXT,
+        built_date TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS roster_index (
+        normalized_name TEXT,
+        team_abbrev TEXT,
+        player_id INTEGER,
+        full_name TEXT,
+        built_date TEXT,
+        PRIMARY KEY (normalized_name, team_abbrev)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS player_aliases (
+        alias TEXT PRIMARY KEY,
+        canonical TEXT
+    )
+    ''')
+    cursor.executemany('INSERT OR IGNORE INTO player_aliases (alias, canonical) VALUES (?, ?)', DEFAULT_ALIASES.items())
+    conn.commit()
+
+# Add (or replace) an alias; both sides are normalized, so either a first name or a full name works
+def add_alias(alias, canonical):
+    conn = get_connection()
+    create_roster_tables(conn)
+    conn.execute('INSERT OR REPLACE INTO player_aliases (alias, canonical) VALUES (?, ?)', (normalize_name(alias), normalize_name(canonical)))
+    conn.commit()
+    global _index
+    _index = None
+
+class RosterIndex:
+    def __init__(self, teams, players, aliases):
+        # normalized team name -> abbreviation
+        self.teams = teams
+        # normalized player name -> [(player_id, team_abbrev), ...] (names aren't unique league-wide)
+        self.players = players
+        # normalized alias -> normalized canonical name
+        self.aliases = aliases
+
+    def team_abbrev(self, team_name):
+        return self.teams.get(normalize_name(team_name))
+
+    # Candidate spellings for a player: as given, a full-name alias, then a first-name alias
+    def name_variants(self, player):
+        name = normalize_name(player)
+        variants = [name]
+        if name in self.aliases:
+            variants.append(self.aliases[name])
+        first, _, rest = name.partition(' ')
+        if rest and first in self.aliases:
+            variants.append(f"{self.aliases[first]} {rest}")
+        return variants
+
+    # Return (player_id, player_team, opposing_team) for a player in a game between team1 and team2
+    def resolve(self, team1, team2, player):
+        team1_id = self.team_abbrev(team1)
+        team2_id = self.team_abbrev(team2)
+        for name in self.name_variants(player):
+            for player_id, team_abbrev in self.players.get(name, []):
+                if team_abbrev == team1_id:
+                    return player_id, team1, team2
+                if team_abbrev == team2_id:
+                    return player_id, team2, team1
+        print(f"Player {player} not found in either team {team1} ({team1_id}) or team {team2} ({team2_id}) roster.")
+        return None
+
+# Download standings and all rosters (concurrently) and replace the stored index
+def build_roster_index(conn, engine=None):
+    engine = engine or FetchEngine(BASE_URL)
+    standings = engine.get_json(f"{BASE_URL}/standings/now")
+    if not standings:
+        print("Could not load standings, roster index not rebuilt.")
+        return False
+    today = date.today().isoformat()
+    team_rows = [(normalize_name(team['teamName']['default']), team['teamAbbrev']['default'], today) for team in standings['standings']]
+    rosters = engine.fetch_rosters(abbrev for _, abbrev, _ in team_rows)
+
+    player_rows = []
+    for abbrev, roster in rosters.items():
+        for player_data in roster.get('forwards', []) + roster.get('defensemen', []) + roster.get('goalies', []):
+            full_name = f"{player_data.get('firstName', {}).get('default', '')} {player_data.get('lastName', {}).get('default', '')}"
+            player_rows.append((normalize_name(full_name), abbrev, player_data.get('id'), full_name, today))
+
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM team_abbreviations')
+    cursor.executemany('INSERT OR REPLACE INTO team_abbreviations (team_name, team_abbrev, built_date) VALUES (?, ?, ?)', team_rows)
+    # Keep rows for any team whose roster request failed rather than losing those players for the day
+    cursor.executemany('DELETE FROM roster_index WHERE team_abbrev = ?', [(abbrev,) for abbrev in rosters])
+    cursor.executemany('''
+    INSERT OR REPLACE INTO roster_index (normalized_name, team_abbrev, player_id, full_name, built_date)
+    VALUES (?, ?, ?, ?, ?)
+    ''', player_rows)
+    conn.commit()
+    print(f"Built roster index: {len(team_rows)} teams, {len(player_rows)} players.")
+    return True
+
+def load_roster_index(cursor):
+    cursor.execute('SELECT team_name, team_abbrev FROM team_abbreviations')
+    teams = dict(cursor.fetchall())
+    players = {}
+    cursor.execute('SELECT normalized_name, player_id, team_abbrev FROM roster_index')
+    for name, player_id, team_abbrev in cursor.fetchall():
+        players.setdefault(name, []).append((player_id, team_abbrev))
+    cursor.execute('SELECT alias, canonical FROM player_aliases')
+    aliases = dict(cursor.fetchall())
+    return RosterIndex(teams, players, aliases)
+
+_index = None
+
+# Return today's roster index, building it from the NHL API at most once per day
+def get_roster_index():
+    global _index
+    today = date.today().isoformat()
+    if _index is not None and _index.built_date == today:
+        return _index
+
+    conn = get_connection()
+    create_roster_tables(conn)
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(built_date) FROM team_abbreviations')
+    if cursor.fetchone()[0] != today:
+        build_roster_index(conn)
+    _index = load_roster_index(cursor)
+    # Even if the rebuild failed, don't retry it on every lookup in this process
+    _index.built_date = today
+    return _index
+
+def resolve_player(team1, team2, player):
+    return get_roster_index().resolve(team1, team2, player)
@@ -0,0 +1,213 @@
+from datetime import date as date_cls
+from fetch_engine import FetchEngine
+from roster_index import get_roster_index, normalize_name
+from database import get_connection, transaction
+
+# Settlement results are pulled once per date from that date's boxscores into player_game_results,
+# and every ledger is then settled from that table with SQL joins instead of per-bet API calls.
+
+BASE_URL = "https://api-web.nhle.com/v1"
+FINAL_STATES = {'OFF', 'FINAL'}
+# Games that won't be played on their date; they count as settled and their props are void
+VOID_SCHEDULE_STATES = {'PPD', 'CNCL'}
+
+
+def create_results_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS player_game_results (
+        date TEXT,
+        player_id INTEGER,
+        short_name TEXT,
+        team TEXT,
+        game_id INTEGER,
+        shots INTEGER,
+        PRIMARY KEY (date, player_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS results_pulled (
+        date TEXT PRIMARY KEY,
+        game_count INTEGER,
+        pulled_date TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS prop_player_ids (
+        date TEXT,
+        player_name TEXT,
+        player_id INTEGER,
+        PRIMARY KEY (date, player_name)
+    )
+    ''')
+    conn.commit()
+
+# Rows of (date, player_id, short_name, team, game_id, shots) for every skater in a boxscore
+def boxscore_rows(date, boxscore):
+    rows = []
+    stats = boxscore.get('playerByGameStats', {})
+    for side in ('homeTeam', 'awayTeam'):
+        team = boxscore.get(side, {}).get('abbrev')
+        for group in ('forwards', 'defense'):
+            for player in stats.get(side, {}).get(group, []):
+                shots = player.get('sog', player.get('shots'))
+                if shots is not None:
+                    rows.append((date, player['playerId'], player.get('name', {}).get('default'), team, boxscore.get('id'), shots))
+    return rows
+
+# Pull results for every date not yet fully pulled; one /score call per date plus one boxscore per game,
+# all fetched concurrently. Postponed and cancelled games have no results, so their players' props are
+# void. Dates with other games not yet final are stored but pulled again next time.
+def pull_results(dates, engine=None):
+    engine = engine or FetchEngine(BASE_URL)
+    conn = get_connection()
+    create_results_tables(conn)
+    cursor = conn.cursor()
+    cursor.execute('SELECT date FROM results_pulled')
+    pulled = {row[0] for row in cursor.fetchall()}
+    dates = sorted(set(dates) - pulled)
+    if not dates:
+        return []
+
+    scores = engine.fetch_many(f"{BASE_URL}/score/{date}" for date in dates)
+    games = {}
+    for date in dates:
+        score = scores.get(f"{BASE_URL}/score/{date}")
+        if score is not None:
+            games[date] = [game for game in score.get('games', []) if game.get('gameType', 2) == 2]
+    boxscores = engine.fetch_many(f"{BASE_URL}/gamecenter/{game['id']}/boxscore" for date_games in games.values()
+                                  for game in date_games if game.get('gameScheduleState') not in VOID_SCHEDULE_STATES)
+
+    complete = []
+    with transaction(conn):
+        for date, date_games in games.items():
+            rows = []
+            all_final = True
+            for game in date_games:
+                if game.get('gameScheduleState') in VOID_SCHEDULE_STATES:
+                    continue
+                boxscore = boxscores.get(f"{BASE_URL}/gamecenter/{game['id']}/boxscore")
+                if boxscore is None or boxscore.get('gameState', game.get('gameState')) not in FINAL_STATES:
+                    all_final = False
+                if boxscore is not None:
+                    rows.extend(boxscore_rows(date, boxscore))
+            cursor.executemany('''
+            INSERT OR REPLACE INTO player_game_results (date, player_id, short_name, team, game_id, shots)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            if all_final:
+                cursor.execute('INSERT OR REPLACE INTO results_pulled (date, game_count, pulled_date) VALUES (?, ?, ?)',
+                               (date, len(date_games), date_cls.today().isoformat()))
+                complete.append(date)
+    print(f"Pulled results for {len(complete)} of {len(dates)} dates.")
+    return complete
+
+# "Connor McDavid" -> "c mcdavid", the form boxscores use for names
+def short_name_key(name):
+    first, _, last = normalize_name(name).partition(' ')
+    return f"{first[:1]} {last}"
+
+# Map every (date, player_name) prop in model_table on the given dates to an NHL player id. The roster
+# index is tried first; players it misses (e.g. traded since) are matched by abbreviated name among
+# that date's results for the two teams in the game.
+def resolve_prop_players(model_table, dates):
+    conn = get_connection()
+    create_results_tables(conn)
+    cursor = conn.cursor()
+    dates = list(dates)
+    if not dates:
+        return
+    cursor.execute(f'''
+    SELECT DISTINCT ml.date, ml.player_name, bl.home_team, bl.away_team
+    FROM {model_table} ml
+    JOIN best_lines bl ON bl.date = ml.date AND bl.player_name = ml.player_name AND bl.over_under = ml.over_under AND bl.points = ml.points
+    WHERE ml.date IN ({', '.join('?' for _ in dates)})
+    AND NOT EXISTS (SELECT 1 FROM prop_player_ids p WHERE p.date = ml.date AND p.player_name = ml.player_name)
+    ''', dates)
+    unresolved = cursor.fetchall()
+    if not unresolved:
+        return
+
+    index = get_roster_index()
+    played = match_played(cursor, index, unresolved)
+    rows = []
+    for prop in unresolved:
+        player_info = index.resolve(prop[2], prop[3], prop[1]) or played[prop]
+        if player_info:
+            rows.append((prop[0], prop[1], player_info[0]))
+    with transaction(conn):
+        cursor.executemany('INSERT OR REPLACE INTO prop_player_ids (date, player_name, player_id) VALUES (?, ?, ?)', rows)
+
+# Match (date, player_name, home_team, away_team) props to the skaters in that date's pulled results for
+# the two teams, by abbreviated name. Returns {prop: (player_id, player_team, opposing_team)}, None where
+# there isn't exactly one match.
+def match_played(cursor, index, props):
+    dates = sorted({prop[0] for prop in props})
+    by_short_name = {}
+    for i in range(0, len(dates), 500):
+        chunk = dates[i:i + 500]
+        cursor.execute(f"SELECT date, player_id, short_name, team FROM player_game_results WHERE date IN ({', '.join('?' for _ in chunk)})", chunk)
+        for date, player_id, short_name, team in cursor.fetchall():
+            if short_name:
+                by_short_name.setdefault((date, normalize_name(short_name)), []).append((player_id, team))
+
+    played = {}
+    for prop in props:
+        date, player_name, home_team, away_team = prop
+        home_abbrev, away_abbrev = index.team_abbrev(home_team), index.team_abbrev(away_team)
+        matches = [(player_id, team) for player_id, team in by_short_name.get((date, short_name_key(player_name)), []) if team in (home_abbrev, away_abbrev)]
+        if len(matches) == 1:
+            player_id, team = matches[0]
+            played[prop] = (player_id, home_team, away_team) if team == home_abbrev else (player_id, away_team, home_team)
+        else:
+            played[prop] = None
+    return played
+
+# Resolve past props, given as (date, player_name, home_team, away_team), to who actually played in that
+# date's game: pull the dates' results and match by name among the two teams, falling back to today's
+# roster index for players with no result that day. Unlike resolve_player this still finds players traded,
+# sent down or retired since. Returns {prop: (player_id, player_team, opposing_team) or None}.
+def resolve_props_by_date(props, engine=None):
+    props = set(props)
+    if not props:
+        return {}
+    pull_results({prop[0] for prop in props}, engine)
+    index = get_roster_index()
+    played = match_played(get_connection().cursor(), index, props)
+    return {prop: played[prop] or index.resolve(prop[2], prop[3], prop[1]) for prop in props}
+
+# Dates on which a model table has props but the ledger has no entry yet, up to and including max_date.
+# The recursive CTE hops from one distinct date to the next through the model table's date index, so the
+# cost grows with the number of dates rather than the number of props.
+def dates_to_settle(cursor, ledger_name, model_table, max_date):
+    cursor.execute(f'''
+    WITH RECURSIVE model_dates(date) AS (
+        SELECT MIN(date) FROM {model_table}
+        UNION ALL
+        SELECT (SELECT MIN(date) FROM {model_table} ml WHERE ml.date > model_dates.date)
+        FROM model_dates WHERE model_dates.date <= ?
+    )
+    SELECT date FROM model_dates md
+    WHERE date <= ? AND NOT EXISTS (SELECT 1 FROM {ledger_name} l WHERE l.date = md.date)
+    ORDER BY date
+    ''', (max_date, max_date))
+    return [row[0] for row in cursor.fetchall()]
+
+# Candidate bets for the given dates joined to their results, in model-table order. actual_shots is None
+# when the player couldn't be identified and -1 when they have no result on that date (didn't play).
+def load_settled_bets(cursor, model_table, dates):
+    if not dates:
+        return {}
+    cursor.execute(f'''
+    SELECT ml.date, ml.player_name, ml.implied_likelihood, ml.points, ml.over_under, ml.poisson_kelly,
+           CASE WHEN p.player_id IS NULL THEN NULL ELSE COALESCE(r.shots, -1) END
+    FROM {model_table} ml
+    LEFT JOIN prop_player_ids p ON p.date = ml.date AND p.player_name = ml.player_name
+    LEFT JOIN player_game_results r ON r.date = ml.date AND r.player_id = p.player_id
+    WHERE ml.date IN ({', '.join('?' for _ in dates)}) AND ml.poisson_kelly > 0.01
+    ORDER BY ml.date, ml.id
+    ''', list(dates))
+    bets = {date: [] for date in dates}
+    for row in cursor.fetchall():
+        bets[row[0]].append(row[1:])
+    return bets
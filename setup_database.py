@@ -1,8 +1,124 @@
-import sqlite3
-from config import DATABASE
+from game_log_cache import create_game_log_cache_table, create_player_game_shots_table
+from roster_index import create_roster_tables
+from team_avg_SA import backfill_long_table, create_long_table
+from best_lines import create_best_lines_table, rebuild_best_lines
+from database import get_connection, transaction
+
+def table_exists(cursor, table_name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+    return cursor.fetchone() is not None
+
+def tables_like(cursor, prefix):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ORDER BY name", (f"{prefix}%",))
+    return [row[0] for row in cursor.fetchall()]
+
+# Delete all but the first row (lowest id) of every group of rows sharing the given columns
+def drop_duplicate_rows(cursor, table_name, columns):
+    cursor.execute(f'''
+    DELETE FROM {table_name} WHERE id NOT IN (
+        SELECT MIN(id) FROM {table_name} GROUP BY {', '.join(columns)}
+    )
+    ''')
+    if cursor.rowcount > 0:
+        print(f"Removed {cursor.rowcount} duplicate rows from {table_name}")
+
+# Indexes shared by new and migrated tables. Props are looked up by (date, player_name, over_under, points),
+# and the odds index also carries the teams so the modelling and settlement lookups never touch the table.
+def create_ledger_indexes(cursor, table_name):
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table_name}_date ON {table_name} (date)")
+
+def create_model_indexes(cursor, table_name):
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table_name}_prop ON {table_name} (date, player_name, over_under, points)")
+
+def create_snapshot_index(cursor):
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_player_shots_odds_snapshot
+    ON player_shots_odds (event_id, bookmaker, player_name, over_under, points, snapshot_ts)
+    ''')
+
+def create_odds_indexes(cursor):
+    create_snapshot_index(cursor)
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_player_shots_odds_prop
+    ON player_shots_odds (date, player_name, over_under, points, home_team, away_team)
+    ''')
+
+# Migration 1: tables created before intraday snapshots get the snapshot_ts column, old rows are
+# date-stamped and exact duplicates dropped before the snapshot unique index is built
+def add_snapshot_ts(cursor):
+    if not table_exists(cursor, 'player_shots_odds'):
+        return
+    cursor.execute("PRAGMA table_info(player_shots_odds)")
+    if 'snapshot_ts' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE player_shots_odds ADD COLUMN snapshot_ts TEXT")
+        cursor.execute("UPDATE player_shots_odds SET snapshot_ts = date WHERE snapshot_ts IS NULL")
+        drop_duplicate_rows(cursor, 'player_shots_odds', ['event_id', 'bookmaker', 'player_name', 'over_under', 'points', 'snapshot_ts'])
+    create_snapshot_index(cursor)
+
+# Migration 2: prop indexes on the odds table, and one row per prop in every model table and one row per
+# date in every ledger, enforced by unique indexes
+def add_prop_indexes(cursor):
+    if table_exists(cursor, 'player_shots_odds'):
+        create_odds_indexes(cursor)
+    for table_name in tables_like(cursor, 'modelled_likelihoods'):
+        drop_duplicate_rows(cursor, table_name, ['date', 'player_name', 'over_under', 'points'])
+        create_model_indexes(cursor, table_name)
+    for table_name in tables_like(cursor, 'daily_ledger'):
+        drop_duplicate_rows(cursor, table_name, ['date'])
+        create_ledger_indexes(cursor, table_name)
+
+# Migration 3: the best_lines summary of every prop, built from the odds already stored
+def add_best_lines(cursor):
+    create_best_lines_table(cursor)
+    if table_exists(cursor, 'player_shots_odds'):
+        print(f"Built {rebuild_best_lines(cursor)} best lines")
+
+# Migration 4: the original player_game_shots was written on every history rebuild but never read
+def drop_player_game_shots(cursor):
+    cursor.execute("DROP TABLE IF EXISTS player_game_shots")
+
+# Migration 5: player_game_shots as the per-game store shot histories are read from, filled from the game
+# logs already cached
+def add_player_game_shots(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'game_log_cache'")
+    if cursor.fetchone():
+        create_player_game_shots_table(cursor)
+
+# Migration 6: opposition factors move from the wide opposing_team_factors table (one column per team) to
+# the long team_opposition_factors table
+def add_long_opposition_factors(cursor):
+    backfill_long_table(cursor)
+
+# Applied in order; PRAGMA user_version records the last one applied
+MIGRATIONS = [
+    (1, add_snapshot_ts),
+    (2, add_prop_indexes),
+    (3, add_best_lines),
+    (4, drop_player_game_shots),
+    (5, add_player_game_shots),
+    (6, add_long_opposition_factors),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Bring an existing database up to SCHEMA_VERSION, one transaction per migration. Cheap (one PRAGMA read)
+# once the database is current, so every create_* function runs it first.
+def migrate(conn=None):
+    conn = conn or get_connection()
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    for migration_version, migration in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with transaction(conn):
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {migration_version}")
+        print(f"Applied schema migration {migration_version} ({migration.__name__})")
+    return max(version, SCHEMA_VERSION)
 
 def create_ledger(table_name):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
+    migrate(conn)
     cursor = conn.cursor()
     cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS {table_name} (
@@ -14,12 +130,13 @@ def create_ledger(table_name):
         final_dollar_value REAL
     )
     ''')
+    create_ledger_indexes(cursor, table_name)
     conn.commit()
-    conn.close()
     print(f"Created table {table_name}")
 
 def create_player_models(table_name = 'modelled_likelihoods'):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
+    migrate(conn)
     cursor = conn.cursor()
     cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS {table_name} (
@@ -36,12 +153,13 @@ def create_player_models(table_name = 'modelled_likelihoods'):
         poisson_kelly REAL
     )
     ''')
+    create_model_indexes(cursor, table_name)
     conn.commit()
-    conn.close()
     print(f"Created table {table_name}")
 
 def create_player_shots_odds():
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
+    migrate(conn)
     cursor = conn.cursor()
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS player_shots_odds (
@@ -54,12 +172,13 @@ def create_player_shots_odds():
         over_under TEXT,
         price REAL,
         points REAL,
-        date TEXT
+        date TEXT,
+        snapshot_ts TEXT
     )
     ''')
+    create_odds_indexes(cursor)
+    create_best_lines_table(cursor)
     conn.commit()
-    conn.close()
-
 
 
 if __name__ == "__main__":
@@ -71,3 +190,13 @@ if __name__ == "__main__":
 
     # Create player shots odds table if it doesn't exist
     create_player_shots_odds()
+
+    # Create the cached NHL game-log responses table if it doesn't exist
+    conn = get_connection()
+    create_game_log_cache_table(conn)
+
+    # Create the daily roster index and player alias tables if they don't exist
+    create_roster_tables(conn)
+
+    # Create the long opposition factors table (rows from the old wide table are copied by migration 6)
+    create_long_table(conn)
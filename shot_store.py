@@ -0,0 +1,139 @@
+import numpy as np
+from bisect import bisect_left
+from config import CURRENT_SEASON, PAST_SEASONS
+from game_log_cache import refresh_game_logs, load_game_shots, season_for_date
+import metrics
+
+# Columnar per-player shot history. Each player's games are kept sorted by date with running shot and
+# shot-count-histogram sums, so "last 10 games before D", season means and empirical over/under
+# frequencies are a binary search plus a subtraction rather than a rescan of the raw game-log JSON.
+# Histories are built from the persisted player_game_shots store (filled by game_log_cache whenever a log is
+# stored), one per player per process (get_shot_history), and shared by live modelling, the sweep and
+# replays, so each season log is downloaded and parsed once, when it's stored.
+
+SEASONS = [CURRENT_SEASON] + PAST_SEASONS
+MAX_SHOTS = 16
+
+# The seasons a model on date weights, in weighting order: the date's own season, then the ones before it
+def seasons_for_date(date, count=len(SEASONS)):
+    start = int(season_for_date(date)[:4])
+    return [f"{year}{year + 1}" for year in range(start, start - count, -1)]
+
+class PlayerShotHistory:
+    __slots__ = ('player_id', 'dates', 'seasons', 'teams', 'opponents', 'shots', 'cum_shots', 'cum_hist',
+                 'season_start', 'season_end')
+
+    def __init__(self, player_id, games):
+        # games: iterable of (game_date, season, shots, team, opponent)
+        games = sorted(games)
+        self.player_id = player_id
+        self.dates = [game[0] for game in games]
+        self.seasons = [game[1] for game in games]
+        self.teams = [game[3] for game in games]
+        self.opponents = [game[4] for game in games]
+        self.shots = np.array([game[2] for game in games], dtype=np.int64)
+        # cum_shots[i] / cum_hist[i] cover games [0, i)
+        self.cum_shots = np.concatenate(([0], np.cumsum(self.shots)))
+        one_hot = np.zeros((len(games), MAX_SHOTS), dtype=np.int64)
+        one_hot[np.arange(len(games)), np.minimum(self.shots, MAX_SHOTS - 1)] = 1
+        self.cum_hist = np.vstack((np.zeros((1, MAX_SHOTS), dtype=np.int64), np.cumsum(one_hot, axis=0)))
+        # Index range of each season's games (games are date-sorted, so seasons are contiguous)
+        self.season_start = {}
+        self.season_end = {}
+        for i, season in enumerate(self.seasons):
+            self.season_start.setdefault(season, i)
+            self.season_end[season] = i + 1
+
+    def __len__(self):
+        return len(self.dates)
+
+    # Number of games strictly before date (ISO string); also the index of the first game on/after it
+    def index_before(self, date):
+        return bisect_left(self.dates, date)
+
+    # Index range [start, end) of a season's games before date
+    def season_range(self, season, before):
+        end = self.index_before(before)
+        if season not in self.season_start:
+            return end, end
+        start = self.season_start[season]
+        return start, max(start, min(end, self.season_end[season]))
+
+    def last_n(self, n, before):
+        end = self.index_before(before)
+        return self.shots[max(0, end - n):end]
+
+    # Shots in each game before date, from one season or (season None) all of them
+    def shots_before(self, before, season=None):
+        if season is None:
+            return self.shots[:self.index_before(before)]
+        start, end = self.season_range(season, before)
+        return self.shots[start:end]
+
+    # Shots in the game on date, or None if the player didn't play that day
+    def shots_on(self, date):
+        i = self.index_before(date)
+        if i < len(self.dates) and self.dates[i] == date:
+            return int(self.shots[i])
+        return None
+
+    # (games, shots) for a season before date
+    def season_totals(self, season, before):
+        start, end = self.season_range(season, before)
+        return end - start, int(self.cum_shots[end] - self.cum_shots[start])
+
+    # (games, shots) over one season or every season, before date (default: all games)
+    def totals(self, season=None, before=None):
+        if season is not None:
+            return self.season_totals(season, before or '9999-12-31')
+        end = len(self.dates) if before is None else self.index_before(before)
+        return end, int(self.cum_shots[end])
+
+    def season_mean(self, season, before):
+        games, shots = self.season_totals(season, before)
+        return shots / games if games else float('nan')
+
+    # Shot-count histogram of games [start, end)
+    def histogram(self, start, end):
+        return self.cum_hist[end] - self.cum_hist[start]
+
+    # Fraction of a season's (or all, if season is None) games before date with shots over / under threshold
+    def frequency(self, threshold, before, over=True, season=None):
+        if season is None:
+            start, end = 0, self.index_before(before)
+        else:
+            start, end = self.season_range(season, before)
+        if end == start:
+            return float('nan')
+        hist = self.histogram(start, end)
+        values = np.arange(MAX_SHOTS)
+        mask = values > threshold if over else values < threshold
+        return hist[mask].sum() / (end - start)
+
+    # (1 + seasons, MAX_SHOTS) histograms of the last 10 games and each season before date,
+    # in the period order of the model weightings (x_10, x_2024, x_2023, x_2022)
+    def period_histograms(self, before, seasons=SEASONS):
+        end = self.index_before(before)
+        rows = [self.histogram(max(0, end - 10), end)]
+        for season in seasons:
+            rows.append(self.histogram(*self.season_range(season, before)))
+        return np.array(rows, dtype=float)
+
+# Histories built in this process: (player_id, seasons) -> (history, versions of the stored logs used)
+_histories = {}
+
+# Return a player's history over the given seasons (by default the configured ones), read from the
+# player_game_shots store once its logs are fresh for through_date, and rebuilt only when they've changed
+def get_shot_history(player_id, through_date=None, seasons=SEASONS):
+    seasons = tuple(seasons)
+    versions = refresh_game_logs(player_id, seasons, through_date=through_date)
+    signature = tuple(versions[season] for season in seasons)
+    key = (player_id, seasons)
+    if key in _histories and _histories[key][1] == signature:
+        metrics.cache('shot_history', True)
+        return _histories[key][0]
+    metrics.cache('shot_history', False)
+
+    history = PlayerShotHistory(player_id, load_game_shots(player_id, seasons))
+    _histories[key] = (history, signature)
+    return history
@@ -1,14 +1,18 @@
+import os
 from datetime import datetime
-import sqlite3
-import requests
+import http_cache
 import numpy as np
-from config import DATABASE
+from bisect import bisect_left
+from database import get_connection
 import csv
 
+# Get the directory of the current script
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
 # Function to get team stats from NHL API
 def get_team_stats():
     team_shots_url = "https://api.nhle.com/stats/rest/en/team/summary?sort=shotsForPerGame&cayenneExp=seasonId=20242025%20and%20gameTypeId=2"
-    response = requests.get(team_shots_url)
+    response = http_cache.get(team_shots_url)
     team_stats = {}
     data = response.json().get('data', [])
     for team in data:
@@ -24,6 +28,15 @@ def get_opposition_factor_frtable(opposing_team, team_stats):
     factor = team_stats[opposing_team]['shotsAgainstPerGame'] / average_shots_against
     return factor
 
+# Spellings that differ between sources (the-odds-api, NHL API, older rows) mapped to one stored name
+TEAM_NAME_ALIASES = {
+    'St Louis Blues': 'St. Louis Blues',
+}
+
+def canonical_team_name(team_name):
+    return TEAM_NAME_ALIASES.get(team_name, team_name)
+
+# Legacy wide table (one column per team name), kept only as the source for backfilling the long table
 def create_table(conn, team_names):
     cursor = conn.cursor()
     sorted_team_names = sorted(team_names)
@@ -36,23 +49,78 @@ def create_table(conn, team_names):
     ''')
     conn.commit()
 
+# One row per (date, team); new or renamed teams need no schema change
+def create_long_table_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS team_opposition_factors (
+            date TEXT,
+            team_id INTEGER,
+            team_name TEXT,
+            shots_against_per_game REAL,
+            factor REAL,
+            PRIMARY KEY (date, team_name)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_team_opposition_factors_team_date ON team_opposition_factors (team_name, date)")
+
+def create_long_table(conn):
+    create_long_table_schema(conn.cursor())
+    conn.commit()
+
+# Copy every row of the legacy wide table into the long table (existing long rows win). Run once, as a
+# schema migration, inside its transaction.
+def backfill_long_table(cursor):
+    create_long_table_schema(cursor)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'opposing_team_factors'")
+    if not cursor.fetchone():
+        return 0
+    cursor.execute("SELECT * FROM opposing_team_factors")
+    headers = [description[0] for description in cursor.description]
+    rows = [(row[0], canonical_team_name(team), factor) for row in cursor.fetchall()
+            for team, factor in zip(headers[1:], row[1:]) if factor is not None]
+    cursor.executemany('''
+        INSERT OR IGNORE INTO team_opposition_factors (date, team_name, factor)
+        VALUES (?, ?, ?)
+    ''', rows)
+    backfilled = max(cursor.rowcount, 0)
+    if backfilled:
+        print(f"Backfilled {backfilled} opposition factor rows from opposing_team_factors.")
+    return backfilled
+
 def insert_factors(conn, team_stats):
     cursor = conn.cursor()
     today_date = datetime.today().strftime('%Y-%m-%d')
-    sorted_team_names = sorted(team_stats.keys())
-    factors = {team: get_opposition_factor_frtable(team, team_stats) for team in sorted_team_names}
-    columns = ', '.join([f'"{team}"' for team in sorted_team_names])
-    placeholders = ', '.join(['?' for _ in sorted_team_names])
-    values = [today_date] + [factors[team] for team in sorted_team_names]
-    cursor.execute(f'''
-        INSERT OR REPLACE INTO opposing_team_factors (date, {columns})
-        VALUES (?, {placeholders})
-    ''', values)
+    rows = [(today_date, stats['teamId'], canonical_team_name(team), stats['shotsAgainstPerGame'], get_opposition_factor_frtable(team, team_stats))
+            for team, stats in sorted(team_stats.items())]
+    cursor.executemany('''
+        INSERT OR REPLACE INTO team_opposition_factors (date, team_id, team_name, shots_against_per_game, factor)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
     conn.commit()
 
+# Stored factors for many dates at once: {date: {team_name: factor}}, one indexed query per 500 dates
+def query_factors(conn, dates, teams=None):
+    cursor = conn.cursor()
+    dates = sorted(set(dates))
+    factors = {date: {} for date in dates}
+    team_filter = ''
+    team_params = []
+    if teams is not None:
+        team_params = sorted({canonical_team_name(team) for team in teams})
+        team_filter = f" AND team_name IN ({', '.join('?' for _ in team_params)})"
+    for i in range(0, len(dates), 500):
+        chunk = dates[i:i + 500]
+        cursor.execute(f'''
+            SELECT date, team_name, factor FROM team_opposition_factors
+            WHERE date IN ({', '.join('?' for _ in chunk)}){team_filter}
+        ''', chunk + team_params)
+        for date, team_name, factor in cursor.fetchall():
+            factors[date][team_name] = factor
+    return factors
+
 def print_table(conn):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM opposing_team_factors")
+    cursor.execute("SELECT date, team_id, team_name, shots_against_per_game, factor FROM team_opposition_factors ORDER BY date, team_name")
     rows = cursor.fetchall()
     headers = [description[0] for description in cursor.description]
     print(headers)
@@ -61,65 +129,104 @@ def print_table(conn):
         print(formatted_row)
 
 def delete_factors_table():
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DROP TABLE IF EXISTS opposing_team_factors")
+    cursor.execute("DROP TABLE IF EXISTS team_opposition_factors")
     conn.commit()
-    conn.close()
 
 def daily_factor_update():
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     team_stats = get_team_stats()
-    team_names = list(team_stats.keys())
-    create_table(conn, team_names)
+    create_long_table(conn)
     insert_factors(conn, team_stats)
-    conn.close()
+    reset_factor_service()
+
+# In-memory opposition factors: the stored daily factors (loaded per date on first use) plus the team shots-against game logs, loaded
+# once per process. Each team's (and the league's) SA/GP values are kept sorted by date with running sums,
+# so a factor for any date is a binary search and a subtraction instead of two full CSV scans.
+class OppositionFactorService:
+    def __init__(self, gamelogs_csv=None):
+        self.gamelogs_csv = gamelogs_csv or os.path.join(script_dir, 'team_shots_gamelogs.csv')
+        self.table_factors = {}
+        self.team_dates, self.team_cum_sa = {}, {}
+        self.league_dates, self.league_cum_sa = [], np.zeros(1)
+        self.load_gamelogs()
+
+    # Stored daily factors for the given dates, loaded once per date with a single query
+    def load_table_factors(self, dates):
+        dates = [date for date in set(dates) if date not in self.table_factors]
+        if not dates:
+            return
+        conn = get_connection()
+        create_long_table(conn)
+        for date, factors in query_factors(conn, dates).items():
+            self.table_factors[date] = factors
+
+    def load_gamelogs(self):
+        if not os.path.exists(self.gamelogs_csv):
+            print(f"{self.gamelogs_csv} not found; historical opposition factors default to 1.")
+            return
+        team_games = {}
+        league_games = []
+        with open(self.gamelogs_csv, mode='r') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                game = (row['Game Date'], float(row['SA/GP']))
+                team_games.setdefault(row['Team'], []).append(game)
+                league_games.append(game)
+        for team, games in team_games.items():
+            games.sort()
+            self.team_dates[team] = [game[0] for game in games]
+            self.team_cum_sa[team] = np.concatenate(([0], np.cumsum([game[1] for game in games])))
+        league_games.sort()
+        self.league_dates = [game[0] for game in league_games]
+        self.league_cum_sa = np.concatenate(([0], np.cumsum([game[1] for game in league_games])))
+
+    # Factor for one opposing team on a date: the stored daily factor if that date has one, otherwise the
+    # team's SA/GP before the date relative to the league's, ramped in over the team's first 10 games
+    def factor(self, date, opposing_team, opposition_adjust):
+        self.load_table_factors([date])
+        factors = self.table_factors[date]
+        if factors:
+            if canonical_team_name(opposing_team) not in factors:
+                print(f"Opposing team {opposing_team} not found in the database.")
+                return 1
+            return factors[canonical_team_name(opposing_team)]
+
+        team_gp = bisect_left(self.team_dates.get(opposing_team, []), date)
+        if team_gp == 0:
+            return 1
+        team_sa_gp = self.team_cum_sa[opposing_team][team_gp] / team_gp
+        ramp = 1
+        if team_gp < 10:
+            ramp = team_gp / 10
+        league_gp = bisect_left(self.league_dates, date)
+        league_avg_sa_gp = self.league_cum_sa[league_gp] / league_gp
+        return 1 + ((team_sa_gp / league_avg_sa_gp) - 1) * ramp * opposition_adjust
+
+    # Factors for a whole slate of (date, opposing_team) pairs
+    def factors(self, slate, opposition_adjust):
+        self.load_table_factors(date for date, _ in slate)
+        return [self.factor(date, opposing_team, opposition_adjust) for date, opposing_team in slate]
+
+_service = None
+
+def get_factor_service():
+    global _service
+    if _service is None:
+        _service = OppositionFactorService()
+    return _service
+
+# Drop the loaded factors, e.g. after today's row has been written
+def reset_factor_service():
+    global _service
+    _service = None
 
 def get_opposition_factor(date, opposing_team, opposition_adjust):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM opposing_team_factors WHERE date = ?", (date,))
-    row = cursor.fetchone()
-    if row:
-        headers = [description[0] for description in cursor.description]
-        if opposing_team == 'St Louis Blues':
-            opposing_team = 'St. Louis Blues'
-        elif opposing_team not in headers:
-            print(f"Opposing team {opposing_team} not found in the database.")
-            factor = 1
-            return factor
-        factor = row[headers.index(opposing_team)]
-        conn.close()
-        return factor
-
-
-    with open('team_shots_gamelogs.csv', mode='r') as file:
-        reader = csv.DictReader(file)
-        headers = reader.fieldnames
-        team_games = [row for row in reader if row['Team'] == opposing_team and row['Game Date'] < date]
-
-    if not team_games:
-        conn.close()
-        factor = 1
-        return factor
-
-    team_sa_gp = np.mean([float(game['SA/GP']) for game in team_games])
-    team_gp = len(team_games)
-    ramp = 1
-    if team_gp < 10:
-        ramp = team_gp / 10    
-    all_sa_gp = []
-
-    with open('team_shots_gamelogs.csv', mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row['Game Date'] < date:
-                all_sa_gp.append(float(row['SA/GP']))
-
-    league_avg_sa_gp = np.mean(all_sa_gp)
-    factor = 1 + ((team_sa_gp / league_avg_sa_gp) - 1) * ramp * opposition_adjust
-    conn.close()
-    return factor
+    return get_factor_service().factor(date, opposing_team, opposition_adjust)
+
+def get_opposition_factors(slate, opposition_adjust):
+    return get_factor_service().factors(slate, opposition_adjust)
 
 # Main function
 def main():
@@ -0,0 +1,48 @@
+import pytest
+import backtest
+from setup_database import create_ledger, create_player_models, create_player_shots_odds
+from settlement import create_results_tables
+
+DATES = ['2025-01-02', '2025-01-03', '2025-01-04']
+
+# One Over 2.5 bet a day on one player, who took 4 shots every day; results are final for the first two days
+@pytest.fixture
+def history(db, monkeypatch):
+    monkeypatch.setattr(backtest, 'pull_results', lambda dates: [])
+    create_player_shots_odds()
+    create_player_models('modelled_likelihoods')
+    create_ledger('daily_ledger_scaled')
+    create_results_tables(db)
+    for date in DATES:
+        db.execute('''
+        INSERT INTO modelled_likelihoods (player_name, date, over_under, points, implied_likelihood, poisson_kelly)
+        VALUES ('A Player', ?, 'Over', 2.5, 0.5, 0.05)
+        ''', (date,))
+        db.execute("INSERT INTO prop_player_ids (date, player_name, player_id) VALUES (?, 'A Player', 1)", (date,))
+        db.execute("INSERT INTO player_game_results (date, player_id, shots) VALUES (?, 1, 4)", (date,))
+    db.executemany("INSERT INTO results_pulled (date, game_count) VALUES (?, 1)", [(date,) for date in DATES[:2]])
+    db.execute('''
+    INSERT INTO daily_ledger_scaled (date, number_of_bets_suggested, dollar_value_of_bets_suggested, initial_dollar_value, final_dollar_value)
+    VALUES ('2025-01-01', 0, 0, 100, 150)
+    ''')
+    db.commit()
+    return db
+
+def test_partial_range_carries_on_from_previous_bankroll(history):
+    rows = backtest.run_backtest([('modelled_likelihoods', 'scale')], '2025-01-02', '2025-01-04', workers=1)['daily_ledger_scaled']
+    # Stops before the date whose results aren't final
+    assert [row[0] for row in rows] == DATES[:2]
+    assert rows[0][3] == 150
+    assert rows[0][4] == pytest.approx(150 * 1.05)
+    assert rows[1][3] == rows[0][4]
+    stored = history.execute('SELECT date, initial_dollar_value FROM daily_ledger_scaled ORDER BY date').fetchall()
+    assert [row[0] for row in stored] == ['2025-01-01'] + DATES[:2]
+
+def test_range_ending_before_ledger_end_is_refused(history):
+    history.execute('''
+    INSERT INTO daily_ledger_scaled (date, number_of_bets_suggested, dollar_value_of_bets_suggested, initial_dollar_value, final_dollar_value)
+    VALUES ('2025-01-09', 0, 0, 150, 150)
+    ''')
+    history.commit()
+    with pytest.raises(ValueError):
+        backtest.run_backtest([('modelled_likelihoods', 'scale')], '2025-01-02', '2025-01-04', workers=1)
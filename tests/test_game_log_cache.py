@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+import game_log_cache
+from game_log_cache import season_finished, is_fresh, get_game_log
+
+def test_season_finished_by_date():
+    assert season_finished('20232024', '2024-07-01')
+    assert not season_finished('20242025', '2025-04-10')
+    # Seasons after the configured one are judged by date too
+    assert not season_finished('20262027', '2026-10-18')
+    assert season_finished('20252026', '2026-10-18')
+
+def test_unfinished_season_refreshes_past_its_fetch_date():
+    assert not is_fresh('20262027', '2026-10-17', through_date='2026-10-17')
+    assert is_fresh('20262027', '2026-10-18', through_date='2026-10-17')
+    assert is_fresh('20252026', '2026-08-01', through_date='2026-10-17')
+
+# A log of the season under way (whatever config says) fetched yesterday is downloaded again today
+def test_current_season_log_is_refetched(db, monkeypatch):
+    today = date.today()
+    season = game_log_cache.season_for_date(today.isoformat())
+    downloads = []
+    def download(player_id, season, game_type=2):
+        downloads.append(season)
+        return {'gameLog': [{'gameDate': today.isoformat(), 'shots': len(downloads)}]}
+    monkeypatch.setattr(game_log_cache, 'download_game_log', download)
+    monkeypatch.setattr(game_log_cache, '_memory_cache', {})
+    get_game_log(8478402, season)
+    db.execute("UPDATE game_log_cache SET fetched_date = ?", ((today - timedelta(days=1)).isoformat(),))
+    db.commit()
+    game_log_cache._memory_cache.clear()
+    assert get_game_log(8478402, season, through_date=today.isoformat())['gameLog'][0]['shots'] == 2
+    assert downloads == [season, season]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from scipy.stats import norm, poisson # type: ignore
+from likelihoods import (score_rows, compare_with_scalar, verify_kernel, POISSON_MAX_ERROR, NORMAL_MAX_ERROR,
+                         POISSON_ERROR_BOUND, NORMAL_ERROR_BOUND)
+
+# Scalar reference for player_api.calculate_likelihoods (whose modelling isn't public): normal and Poisson
+# models on the opposition-scaled weighted mean, and the empirical over/under frequencies. No (weighted)
+# games, no probability.
+def scalar_likelihoods(shots, weighted_shots, over_under, threshold, opposition_factor=1):
+    over = over_under == 'Over'
+    frequency = lambda values: np.mean([v > threshold if over else v < threshold for v in values]) if len(values) else np.nan
+    if len(weighted_shots) == 0:
+        return np.nan, np.nan, frequency(shots), np.nan
+    mean = np.mean(weighted_shots) * opposition_factor
+    std = np.std(weighted_shots) * opposition_factor
+    if std > 0:
+        normal = norm.sf(threshold, mean, std) if over else norm.cdf(threshold, mean, std)
+    else:
+        normal = float(mean > threshold) if over else float(mean < threshold)
+    poisson_likelihood = poisson.sf(np.floor(threshold), mean) if over else poisson.cdf(np.ceil(threshold) - 1, mean)
+    return normal, poisson_likelihood, frequency(shots), frequency(weighted_shots)
+
+# Weighted shots repeat each game by its period weight, as the weightings do
+ROWS = [
+    ([2, 3, 1, 4, 0, 2], [2, 2, 3, 3, 1, 4, 0, 2], 'Over', 2.5, 1.0),
+    ([2, 3, 1, 4, 0, 2], [2, 2, 3, 3, 1, 4, 0, 2], 'Under', 2.5, 1.1),
+    ([5, 6, 4, 7], [5, 5, 6, 4, 7, 7, 7], 'Over', 4.5, 0.9),
+    ([1, 0, 0, 2, 1], [1, 0, 0, 2, 1, 1], 'Under', 0.5, 1.0),
+    ([3, 3, 3], [3, 3, 3, 3], 'Over', 2.5, 1.0),
+    ([3, 3, 3], [3, 3, 3, 3], 'Under', 3.5, 1.2),
+    ([], [], 'Over', 2.5, 1.0),
+    ([2, 4], [], 'Under', 1.5, 1.0),
+    ([0, 0, 1], [0, 0, 0, 1], 'Over', 1.5, 0.8),
+]
+
+def test_batch_matches_scalar_row_by_row():
+    expected = np.array([scalar_likelihoods(*row) for row in ROWS], dtype=float)
+    exact = np.column_stack(score_rows(ROWS, exact=True)[:4])
+    np.testing.assert_allclose(exact, expected, rtol=0, atol=1e-12, equal_nan=True)
+    kernel = np.column_stack(score_rows(ROWS)[:4])
+    np.testing.assert_allclose(kernel[:, 0], expected[:, 0], rtol=0, atol=NORMAL_MAX_ERROR, equal_nan=True)
+    np.testing.assert_allclose(kernel[:, 1], expected[:, 1], rtol=0, atol=POISSON_MAX_ERROR, equal_nan=True)
+    np.testing.assert_allclose(kernel[:, 2:], expected[:, 2:], rtol=0, atol=1e-12, equal_nan=True)
+    assert np.all(compare_with_scalar(ROWS, scalar_likelihoods) <= 1e-12)
+
+def test_empty_history_has_no_probability():
+    normal, poisson_likelihood, raw, weighted, kelly = score_rows([([], [], 'Over', 2.5, 1.0, 0.5)])
+    assert np.isnan(normal[0]) and np.isnan(poisson_likelihood[0]) and np.isnan(weighted[0]) and np.isnan(kelly[0])
+
+def test_compare_with_scalar_flags_one_sided_nan():
+    assert np.isinf(compare_with_scalar(ROWS[:1], lambda *row: (np.nan, 0.5, 0.5, 0.5))[0])
+
+# The kernel stays inside its analytic interpolation bound (with room for rounding), and so well inside
+# the documented tolerances, whatever the sample
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+def test_kernel_within_error_bounds(seed):
+    poisson_error, normal_error = verify_kernel(samples=100000, seed=seed)
+    assert poisson_error <= POISSON_ERROR_BOUND * (1 + 1e-6) < POISSON_MAX_ERROR / 2
+    assert normal_error <= NORMAL_ERROR_BOUND * (1 + 1e-6) < NORMAL_MAX_ERROR / 2
@@ -0,0 +1,54 @@
+from datetime import datetime
+import odds_api_main
+from odds_api_main import ingest_odds
+
+EVENTS = [{'id': 'e1', 'home_team': 'Edmonton Oilers', 'away_team': 'Calgary Flames', 'commence_time': '2030-10-19T01:00:00Z'}]
+
+def event_odds(books):
+    return {'id': 'e1', 'bookmakers': [{'title': book, 'markets': [{'key': 'player_shots_on_goal', 'outcomes': [
+        {'name': 'Over', 'description': 'Connor McDavid', 'price': over, 'point': 3.5},
+        {'name': 'Under', 'description': 'Connor McDavid', 'price': under, 'point': 3.5},
+    ]}]} for book, (over, under) in books.items()]}
+
+# Serve EVENTS and the given books' odds, with the clock at day (YYYY-MM-DD) noon
+def fake_api(monkeypatch, day, books):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromisoformat(f"{day}T12:00:00").replace(tzinfo=tz)
+    monkeypatch.setattr(odds_api_main, 'datetime', FrozenDatetime)
+    monkeypatch.setattr(odds_api_main, 'get_events', lambda print_to_console='y': (EVENTS, {}))
+    monkeypatch.setattr(odds_api_main, 'get_event_odds', lambda event_id, print_to_console='y': (event_odds(books), {}))
+
+def best_lines(db, day):
+    return db.execute("SELECT over_under, best_price, bookmaker, n_books FROM best_lines WHERE date = ? ORDER BY over_under, best_price", (day,)).fetchall()
+
+# Events fetched more than a day ahead are fetched again on game day with unchanged prices; that day still
+# gets a full snapshot and best lines of its own
+def test_unchanged_props_are_stored_for_each_new_date(db, monkeypatch):
+    books = {'DraftKings': (1.9, 1.9), 'FanDuel': (1.85, 1.95)}
+    fake_api(monkeypatch, '2030-10-17', books)
+    assert ingest_odds(print_to_console='n') == 4
+    fake_api(monkeypatch, '2030-10-18', books)
+    assert ingest_odds(print_to_console='n') == 4
+    for day in ('2030-10-17', '2030-10-18'):
+        assert db.execute("SELECT COUNT(*) FROM player_shots_odds WHERE date = ?", (day,)).fetchone()[0] == 4
+        assert best_lines(db, day) == [('Over', 1.9, 'DraftKings', 2), ('Under', 1.95, 'FanDuel', 2)]
+
+# A book that pulls its line stops being the best price; a line every book pulls leaves best_lines
+def test_pulled_lines_leave_best_lines(db, monkeypatch):
+    fake_api(monkeypatch, '2030-10-18', {'DraftKings': (1.9, 1.9), 'FanDuel': (1.85, 1.95)})
+    ingest_odds(print_to_console='n')
+    fake_api(monkeypatch, '2030-10-18', {'FanDuel': (1.85, 1.95)})
+    assert ingest_odds(refresh=True, snapshot_ts='2030-10-18T13:00:00Z', print_to_console='n') == 2
+    assert best_lines(db, '2030-10-18') == [('Over', 1.85, 'FanDuel', 1), ('Under', 1.95, 'FanDuel', 1)]
+    fake_api(monkeypatch, '2030-10-18', {})
+    assert ingest_odds(refresh=True, snapshot_ts='2030-10-18T14:00:00Z', print_to_console='n') == 2
+    assert best_lines(db, '2030-10-18') == []
+
+def test_failed_events_request_returns_none(db, monkeypatch):
+    fake_api(monkeypatch, '2030-10-18', {})
+    monkeypatch.setattr(odds_api_main, 'get_events', lambda print_to_console='y': (None, {}))
+    assert ingest_odds(print_to_console='n') is None
+    monkeypatch.setattr(odds_api_main, 'get_events', lambda print_to_console='y': ([], {}))
+    assert ingest_odds(print_to_console='n') == 0
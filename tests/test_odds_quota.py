@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+import pytest
+from odds_quota import QuotaScheduler, create_usage_table
+
+# 2026-10-18: 14 days left in the month, counting today
+NOW = datetime(2026, 10, 18, 15, 0, tzinfo=timezone.utc)
+
+def add_usage(conn, ts, endpoint, remaining, cost, event_id=None):
+    create_usage_table(conn)
+    conn.execute('''
+    INSERT INTO odds_api_usage (ts, endpoint, event_id, requests_used, requests_remaining, last_cost)
+    VALUES (?, ?, ?, NULL, ?, ?)
+    ''', (ts, endpoint, event_id, remaining, cost))
+    conn.commit()
+
+def events(n):
+    return [{'id': f"e{i}", 'commence_time': f"2026-10-18T{17 + i // 2:02d}:{30 * (i % 2):02d}:00Z"} for i in range(n)]
+
+# Three planned runs on one day each get a third of the day's allowance, whichever run is asking
+def test_multi_run_day_splits_daily_allowance(db):
+    add_usage(db, '2026-10-18T12:00:00Z', 'events', 198, 0)
+    first = QuotaScheduler(runs_per_day=3, now=NOW)
+    assert first.daily_allowance() == pytest.approx(198 / 14)
+    assert first.run_allowance() == pytest.approx(198 / 14 / 3)
+
+    # The first run spends its share, the second run's events call is recorded, then the second run plans
+    for i in range(4):
+        add_usage(db, '2026-10-18T12:00:01Z', 'event_odds', 194 - i + 3, 1, f"e{i}")
+    add_usage(db, '2026-10-18T15:00:00Z', 'events', 194, 0)
+    second = QuotaScheduler(runs_per_day=3, now=NOW)
+    assert second.runs_today == 2
+    assert second.run_allowance() == pytest.approx(((194 + 4) / 14 - 4) / 2)
+    assert second.run_allowance() > 0
+
+def test_daily_run_capped_at_run_allowance(db):
+    add_usage(db, '2026-10-18T12:00:00Z', 'events', 140, 0)
+    scheduler = QuotaScheduler(runs_per_day=2, now=NOW)
+    chosen = scheduler.plan(events(16), refresh=False)
+    # 140 credits over 14 days, half of today's 10 for this run
+    assert len(chosen) == 5
+    assert [event['id'] for event in chosen] == ['e0', 'e1', 'e2', 'e3', 'e4']
+
+def test_unknown_quota_fetches_everything(db):
+    assert len(QuotaScheduler(now=NOW).plan(events(6))) == 6
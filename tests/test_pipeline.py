@@ -0,0 +1,44 @@
+import time
+from pipeline import Stage, run_pipeline
+
+# Stages that record when they run; returns (stages, {name: (start, end)})
+def timed_stages(locks):
+    spans = {}
+    def work(name):
+        def run(results):
+            start = time.perf_counter()
+            time.sleep(0.1)
+            spans[name] = (start, time.perf_counter())
+        return run
+    stages = [Stage('slate', work('slate'))] + [Stage(name, work(name), deps=['slate'], lock=lock) for name, lock in locks]
+    return stages, spans
+
+def overlaps(a, b):
+    return a[0] < b[1] and b[0] < a[1]
+
+def test_stages_sharing_a_lock_run_one_at_a_time(db):
+    stages, spans = timed_stages([('model', 'caches'), ('sweep', 'caches'), ('export', None)])
+    results, status = run_pipeline(stages, force=True)
+    assert all(status[name] == 'ran' for name in spans)
+    assert not overlaps(spans['model'], spans['sweep'])
+    assert overlaps(spans['export'], spans['model']) or overlaps(spans['export'], spans['sweep'])
+
+def test_stages_without_a_lock_run_in_parallel(db):
+    stages, spans = timed_stages([('model', None), ('sweep', None)])
+    run_pipeline(stages, force=True)
+    assert overlaps(spans['model'], spans['sweep'])
+
+# A failed odds fetch isn't recorded as today's run, so the next run fetches again
+def test_failed_odds_fetch_is_retried(db, monkeypatch):
+    import odds_api_main
+    from pipeline import run_odds, today
+    written = [None, 3]
+    monkeypatch.setattr(odds_api_main, 'ingest_odds', lambda: written.pop(0))
+    stages = lambda: [Stage('odds', run_odds, inputs=today), Stage('settle', lambda results: 'settled', deps=['odds'])]
+    assert run_pipeline(stages())[1] == {'odds': 'failed', 'settle': 'blocked'}
+    assert run_pipeline(stages())[1] == {'odds': 'ran', 'settle': 'ran'}
+    assert run_pipeline(stages())[1]['odds'] == 'skipped'
+
+def test_settle_waits_only_for_odds():
+    from pipeline import daily_stages
+    assert {stage.name: stage.deps for stage in daily_stages()}['settle'] == ('odds',)
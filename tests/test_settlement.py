@@ -0,0 +1,62 @@
+import settlement
+from roster_index import RosterIndex
+from settlement import create_results_tables, resolve_props_by_date
+
+TEAMS = {'edmonton oilers': 'EDM', 'calgary flames': 'CGY', 'toronto maple leafs': 'TOR'}
+
+# Today's rosters: Player One has since been traded to Toronto, Player Two is still an Oiler
+def roster_index():
+    return RosterIndex(TEAMS, {'player one': [(1, 'TOR')], 'player two': [(2, 'EDM')]}, {})
+
+def add_results(conn, date, rows):
+    create_results_tables(conn)
+    conn.executemany('INSERT INTO player_game_results (date, player_id, short_name, team, game_id, shots) VALUES (?, ?, ?, ?, 1, 2)',
+                     [(date, *row) for row in rows])
+    conn.execute('INSERT INTO results_pulled (date, game_count, pulled_date) VALUES (?, 1, ?)', (date, date))
+    conn.commit()
+
+# A past prop resolves to whoever played for either team that day, not to today's rosters
+def test_replayed_props_resolve_by_game_date(db, monkeypatch):
+    monkeypatch.setattr(settlement, 'get_roster_index', roster_index)
+    add_results(db, '2024-10-12', [(1, 'P. One', 'EDM'), (3, 'P. Three', 'CGY')])
+    props = [('2024-10-12', 'Player One', 'Edmonton Oilers', 'Calgary Flames'),
+             ('2024-10-12', 'Player Two', 'Edmonton Oilers', 'Calgary Flames'),
+             ('2024-10-12', 'Player Three', 'Edmonton Oilers', 'Calgary Flames'),
+             ('2024-10-12', 'Player Four', 'Edmonton Oilers', 'Calgary Flames')]
+    assert resolve_props_by_date(props) == {
+        props[0]: (1, 'Edmonton Oilers', 'Calgary Flames'),
+        props[1]: (2, 'Edmonton Oilers', 'Calgary Flames'),
+        props[2]: (3, 'Calgary Flames', 'Edmonton Oilers'),
+        props[3]: None,
+    }
+
+class FakeEngine:
+    def __init__(self, responses):
+        self.responses = responses
+        self.requested = []
+
+    def fetch_many(self, urls):
+        urls = list(urls)
+        self.requested.extend(urls)
+        return {url: self.responses.get(url) for url in urls}
+
+# A postponed game doesn't hold up its date: the date is pulled and the postponed game's props are void
+def test_postponed_game_settles_its_date(db):
+    base = settlement.BASE_URL
+    boxscore = {'id': 1, 'gameState': 'OFF', 'homeTeam': {'abbrev': 'EDM'}, 'awayTeam': {'abbrev': 'CGY'},
+                'playerByGameStats': {'homeTeam': {'forwards': [{'playerId': 1, 'name': {'default': 'P. One'}, 'sog': 4}]}}}
+    engine = FakeEngine({
+        f"{base}/score/2024-10-12": {'games': [{'id': 1, 'gameState': 'OFF', 'gameScheduleState': 'OK'},
+                                               {'id': 2, 'gameState': 'FUT', 'gameScheduleState': 'PPD'}]},
+        f"{base}/gamecenter/1/boxscore": boxscore,
+    })
+    assert settlement.pull_results(['2024-10-12'], engine) == ['2024-10-12']
+    assert f"{base}/gamecenter/2/boxscore" not in engine.requested
+
+    db.execute('CREATE TABLE model (id INTEGER PRIMARY KEY, date TEXT, player_name TEXT, implied_likelihood REAL, points REAL, over_under TEXT, poisson_kelly REAL)')
+    db.executemany('INSERT INTO model (date, player_name, implied_likelihood, points, over_under, poisson_kelly) VALUES (?, ?, 0.5, 2.5, ?, 0.05)',
+                   [('2024-10-12', 'Player One', 'Over'), ('2024-10-12', 'Player Five', 'Over')])
+    db.executemany('INSERT INTO prop_player_ids (date, player_name, player_id) VALUES (?, ?, ?)',
+                   [('2024-10-12', 'Player One', 1), ('2024-10-12', 'Player Five', 5)])
+    bets = settlement.load_settled_bets(db.cursor(), 'model', ['2024-10-12'])
+    assert [bet[-1] for bet in bets['2024-10-12']] == [4, -1]
@@ -0,0 +1,70 @@
+from model_sweep import build_rows
+from shot_store import PlayerShotHistory, season_for_date, seasons_for_date
+
+GAMES = [
+    ('2023-10-12', '20232024', 2, 'EDM', 'VAN'),
+    ('2023-10-14', '20232024', 5, 'EDM', 'CGY'),
+    ('2024-10-09', '20242025', 0, 'EDM', 'WPG'),
+    ('2024-10-11', '20242025', 3, 'EDM', 'CGY'),
+    ('2024-10-13', '20242025', 4, 'EDM', 'PHI'),
+]
+
+def test_accessors():
+    history = PlayerShotHistory(8478402, reversed(GAMES))
+    assert history.shots_before('2024-10-13').tolist() == [2, 5, 0, 3]
+    assert history.shots_before('2024-10-13', '20242025').tolist() == [0, 3]
+    assert history.shots_before('2024-10-13', '20222023').tolist() == []
+    assert history.shots_on('2024-10-11') == 3
+    assert history.shots_on('2024-10-10') is None
+    assert history.shots_on('2025-01-01') is None
+    assert history.last_n(3, '2024-10-12').tolist() == [5, 0, 3]
+    assert history.totals() == (5, 14)
+    assert history.totals(before='2024-10-11') == (3, 7)
+    assert history.totals('20232024') == (2, 7)
+    assert history.totals('20242025', '2024-10-13') == (2, 3)
+
+def test_seasons_for_date():
+    assert season_for_date('2024-04-18') == '20232024'
+    assert season_for_date('2024-10-09') == '20242025'
+    assert seasons_for_date('2023-11-02', 3) == ['20232024', '20222023', '20212022']
+
+# A replayed prop weights its own season, whatever seasons are configured
+def test_build_rows_uses_each_prop_season():
+    history = PlayerShotHistory(8478402, GAMES)
+    props = [('2023-10-20', 'Connor McDavid', 'Over', 2.5, 'EDM', 'CGY', 1.9),
+             ('2024-10-20', 'Connor McDavid', 'Over', 2.5, 'EDM', 'CGY', 1.9)]
+    resolved = {(prop[0], 'Connor McDavid', 'EDM', 'CGY'): (8478402, 'EDM', 'CGY') for prop in props}
+    rows, hists, slate = build_rows(props, resolved, {8478402: history}, lambda date: seasons_for_date(date, 2))
+    assert len(rows) == 2 and slate == [('2023-10-20', 'CGY'), ('2024-10-20', 'CGY')]
+    # periods: last 10 games, the prop's season, the season before
+    assert hists[0, :, :6].tolist() == [[0, 0, 1, 0, 0, 1], [0, 0, 1, 0, 0, 1], [0] * 6]
+    assert hists[1, :, :6].tolist() == [[1, 0, 1, 1, 1, 1], [1, 0, 0, 1, 1, 0], [0, 0, 1, 0, 0, 1]]
+
+def game_log(season):
+    return {'gameLog': [{'gameDate': game[0], 'shots': game[2], 'teamAbbrev': game[3], 'opponentAbbrev': game[4]}
+                        for game in GAMES if game[1] == season][::-1]}
+
+# Histories come from the player_game_shots rows written when the logs were stored, with no download
+def test_history_reads_the_persisted_store(db, monkeypatch):
+    import game_log_cache
+    import shot_store
+    monkeypatch.setattr(game_log_cache, 'download_game_log', lambda *key: None)
+    monkeypatch.setattr(shot_store, '_histories', {})
+    game_log_cache.store_game_logs({(8478402, season, 2): game_log(season) for season in ('20232024', '20242025')})
+    history = shot_store.get_shot_history(8478402, '2024-10-13', seasons=['20242025', '20232024'])
+    assert history.dates == [game[0] for game in GAMES]
+    assert history.totals() == (5, 14)
+    assert shot_store.get_shot_history(8478402, '2024-10-13', seasons=['20242025', '20232024']) is history
+    # A newly stored log replaces its season's games and the history is rebuilt
+    game_log_cache.store_game_logs({(8478402, '20242025', 2): {'gameLog': [{'gameDate': '2024-10-09', 'shots': 7}]}})
+    assert shot_store.get_shot_history(8478402, '2024-10-13', seasons=['20242025', '20232024']).totals() == (3, 14)
+
+# Logs cached before the store existed are copied into it when it's created
+def test_store_is_filled_from_cached_logs(db):
+    import json
+    import game_log_cache
+    db.execute('CREATE TABLE game_log_cache (player_id INTEGER, season TEXT, game_type INTEGER, payload TEXT, last_game_date TEXT, '
+               'fetched_date TEXT, complete INTEGER, PRIMARY KEY (player_id, season, game_type))')
+    db.execute("INSERT INTO game_log_cache VALUES (8478402, '20232024', 2, ?, '2023-10-14', '2024-08-01', 1)", (json.dumps(game_log('20232024')),))
+    game_log_cache.create_game_log_cache_table(db)
+    assert game_log_cache.load_game_shots(8478402, ['20232024']) == [('2023-10-12', '20232024', 2, 'EDM', 'VAN'), ('2023-10-14', '20232024', 5, 'EDM', 'CGY')]
@@ -0,0 +1,22 @@
+import team_avg_SA
+from team_avg_SA import create_table, query_factors
+from setup_database import migrate
+
+# The legacy wide table is copied into the long table once, by the schema migration
+def test_wide_factors_migrated_once(db):
+    create_table(db, ['Boston Bruins', 'St Louis Blues'])
+    db.execute('INSERT INTO opposing_team_factors VALUES (?, ?, ?)', ('2024-01-02', 1.1, 0.9))
+    db.commit()
+    migrate(db)
+    assert query_factors(db, ['2024-01-02']) == {'2024-01-02': {'Boston Bruins': 1.1, 'St. Louis Blues': 0.9}}
+    assert db.execute('PRAGMA user_version').fetchone()[0] == 6
+
+# The daily update only writes today's factors; it never reads the wide table
+def test_daily_update_skips_wide_table(db, monkeypatch):
+    create_table(db, ['Boston Bruins'])
+    db.execute('INSERT INTO opposing_team_factors VALUES (?, ?)', ('2024-01-02', 1.1))
+    db.commit()
+    monkeypatch.setattr(team_avg_SA, 'get_team_stats', lambda: {'Boston Bruins': {'teamId': 6, 'shotsAgainstPerGame': 30.0}})
+    monkeypatch.setattr(team_avg_SA, 'get_opposition_factor_frtable', lambda team, team_stats: 1.0)
+    team_avg_SA.daily_factor_update()
+    assert query_factors(db, ['2024-01-02']) == {'2024-01-02': {}}
@@ -1,188 +1,125 @@
-import os
-import sqlite3
-import sys
-print(f"Python interpreter: {sys.executable}")
-import requests # type: ignore
 import datetime
-from tenacity import retry, stop_after_attempt, wait_exponential
-from player_api import get_player_id
-from config import DATABASE
+from database import get_connection, transaction
+from export import print_rows
 
 
 # Constants
 INITIAL_BANKROLL = 100
-BASE_URL = "https://api-web.nhle.com/v1"
-SEASON = "20242025"
 
-# Get the directory of the current script
-script_dir = os.path.dirname(os.path.abspath(__file__))
+# Size and settle one day's bets against a starting bankroll. bets are (player_name, implied_likelihood,
+# points, over_under, poisson_kelly, actual_shots) in model-table order; actual_shots is None if the
+# player couldn't be identified (bet skipped) and -1 if they didn't play (bet void).
+# Returns (number_of_bets, dollar_value_of_bets, final_bankroll).
+def settle_day(date, bets, bankroll_bestbook_0, truncate_bets=0, verbose=True):
+    trunc = 0
+    daily_earnings_bb = 0
+    num_bets_bb = 0
+    wager_sum_bb = 0
+    scaling_factor = 1
+    two_percent_min = 0
+    # Checking sum of all suggested bets to see if total suggested volume is greater than bankroll
+    # if so, option A is only use bets > 2% of bankroll, if that's not significant enough, option B is to scale all bets down
+    if sum(bet[4] for bet in bets) > 1:
+        if verbose:
+            print(f"WARNING: Sum of suggested bets for date {date} is greater than bankroll.")
+        if sum(bet[4] for bet in bets if bet[4] > 0.02) < 1:
+            if verbose:
+                print(f"WARNING: Only using {date} suggested bets > 2% of bankroll to reduce bet volume below 100%.")
+            two_percent_min = 1
+        elif truncate_bets == 1:
+            trunc = 1
+            if verbose:
+                print(f"WARNING: Truncating all suggested bets for date {date} to reduce bet volume below 100%.")
+        else:
+            scaling_factor = 1 / sum(bet[4] for bet in bets)
+            if verbose:
+                print(f"WARNING: Scaling all suggested bets for date {date} by {scaling_factor:.2f} to reduce bet volume below 100%.")
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=15))
-def teams_from_date_and_player(date, player_name, cursor):
-    # find the teams from the date and player_name in the player_shots_odds table
-    cursor.execute("SELECT DISTINCT home_team, away_team FROM player_shots_odds WHERE date = ? AND player_name = ?", (date, player_name))
-    result = cursor.fetchone()
-    if result:
-        return result[0], result[1]
-    else:
-        return None, None
-
-# Function to get the actual shots from the NHL API
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=15))
-def get_actual_shots(player_id, date):
-    season_url = f"{BASE_URL}/player/{player_id}/game-log/{SEASON}/2"
-    response = requests.get(season_url)
-    if response.status_code == 200:
-        try:
-            data = response.json()
-            if data and 'gameLog' in data:
-                for game in data['gameLog']:
-                    game_date = datetime.datetime.strptime(game['gameDate'], '%Y-%m-%d').date()
-                    if game_date == datetime.datetime.strptime(date, '%Y-%m-%d').date():
-                        return game['shots']
-                print(f"No game found for player {player_id} on date {date}")
-                return -1
+    if trunc == 1:
+        bets = sorted(bets, key=lambda x: x[4], reverse=True)
+
+    min_pc_bet = 0.02 if two_percent_min == 1 else 0.01
+    for player_name, implied_likelihood, points, over_under, poisson_kelly, actual_shots in bets:
+        if poisson_kelly*scaling_factor > min_pc_bet:
+            if actual_shots is None:
+                if verbose:
+                    print(f"Skipping player {player_name} as player_id is None.")
+                continue
+
+            # Calculate bet amount
+            bet_amount = bankroll_bestbook_0 * poisson_kelly * scaling_factor
+
+            # Update the number of bets and total wagered
+            num_bets_bb += 1
+            if wager_sum_bb + bet_amount > bankroll_bestbook_0:
+                if verbose:
+                    print(f"Threshold reached at Poisson Kelly: {poisson_kelly}, Number of bets: {num_bets_bb} for date: {date}")
+                break
+            wager_sum_bb += bet_amount
+
+            # Determine win or loss based on actual shots and over_under; a player who didn't play voids the bet
+            if actual_shots == -1:
+                continue
+            if (over_under == 'Over' and actual_shots > points) or (over_under == 'Under' and actual_shots < points):
+                price = 1 / implied_likelihood
+                daily_earnings_bb += (price - 1) * bet_amount
             else:
-                print("No valid game log data available.")
-                return 0
-        except requests.exceptions.JSONDecodeError:
-            print(f"Error decoding JSON from {season_url}")
-            return []
-    else:
-        print(f"Request to {season_url} failed with status code {response.status_code}")
-        return []
-
-
-# Function to update the ledger
-def update_ledger(ledger_name='daily_ledger_scaled', model_table='modelled_likelihoods', truncate_bets=0):   
-    today = datetime.date.today()
-    yesterday = today - datetime.timedelta(days=1)
+                daily_earnings_bb -= bet_amount
 
-    # Get the directory of the current script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return num_bets_bb, wager_sum_bb, bankroll_bestbook_0 + daily_earnings_bb
+
+# Function to update the ledger from the per-date results table
+def update_ledger(ledger_name='daily_ledger_scaled', model_table='modelled_likelihoods', truncate_bets=0):
+    # Settlement pulls in the HTTP stack, so it's imported here rather than for every print_ledger
+    from settlement import pull_results, resolve_prop_players, dates_to_settle, load_settled_bets
+    today = datetime.date.today()
+    yesterday = (today - datetime.timedelta(days=1)).isoformat()
 
     # open the database
-    conn = sqlite3.connect(os.path.join(script_dir, DATABASE))
+    conn = get_connection()
     cursor = conn.cursor()
 
-    # Get the days that have not been updated
-    cursor.execute(f"SELECT DISTINCT date FROM {model_table} WHERE date <= ? AND date NOT IN (SELECT DISTINCT date FROM {ledger_name})", (yesterday,))
-    dates_to_update = cursor.fetchall()
-
+    # Get the days that have not been updated, and make sure their results are pulled and players resolved
+    dates_to_update = dates_to_settle(cursor, ledger_name, model_table, yesterday)
+    if not dates_to_update:
+        return
+    pull_results(dates_to_update)
+    resolve_prop_players(model_table, dates_to_update)
+
+    # Only settle dates whose games are all final, and stop at the first gap so the bankroll stays in order
+    cursor.execute(f"SELECT date FROM results_pulled WHERE date IN ({', '.join('?' for _ in dates_to_update)})", dates_to_update)
+    pulled = {row[0] for row in cursor.fetchall()}
+    settleable = []
     for date in dates_to_update:
-        date = date[0]
-        trunc = 0
-        # Initialize bankroll
-        # Get the most recent bankroll from the ledger table
-        cursor.execute(f"SELECT final_dollar_value FROM {ledger_name} ORDER BY date DESC LIMIT 1")
-        result = cursor.fetchone()
-        if result:
-            bankroll_bestbook_0 = result[0]
-        else:
-            bankroll_bestbook_0 = INITIAL_BANKROLL
-
-        cursor.execute(f'''
-            SELECT player_name, date, implied_likelihood, points, over_under, poisson_kelly
-            FROM {model_table}
-            WHERE date = ? AND poisson_kelly > 0.01
-        ''', (date,))
-        best_bets = cursor.fetchall()
-
-        # process the earnings/losses for the best bets only
-        daily_earnings_bb = 0
-        num_bets_bb = 0
-        wager_sum_bb = 0
-        scaling_factor = 1
-        two_percent_min = 0
-        # Calculate the sum of poisson_kelly for all entries in best_bets
-        # Checking sum of all suggested bets to see if total suggested volume is greater than bankroll
-        # if so, option A is only use bets > 2% of bankroll, if that's not significant enough, option B is to scale all bets down
-        if sum(bet[5] for bet in best_bets) > 1:
-            print(f"WARNING: Sum of suggested bets for date {date} is greater than bankroll.")
-            if sum(bet[5] for bet in best_bets if bet[5] > 0.02) < 1:
-                print(f"WARNING: Only using {date} suggested bets > 2% of bankroll to reduce bet volume below 100%.")
-                two_percent_min = 1
-            elif truncate_bets == 1:
-                trunc = 1
-                print(f"WARNING: Truncating all suggested bets for date {date} to reduce bet volume below 100%.")
-            else:
-                scaling_factor = 1 / sum(bet[5] for bet in best_bets)
-                print(f"WARNING: Scaling all suggested bets for date {date} by {scaling_factor:.2f} to reduce bet volume below 100%.")
-        
-        if trunc == 1:
-            best_bets = sorted(best_bets, key=lambda x: x[5], reverse=True)
-            #print("Sorted Poisson Kelly values (descending):")
-            #for bet in best_bets:
-            #    print(bet[5])
-
-        for bet in best_bets:
-            player_name, date, implied_likelihood, points, over_under, poisson_kelly = bet
-
-            if two_percent_min == 1:
-                min_pc_bet = 0.02
-            else:
-                min_pc_bet = 0.01
-            if poisson_kelly*scaling_factor > min_pc_bet:
-                # Get actual shots
-                teams = teams_from_date_and_player(date, player_name, cursor)
-                player_info = get_player_id(teams[0], teams[1], player_name)
-                if player_info is None or len(player_info) == 0:
-                    print(f"Skipping player {player_name} as player_id is None.")
-                    continue
-                player_id = player_info[0]
-                actual_shots = get_actual_shots(player_id, date)
-
-                # Calculate bet amount
-                bet_amount = bankroll_bestbook_0 * poisson_kelly * scaling_factor
-                
-                # Update the number of bets and total wagered
-                num_bets_bb += 1
-                if wager_sum_bb + bet_amount > bankroll_bestbook_0:
-                    print(f"Threshold reached at Poisson Kelly: {poisson_kelly}, Number of bets: {num_bets_bb} for date: {date}")
-                    break
-                wager_sum_bb += bet_amount
-
-                # Determine win or loss based on actual shots and over_under
-                if (over_under == 'Over' and actual_shots > points) or (over_under == 'Under' and actual_shots < points):
-                    price = 1 / implied_likelihood
-                    return_amount = (price - 1) * bet_amount
-                    daily_earnings_bb += return_amount
-                elif actual_shots != -1:
-                    daily_earnings_bb -= bet_amount
-                #print(f"Player: {player_name}, Date: {date}, Actual Shots: {actual_shots}, o/u: {over_under} {points}, Bet Amount: {bet_amount:.2f}")
-        
-        bankroll_bestbook_f = bankroll_bestbook_0 + daily_earnings_bb
-
-        # Update the daily_ledger_best_book table
-        cursor.execute(f'''
+        if date not in pulled:
+            print(f"Results for {date} are not final yet, settling up to the day before.")
+            break
+        settleable.append(date)
+
+    # Get the most recent bankroll from the ledger table
+    cursor.execute(f"SELECT final_dollar_value FROM {ledger_name} ORDER BY date DESC LIMIT 1")
+    result = cursor.fetchone()
+    bankroll = result[0] if result else INITIAL_BANKROLL
+
+    bets = load_settled_bets(cursor, model_table, settleable)
+    ledger_rows = []
+    for date in settleable:
+        num_bets, wager_sum, final_bankroll = settle_day(date, bets[date], bankroll, truncate_bets)
+        ledger_rows.append((date, num_bets, wager_sum, bankroll, final_bankroll))
+        bankroll = final_bankroll
+
+    # Update the ledger table for every settled date in one transaction
+    with transaction(conn):
+        cursor.executemany(f'''
         INSERT INTO {ledger_name} (date, number_of_bets_suggested, dollar_value_of_bets_suggested, initial_dollar_value, final_dollar_value)
         VALUES (?, ?, ?, ?, ?)
-        ''', (date, num_bets_bb, wager_sum_bb, bankroll_bestbook_0, bankroll_bestbook_f))
-        conn.commit()
+        ''', ledger_rows)
 
-    # Close the connection
-    conn.close()
-
-def print_ledger(ledger):
-    conn = sqlite3.connect(os.path.join(script_dir, DATABASE))
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT * FROM {ledger}")
+def print_ledger(ledger, start_date=None, end_date=None):
     print(f"Updated Ledger ({ledger}):")
-    rows = cursor.fetchall()
-    for row in rows:
-        formatted_row = [f"{x:.2f}" if isinstance(x, float) else x for x in row]
-        print(formatted_row)
-    conn.close()
+    print_rows(ledger, start_date, end_date)
 
 if __name__ == "__main__":
     update_ledger()
-    # print both ledgers:
-    conn = sqlite3.connect(os.path.join(script_dir, DATABASE))
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM daily_ledger_scaled")
-    print("Scaled Ledger:")
-    rows = cursor.fetchall()
-    for row in rows:
-        formatted_row = [f"{x:.2f}" if isinstance(x, float) else x for x in row]
-        print(formatted_row)
-    conn.close()
\ No newline at end of file
+    # print the scaled ledger:
+    print_ledger("daily_ledger_scaled")